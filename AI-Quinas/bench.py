@@ -0,0 +1,434 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import re
+import tempfile
+import time
+from html import escape
+
+from corpus import split_units
+from extract import extract_page
+from fetch import FetchEngine
+from frames import FrameReader, frames_path_for
+from offsets import KIND_CODES, KINDS, SummaReader
+from parts import PARTS, SPECIAL_ARTICLE_COUNTS, get_default_end_question, get_part_url_format, part_from_title
+from scrape import BASE_URL, INQUIRY_ITEM, render_article, render_question, scrape_summa
+from standin import PAGE_PATH, StandinServer, synthetic_page
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Saved aquinas.cc pages, one directory per part, named after their page path (e.g. ~ST.I-II.Q1.A2.html)
+FIXTURES_DIR = os.path.join(HERE, "fixtures")
+
+# Where a part's fixture pages came from, kept in a SOURCE file next to them: downloaded from the site,
+# rebuilt from a text file, or stand-in pages for a part with neither (not the site's markup)
+FIXTURE_SOURCES = ("recorded", "rebuilt", "synthetic")
+SOURCE_FILE = "SOURCE"
+
+# Text files the lookup benchmarks run against
+DEFAULT_TEXT_FILES = [os.path.join(HERE, name) for name in ("Summa1.txt", "Summa2.txt", "Summa4.txt")]
+
+# Version of the JSON results layout
+RESULTS_VERSION = 2
+
+
+def fixture_questions(part):
+    """
+    Returns the questions kept as fixtures for a part
+
+    The first question, and the last one, whose article count is special-cased
+    in SPECIAL_ARTICLE_COUNTS because it can't be read off the page.
+    """
+    return (1, get_default_end_question(part))
+
+def page_path(url_part, q_num=None, article_num=None):
+    """Returns the aquinas.cc page path of a part, question or article page, e.g. ~ST.I.Q1.A2"""
+    path = f"~ST.{url_part}"
+    if q_num is not None:
+        path += f".Q{q_num}"
+    if article_num is not None:
+        path += f".A{article_num}"
+    return path
+
+
+def _vl(text, cls=""):
+    return f'<vl-c class="c2-2{" " + cls if cls else ""}"><span>{escape(text, quote=False)}</span></vl-c>\n'
+
+def _html(body):
+    return "<html><body><div class=\"body\"><div class=\"content\">\n" + "".join(body) + "</div></div></body></html>\n"
+
+def _paragraphs(text):
+    return [p for p in text.strip("\n").split("\n\n") if p]
+
+def render_fixture_pages(text_file, part=None, questions=None):
+    """
+    Rebuilds, from a Summa*.txt file, the aquinas.cc pages the scraper read to write it
+
+    Each page carries the text of one unit of the file in the site's markup, so
+    scraping the pages reproduces the file's blocks. The question pages of
+    special-cased questions get no article links, like the real ones.
+
+    Parameters:
+    - text_file: Text file written by scrape_summa
+    - part: Part of the Summa (default: None, read from the file's title line)
+    - questions: Question numbers to render (default: None, fixture_questions(part))
+
+    Returns (part, {page path: html}).
+    """
+    with open(text_file, encoding="utf-8") as f:
+        text = f.read()
+    part = part or part_from_title(text.split("\n", 1)[0].strip())
+    url_part = get_part_url_format(part)
+    questions = questions or fixture_questions(part)
+
+    pages = {}
+    units = split_units(text)
+    for q_num, article_num, unit in units:
+        header, _, rest = unit.partition("\n")
+        paragraphs = _paragraphs(rest)
+        if q_num == 0:
+            prologue = paragraphs[paragraphs.index("PROLOGUE") + 1:] if "PROLOGUE" in paragraphs else []
+            pages[page_path(url_part)] = _html([_vl(p) for p in prologue])
+        elif q_num not in questions:
+            continue
+        elif article_num == 0:
+            body = [_vl(paragraphs[0], "t-r")] if paragraphs else []
+            for paragraph in paragraphs[1:]:
+                if paragraph == paragraphs[0]:
+                    continue  # Output scraped without dedup repeats the title under it; the page has it once
+                lines = paragraph.split("\n")
+                if INQUIRY_ITEM.match(lines[0]):
+                    body.extend(_vl(line) for line in lines)
+                else:
+                    body.append(_vl(paragraph))
+            if q_num not in SPECIAL_ARTICLE_COUNTS.get(part, {}):
+                count = max(a for q, a, _ in units if q == q_num)
+                body.extend(f'<a href="/la/en/{page_path(url_part, q_num, n)}">Article {n}</a>\n'
+                            for n in range(1, count + 1))
+            pages[page_path(url_part, q_num)] = _html(body)
+        elif not header.startswith("*"):  # Placeholders have no page to rebuild
+            body = [_vl(header, "t-i")]
+            if paragraphs:
+                body.append(_vl(paragraphs[0], "t-s"))
+            body.extend(_vl(p) for p in paragraphs[1:])
+            pages[page_path(url_part, q_num, article_num)] = _html(body)
+    return part, pages
+
+def synthetic_fixture_pages(part, questions=None):
+    """Returns {page path: html} of stand-in pages for a part there is no text file for"""
+    url_part = get_part_url_format(part)
+    pages = {page_path(url_part): synthetic_page(url_part)}
+    for q_num in questions or fixture_questions(part):
+        count = SPECIAL_ARTICLE_COUNTS.get(part, {}).get(q_num, 3)
+        pages[page_path(url_part, q_num)] = synthetic_page(url_part, q_num, articles_per_question=count)
+        for article_num in range(1, count + 1):
+            pages[page_path(url_part, q_num, article_num)] = synthetic_page(url_part, q_num, article_num, count)
+    return pages
+
+def record_fixture_pages(part, questions=None, base_url=BASE_URL, rate=1.0, verbose=False):
+    """
+    Downloads the pages of a part's fixture questions from the site, the way scrape_summa reads them
+
+    Returns {page path: html}; pages the site doesn't return are left out.
+    """
+    url_part = get_part_url_format(part)
+    end_q = get_default_end_question(part)
+    pages = {}
+    with FetchEngine(rate=rate, verbose=verbose) as engine:
+        def fetch(path):
+            response = engine.fetch(base_url + path, max_retries=3, timeout=120)
+            if response.status_code == 200:
+                pages[path] = response.text
+                return response.text
+            return None
+
+        fetch(page_path(url_part))
+        for q_num in questions or fixture_questions(part):
+            html = fetch(page_path(url_part, q_num))
+            if html is None:
+                continue
+            _, num_articles = render_question(html, part, q_num, end_q)
+            for article_num in range(1, num_articles + 1):
+                fetch(page_path(url_part, q_num, article_num))
+    return pages
+
+def save_fixtures(pages, part, fixtures_dir=FIXTURES_DIR, source="rebuilt"):
+    """Writes {page path: html} into the fixture directory of a part, replacing what was there, with their source"""
+    if source not in FIXTURE_SOURCES:
+        raise ValueError(f"Unknown fixture source: {source}")
+    part_dir = os.path.join(fixtures_dir, part)
+    os.makedirs(part_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(part_dir, "*.html")):
+        os.remove(path)
+    for path, html in pages.items():
+        with open(os.path.join(part_dir, path + ".html"), "w", encoding="utf-8", newline="") as f:
+            f.write(html)
+    with open(os.path.join(part_dir, SOURCE_FILE), "w", encoding="utf-8") as f:
+        f.write(source + "\n")
+
+def fixture_source(part, fixtures_dir=FIXTURES_DIR):
+    """Returns where a part's fixture pages came from (see FIXTURE_SOURCES), or None if it wasn't noted"""
+    try:
+        with open(os.path.join(fixtures_dir, part, SOURCE_FILE), encoding="utf-8") as f:
+            source = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return source if source in FIXTURE_SOURCES else None
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR, parts=PARTS):
+    """Returns {part: {page path: html}} for every part that has fixtures"""
+    fixtures = {}
+    for part in parts:
+        pages = {}
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, part, "*.html"))):
+            with open(path, encoding="utf-8", newline="") as f:
+                pages[os.path.basename(path)[:-len(".html")]] = f.read()
+        if pages:
+            fixtures[part] = pages
+    return fixtures
+
+
+class FixtureSource:
+    """
+    Page source for StandinServer that serves saved fixture pages
+
+    Parameters:
+    - fixtures: {part: {page path: html}}, as returned by load_fixtures
+    """
+
+    def __init__(self, fixtures):
+        self.pages = {path: html for pages in fixtures.values() for path, html in pages.items()}
+
+    def __call__(self, url_part, q_num=None, article_num=None):
+        return self.pages.get(page_path(url_part, q_num, article_num))
+
+
+def percentiles(samples):
+    """Returns the p50, p90, p99 and max of some latencies in seconds, in microseconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6, 1)
+    return {"p50_us": at(0.5), "p90_us": at(0.9), "p99_us": at(0.99), "max_us": at(1.0), "count": len(ordered)}
+
+def _timed(calls):
+    """Runs every zero-argument call once, returning their latencies in seconds"""
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_fetch(fixtures, latency=0.02, workers=8):
+    """Fetches every fixture page from the stand-in server; returns pages/sec and bytes/sec"""
+    with StandinServer(latency=latency, page_source=FixtureSource(fixtures)) as server, \
+            FetchEngine(workers=workers) as engine:
+        urls = [server.base_url + path for pages in fixtures.values() for path in pages]
+        start = time.perf_counter()
+        received = sum(len(future.result().content) for future in engine.fetch_ordered(urls))
+        elapsed = time.perf_counter() - start
+    return {"pages": len(urls), "seconds": round(elapsed, 4), "pages_per_sec": round(len(urls) / elapsed, 1),
+            "bytes_per_sec": round(received / elapsed)}
+
+def bench_parse(fixtures, repeat=3, sources=None):
+    """
+    Runs every fixture page through extract_page and the scraper's renderers
+
+    Returns pages/sec, overall and per part; each part carries the source of
+    its pages (see fixture_source), so synthetic ones aren't mistaken for the
+    site's markup when runs are compared.
+    """
+    sources = sources or {}
+    results = {}
+    latencies = []
+    total_pages, total_elapsed = 0, 0.0
+    for part, part_pages in fixtures.items():
+        pages = []
+        for path, html in part_pages.items():
+            match = PAGE_PATH.search(path)
+            q_num, article_num = match.group(2), match.group(3)
+            pages.append((int(q_num) if q_num else None, int(article_num) if article_num else None, html))
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for q_num, article_num, html in pages:
+                page_start = time.perf_counter()
+                if article_num:
+                    render_article(html, article_num)
+                elif q_num:
+                    render_question(html, part, q_num, get_default_end_question(part))
+                else:
+                    extract_page(html)
+                latencies.append(time.perf_counter() - page_start)
+        elapsed = time.perf_counter() - start
+        results[part] = {"pages": len(pages) * repeat, "seconds": round(elapsed, 4),
+                         "pages_per_sec": round(len(pages) * repeat / elapsed, 1), "source": sources.get(part)}
+        total_pages += len(pages) * repeat
+        total_elapsed += elapsed
+    return {"pages": total_pages, "seconds": round(total_elapsed, 4),
+            "pages_per_sec": round(total_pages / total_elapsed, 1), "latency": percentiles(latencies),
+            "synthetic_parts": sorted(part for part in results if sources.get(part) == "synthetic"), "parts": results}
+
+def bench_scrape(fixtures, latency=0.02, workers=8, parse_workers=0, sources=None):
+    """
+    Runs scrape_summa end to end against the stand-in server for every fixture question
+
+    Returns articles/sec (fetching, parsing, writing the text and its derived
+    files), overall and per part, with each part's source as in bench_parse.
+    """
+    sources = sources or {}
+    results = {}
+    total_articles, total_elapsed = 0, 0.0
+    with StandinServer(latency=latency, page_source=FixtureSource(fixtures)) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        for part, pages in fixtures.items():
+            articles, elapsed = 0, 0.0
+            for q_num in sorted({int(m.group(2)) for m in map(PAGE_PATH.search, pages) if m.group(2)}):
+                output_file = os.path.join(tmp, f"{part}.Q{q_num}.txt")
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    scrape_summa(output_file, part, q_num, q_num, workers=workers, base_url=server.base_url,
+                                 resume=False, parse_workers=parse_workers)
+                elapsed += time.perf_counter() - start
+                with open(output_file, encoding="utf-8") as f:
+                    articles += len(re.findall(r"^Article \d+$", f.read(), re.MULTILINE))
+            results[part] = {"articles": articles, "seconds": round(elapsed, 4),
+                             "articles_per_sec": round(articles / elapsed, 1), "source": sources.get(part)}
+            total_articles += articles
+            total_elapsed += elapsed
+    return {"articles": total_articles, "seconds": round(total_elapsed, 4),
+            "articles_per_sec": round(total_articles / total_elapsed, 1),
+            "synthetic_parts": sorted(part for part in results if sources.get(part) == "synthetic"), "parts": results}
+
+def bench_lookups(text_files=None, samples=2000, queries=100, seed=0):
+    """
+    Measures the latency of the lookup paths over the Summa*.txt files
+
+    Random articles and sections are read through the offset sidecar and the
+    compressed frames, and article titles are searched in the BM25 index and
+    TF-IDF matrix when those have been built. Returns percentiles per path.
+    """
+    from retrieval import DEFAULT_INDEX_FILE, BM25Index
+    from similarity import DEFAULT_MATRIX_FILE, TfidfMatrix
+
+    rng = random.Random(seed)
+    readers = [SummaReader(text_file) for text_file in text_files or DEFAULT_TEXT_FILES
+               if os.path.exists(text_file)]
+    frames = [FrameReader(frames_path_for(reader.text_file)) for reader in readers
+              if os.path.exists(frames_path_for(reader.text_file))]
+    results = {}
+    try:
+        articles = [(reader, q, a) for reader in readers
+                    for (q, a, kind, _) in reader.ranges if kind == KIND_CODES["article"]]
+        sections = [(reader, q, a, KINDS[kind], index) for reader in readers
+                    for (q, a, kind, index) in reader.ranges if kind < KIND_CODES["article"]]
+        results["offsets_article"] = percentiles(_timed(
+            lambda r=r, q=q, a=a: r.get(q, a) for r, q, a in rng.choices(articles, k=samples)))
+        results["offsets_section"] = percentiles(_timed(
+            lambda r=r, q=q, a=a, kind=kind, index=index: r.get(q, a, kind, index)
+            for r, q, a, kind, index in rng.choices(sections, k=samples)))
+        if frames:
+            units = [(reader, q, a) for reader in frames for q, a in reader.keys()]
+            results["frames_article"] = percentiles(_timed(
+                lambda r=r, q=q, a=a: r.get(q, a) for r, q, a in rng.choices(units, k=samples)))
+
+        # Article titles make realistic queries
+        titles = [r.get(q, a).split("\n")[1] for r, q, a in rng.choices(articles, k=queries)] if articles else []
+        if titles and os.path.exists(DEFAULT_INDEX_FILE):
+            with BM25Index(DEFAULT_INDEX_FILE) as index:
+                results["bm25_search"] = percentiles(_timed(lambda t=t: index.search(t) for t in titles))
+        if titles and os.path.exists(DEFAULT_MATRIX_FILE):
+            with TfidfMatrix(DEFAULT_MATRIX_FILE) as matrix:
+                results["tfidf_search"] = percentiles(_timed(lambda t=t: matrix.search(t) for t in titles))
+    finally:
+        for reader in readers + frames:
+            reader.close()
+    return results
+
+def run_benchmarks(fixtures_dir=FIXTURES_DIR, latency=0.02, workers=8, repeat=3, text_files=None, skip=()):
+    """
+    Runs the benchmark suite and returns its results as a JSON-ready dict
+
+    Parameters:
+    - fixtures_dir: Directory of saved pages (default: FIXTURES_DIR)
+    - latency: Seconds the stand-in server holds back each response (default: 0.02)
+    - workers: Concurrent requests for the fetch and scrape benchmarks (default: 8)
+    - repeat: Passes over the fixture pages in the parse benchmark (default: 3)
+    - text_files: Text files for the lookup benchmarks (default: DEFAULT_TEXT_FILES)
+    - skip: Names of benchmarks to leave out, from "fetch", "parse", "scrape" and "lookups"
+    """
+    fixtures = load_fixtures(fixtures_dir)
+    sources = {part: fixture_source(part, fixtures_dir) for part in fixtures}
+    if not fixtures and set(skip) < {"fetch", "parse", "scrape"}:
+        raise SystemExit(f"No fixture pages in {fixtures_dir}; run `python bench.py fixtures` first")
+    benchmarks = {
+        "fetch": lambda: bench_fetch(fixtures, latency, workers),
+        "parse": lambda: bench_parse(fixtures, repeat, sources),
+        "scrape": lambda: bench_scrape(fixtures, latency, workers, sources=sources),
+        "lookups": lambda: bench_lookups(text_files)
+    }
+    results = {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"latency": latency, "workers": workers, "repeat": repeat,
+                     "fixture_pages": {part: len(pages) for part, pages in fixtures.items()},
+                     "fixture_sources": sources}
+    }
+    for name, benchmark in benchmarks.items():
+        if name not in skip:
+            results[name] = benchmark()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the scraper and the lookup paths")
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR, help=f"Fixture pages (default: {FIXTURES_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run the benchmarks and print the results as JSON")
+    run.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per response (default: 0.02)")
+    run.add_argument("--workers", type=int, default=8, help="Concurrent requests (default: 8)")
+    run.add_argument("--repeat", type=int, default=3, help="Passes over the pages when parsing (default: 3)")
+    run.add_argument("--skip", nargs="*", default=(), choices=("fetch", "parse", "scrape", "lookups"))
+    run.add_argument("--output", help="Write the JSON results to this file as well")
+    fixtures = commands.add_parser("fixtures", help="Rebuild the fixture pages from Summa*.txt files")
+    fixtures.add_argument("text_files", nargs="*", default=DEFAULT_TEXT_FILES)
+    record = commands.add_parser("record", help="Download the fixture pages from aquinas.cc")
+    record.add_argument("--parts", nargs="+", choices=PARTS, default=PARTS)
+    record.add_argument("--rate", type=float, default=1.0, help="Requests per second (default: 1)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.fixtures_dir, args.latency, args.workers, args.repeat, skip=args.skip)
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        print(output)
+    elif args.command == "fixtures":
+        parts = set()
+        for text_file in args.text_files:
+            part, pages = render_fixture_pages(text_file)
+            save_fixtures(pages, part, args.fixtures_dir, "rebuilt")
+            parts.add(part)
+            print(f"{part}: {len(pages)} pages from {text_file}")
+        for part in PARTS:
+            if part not in parts:
+                pages = synthetic_fixture_pages(part)
+                save_fixtures(pages, part, args.fixtures_dir, "synthetic")
+                print(f"{part}: {len(pages)} stand-in pages (no text file)")
+    else:
+        for part in args.parts:
+            pages = record_fixture_pages(part, rate=args.rate, verbose=True)
+            save_fixtures(pages, part, args.fixtures_dir, "recorded")
+            print(f"{part}: recorded {len(pages)} pages")
@@ -0,0 +1,86 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from extract import BACKENDS, extract_page
+from standin import PAGE_PATH, synthetic_page
+
+
+def load_pages(pages_dir=None, cache_dir=None):
+    """
+    Returns (name, html) for the pages to benchmark
+
+    Pages come from a directory of saved *.html files, from a scraper response
+    cache, or, with neither, from the stand-in server's synthetic pages.
+    """
+    pages = []
+    if pages_dir:
+        for path in sorted(glob.glob(os.path.join(pages_dir, "**", "*.html"), recursive=True)):
+            with open(path, encoding="utf-8") as f:
+                pages.append((os.path.basename(path), f.read()))
+    elif cache_dir:
+        from cache import ResponseCache
+        cache = ResponseCache(cache_dir)
+        for path in sorted(glob.glob(os.path.join(cache_dir, "urls", "*", "*.json"))):
+            with open(path, encoding="utf-8") as f:
+                url = json.load(f)["url"]
+            response = cache.load(url)
+            if response is not None and response.status_code == 200:
+                pages.append((url, response.text))
+    else:
+        for q_num in range(1, 21):
+            pages.append((f"~ST.I.Q{q_num}", synthetic_page("I", q_num)))
+            for article_num in range(1, 4):
+                pages.append((f"~ST.I.Q{q_num}.A{article_num}", synthetic_page("I", q_num, article_num)))
+    return pages
+
+def legacy_parse(name, html):
+    """The BeautifulSoup passes the scraper made per page before extract.py, kept as the baseline"""
+    soup = BeautifulSoup(html, "html.parser")
+    match = PAGE_PATH.search(name.replace(".html", ""))
+    if match and match.group(3):
+        soup.find("vl-c", class_=lambda c: c and "t-s" in c and c.startswith("c2-2"))
+        return [e.text.strip() for e in soup.find_all("vl-c", class_=lambda c: c and c.startswith("c2-2"))]
+    soup.find("vl-c", class_=lambda c: c and "t-r" in c and c.startswith("c2-2"))
+    texts = [e.text.strip() for e in soup.find_all("vl-c", class_=lambda c: c and c.startswith("c2-2"))]
+    article_pattern = re.compile(r"ST\.([A-Za-z-]+)\.Q(\d+)\.A(\d+)")
+    soup.find_all("a", href=lambda href: href and article_pattern.search(href))
+    soup.find_all("vl-c", class_=lambda c: c and "t-i" in c and c.startswith("c2-2"))
+    soup.find_all(string=re.compile(r'Article \d+'))
+    return texts
+
+def run_benchmark(pages, repeat=3):
+    """Times the legacy parse and every installed extract.py backend, returning pages/sec for each"""
+    parsers = {"bs4 multi-pass (before)": legacy_parse}
+    for backend in BACKENDS:
+        parsers[f"extract {backend}"] = lambda name, html, backend=backend: extract_page(html, backend)
+
+    results = {}
+    for label, parse in parsers.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for name, html in pages:
+                parse(name, html)
+        elapsed = time.perf_counter() - start
+        results[label] = len(pages) * repeat / elapsed
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of page extraction, in pages/sec")
+    parser.add_argument("--pages-dir", help="Directory of saved aquinas.cc *.html pages")
+    parser.add_argument("--cache-dir", help="Scraper response cache to read pages from")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the page set (default: 3)")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages_dir, args.cache_dir)
+    print(f"Parsing {len(pages)} pages x {args.repeat}")
+    results = run_benchmark(pages, args.repeat)
+    baseline = results["bs4 multi-pass (before)"]
+    for label, rate in results.items():
+        print(f"{label:<26} {rate:9.1f} pages/sec  ({rate / baseline:.1f}x)")
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+
+# Where scrape_summa keeps its cache when asked to use one without a path
+DEFAULT_CACHE_DIR = ".summa_cache"
+
+
+class CachedResponse:
+    """Stands in for a requests.Response built from a cache entry"""
+
+    def __init__(self, url, status_code, content=b"", headers=None, encoding="utf-8"):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.encoding = encoding
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw HTTP responses
+
+    Bodies are stored zlib-compressed under the SHA-256 of their bytes, so a page
+    that is fetched again unchanged costs no extra space. A small JSON entry per
+    URL records which body it points at along with the fetch metadata (status,
+    ETag, Last-Modified, content type and timestamps) used for revalidation.
+
+    Layout:
+    - <cache_dir>/objects/ab/abcdef....z   compressed bodies
+    - <cache_dir>/urls/12/12345....json    one metadata entry per URL
+
+    Parameters:
+    - cache_dir: Directory holding the cache (created if it doesn't exist)
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+
+    def _entry_path(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "urls", key[:2], key + ".json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest + ".z")
+
+    def _write_atomic(self, path, data):
+        # Write to a temporary file first so a crash never leaves a half-written entry
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, url):
+        """Returns the metadata entry for a URL, or None if it isn't cached"""
+        try:
+            with open(self._entry_path(url), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, url):
+        """Returns the cached response for a URL as a CachedResponse, or None if it isn't cached"""
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        try:
+            with open(self._object_path(entry["object"]), "rb") as f:
+                content = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        headers = {"Content-Type": entry.get("content_type", "")}
+        if entry.get("etag"):
+            headers["ETag"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["Last-Modified"] = entry["last_modified"]
+        return CachedResponse(url, entry["status"], content, headers, entry.get("encoding") or "utf-8")
+
+    def store(self, url, response):
+        """Saves a response body and its metadata, returning the body's content hash"""
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            self._write_atomic(object_path, zlib.compress(content, 6))
+        now = time.time()
+        entry = {
+            "url": url,
+            "object": digest,
+            "status": response.status_code,
+            "size": len(content),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type", ""),
+            "encoding": response.encoding,
+            "fetched_at": now,
+            "validated_at": now
+        }
+        self._write_atomic(self._entry_path(url), json.dumps(entry).encode("utf-8"))
+        return digest
+
+    def mark_validated(self, url):
+        """Records that the server confirmed the cached copy is still current (a 304 reply)"""
+        entry = self.lookup(url)
+        if entry is not None:
+            entry["validated_at"] = time.time()
+            self._write_atomic(self._entry_path(url), json.dumps(entry).encode("utf-8"))
+
+    def conditional_headers(self, url):
+        """Returns the If-None-Match/If-Modified-Since headers to revalidate a cached URL"""
+        entry = self.lookup(url)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
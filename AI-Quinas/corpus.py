@@ -0,0 +1,554 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+
+from journal import ScrapeJournal
+from parts import part_from_title
+
+# Patterns of the Summa*.txt layout written by scrape_summa
+QUESTION_HEADER = re.compile(r'^Question (\d+)$')
+ARTICLE_HEADER = re.compile(r'^Article (\d+)$')
+PLACEHOLDER = re.compile(r'^\*Content could not be retrieved for (Question|Article) (\d+)( due to an error)?\*$')
+OBJECTION = re.compile(r'^(?:Objection|Obj\.) (\d+):')
+REPLY = re.compile(r'^Reply Obj\. (\d+)')
+CONTRARY = re.compile(r'^On the contrary')
+ANSWER = re.compile(r'^I answer that')
+INQUIRY_POINT = re.compile(r'^\((\d+)\) ', re.MULTILINE)
+
+PARAGRAPH_BREAK = re.compile(rb'\n[ \t\r]*\n(?:[ \t\r]*\n)*')
+
+# Start of every unit scrape_summa writes: a question or article header, or a placeholder
+UNIT_START = re.compile(r'^(?:(Question|Article) (\d+)$|\*Content could not be retrieved for )', re.MULTILINE)
+
+# Start of a JSONL corpus line up to the article number; convert_summa keeps Section's field order
+RECORD_KEY = re.compile(r'^\{"part": "[^"]*", "question": (\d+), "question_title": (?:null|"(?:[^"\\]|\\.)*"), '
+                        r'"article": (\d+), ')
+
+# End of a JSONL corpus line: the section's byte range, which moves when text before it changes
+RECORD_RANGE = re.compile(r'"start": (\d+), "end": (\d+)\}\n?$')
+
+# Kinds of section, in the order they appear within an article
+SECTION_KINDS = ("prologue", "introduction", "text", "objection", "contrary", "answer", "reply")
+
+Section = namedtuple("Section", [
+    "part",            # "I", "II-I", "II-II" or "III"
+    "question",        # Question number (0 for the part prologue)
+    "question_title",
+    "article",         # Article number (0 for the prologue and question introductions)
+    "article_title",
+    "kind",            # One of SECTION_KINDS
+    "index",           # Objection/reply number, None for the other kinds
+    "text",            # Paragraphs of the section joined by blank lines
+    "start",           # Byte offset of the section in the text file
+    "end"              # Byte offset just past the section
+], defaults=(None, None))
+
+# Byte range of one question of a Summa*.txt file and a fingerprint of its text (see question_regions)
+Region = namedtuple("Region", ["question", "start", "end", "fingerprint"])
+
+
+def read_paragraphs(path, start=0, end=None):
+    """
+    Returns the blank-line separated paragraphs of a text file, or of a byte range of it
+
+    Each paragraph is a (start, end, text) tuple, where start and end are the
+    byte offsets of the paragraph in the UTF-8 file.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+    paragraphs = []
+    pos = 0
+    for separator in PARAGRAPH_BREAK.finditer(data + b"\n\n"):
+        chunk = data[pos:separator.start()]
+        if chunk.strip():
+            first = pos + len(chunk) - len(chunk.lstrip(b"\n"))
+            last = pos + len(chunk.rstrip(b"\n"))
+            paragraphs.append((start + first, start + last, data[first:last].decode("utf-8")))
+        pos = separator.end()
+    return paragraphs
+
+def read_part(path):
+    """Returns the part a Summa*.txt file holds, read from its title line, or None"""
+    with open(path, encoding="utf-8") as f:
+        return part_from_title(f.readline().strip())
+
+def is_article_title(paragraph, next_paragraph):
+    """
+    Tells an article title apart from body text
+
+    Article pages on aquinas.cc also carry the following articles, which the
+    scraper writes out without an "Article N" header; their only marker is a
+    one-line "Whether ...?" title followed by the first objection.
+    """
+    return (paragraph.startswith("Whether") and "\n" not in paragraph and len(paragraph) < 400
+            and next_paragraph is not None and OBJECTION.match(next_paragraph) is not None)
+
+def _section_kind(paragraph):
+    match = OBJECTION.match(paragraph)
+    if match:
+        return "objection", int(match.group(1))
+    match = REPLY.match(paragraph)
+    if match:
+        return "reply", int(match.group(1))
+    if CONTRARY.match(paragraph):
+        return "contrary", None
+    if ANSWER.match(paragraph):
+        return "answer", None
+    return None, None
+
+
+class _QuestionBuilder:
+    """Collects the sections of one question, keeping a single copy of each article"""
+
+    def __init__(self, part, number, title, start):
+        self.part = part
+        self.number = number
+        self.title = title
+        self.start = start
+        self.end = start
+        self.intro = []
+        self.articles = {}  # article number -> [[headed, title, start, [[kind, index, paragraphs]]], ...] per copy
+
+    def start_article(self, number, title, headed, start):
+        sections = []
+        self.articles.setdefault(number, []).append([headed, title, start, sections])
+        return sections
+
+    def set_title(self, number, title):
+        if number in self.articles:
+            self.articles[number][-1][1] = title
+
+    def _best_copy(self, copies):
+        """
+        Picks the copy of an article to keep
+
+        Pages spill over into the articles after them and are often cut off
+        partway, so the most complete copy wins: one with an answer over one
+        without, then the one with more sections. Between equally complete
+        copies an article's own "Article N" block wins over copies carried on
+        other pages, and otherwise the first one read.
+        """
+        def completeness(copy):
+            headed, _, _, sections = copy
+            return (any(kind == "answer" for kind, _, _ in sections), len(sections), headed)
+        return max(copies, key=completeness)
+
+    def _section(self, article, title, kind, index, paragraphs):
+        return Section(self.part, self.number, self.title, article, title, kind, index,
+                       "\n\n".join(text for _, _, text in paragraphs), paragraphs[0][0], paragraphs[-1][1])
+
+    def article_count(self):
+        """
+        Returns the number of points of inquiry listed in the introduction, or None
+
+        Question pages can carry the next question's list too, so counting stops
+        where the numbering starts over. Questions of a single article have no
+        list; for those the last "Article N" block read stands in for it.
+        """
+        count = 0
+        for _, _, text in self.intro:
+            for n in INQUIRY_POINT.findall(text):
+                if int(n) != count + 1:
+                    return count
+                count += 1
+        if count:
+            return count
+        return max((number for number, copies in self.articles.items() if any(copy[0] for copy in copies)),
+                   default=None)
+
+    def sections(self, outline=None):
+        if outline is not None:
+            outline.append(("question", self.number, 0, self.start, self.end))
+        if self.intro:
+            yield self._section(0, None, "introduction", None, self.intro)
+        count = self.article_count()
+        for number in sorted(self.articles):
+            copies = self.articles[number]
+            if count is not None and number > count and not any(copy[0] for copy in copies):
+                continue  # The first article of the next question, carried on this one's last page
+            _, title, start, sections = self._best_copy(copies)
+            if outline is not None:
+                outline.append(("article", self.number, number, start, sections[-1][2][-1][1] if sections else start))
+            for kind, index, paragraphs in sections:
+                yield self._section(number, title, kind, index, paragraphs)
+
+
+def parse_summa(path, part=None, outline=None, start=0, end=None):
+    """
+    Parses a Summa*.txt file into its sections, in question/article order
+
+    Parameters:
+    - path: Text file written by scrape_summa
+    - part: Part of the Summa (default: None, read from the file's title line)
+    - outline: List to append ("question"|"article", question, article, start, end)
+      byte ranges to, for the whole of every question and article (default: None)
+    - start, end: Byte range to parse, e.g. one question's Region (default: the whole file)
+
+    Yields Section tuples: the part prologue, each question's introduction and
+    then every objection, sed contra, answer and reply of its articles.
+    Placeholders are skipped, and an article that appears more than once
+    (see is_article_title) is only yielded once, from its most complete copy.
+    """
+    paragraphs = read_paragraphs(path, start, end)
+    if part is None:
+        part = read_part(path)
+        if part is None:
+            raise ValueError(f"Can't tell which part {path} holds; pass part explicitly")
+
+    def prologue_section():
+        return Section(part, 0, None, 0, None, "prologue", None,
+                       "\n\n".join(text for _, _, text in prologue), prologue[0][0], prologue[-1][1])
+
+    prologue = []
+    question = None
+    sections = None  # Sections of the article being read
+    article = 0
+    awaiting_title = False
+    in_prologue = False
+    for i in range(2 if start == 0 else 0, len(paragraphs)):  # Skip the title and subtitle
+        paragraph_start, paragraph_end, paragraph = paragraphs[i]
+        next_paragraph = paragraphs[i + 1][2] if i + 1 < len(paragraphs) else None
+        first_line, _, rest = paragraph.partition("\n")
+
+        match = QUESTION_HEADER.match(first_line)
+        placeholder = PLACEHOLDER.match(paragraph)
+        if match:
+            if question is not None:
+                yield from question.sections(outline)
+            elif prologue:
+                yield prologue_section()
+            question = _QuestionBuilder(part, int(match.group(1)), rest.strip() or None, paragraph_start)
+            sections, article, awaiting_title = None, 0, False
+        elif question is not None and not (placeholder and placeholder.group(1) == "Question"):
+            # A question that couldn't be fetched isn't part of the one before it
+            question.end = paragraph_end
+        
+        if match or placeholder:
+            continue
+        if paragraph == "PROLOGUE" and question is None:
+            in_prologue = True
+            continue
+        if question is None:
+            if in_prologue:
+                prologue.append(paragraphs[i])
+            continue
+
+        match = ARTICLE_HEADER.match(first_line)
+        if match:
+            article = int(match.group(1))
+            title = rest.strip() or None
+            sections = question.start_article(article, title, True, paragraph_start)
+            awaiting_title = title is None
+            continue
+        if is_article_title(paragraph, next_paragraph):
+            if awaiting_title:
+                # Title of the article whose header was just read
+                question.set_title(article, paragraph)
+            else:
+                article += 1
+                sections = question.start_article(article, paragraph, False, paragraph_start)
+            awaiting_title = False
+            continue
+        awaiting_title = False
+
+        if article == 0:
+            # Question introduction; the scraper writes the title a second time here
+            if paragraph != question.title:
+                question.intro.append(paragraphs[i])
+            continue
+        if sections is None:
+            continue
+        kind, index = _section_kind(paragraph)
+        if kind is not None:
+            sections.append([kind, index, [paragraphs[i]]])
+        elif sections:
+            sections[-1][2].append(paragraphs[i])  # Continuation of the current section
+        else:
+            sections.append(["text", None, [paragraphs[i]]])
+
+    if question is not None:
+        yield from question.sections(outline)
+    elif prologue:
+        yield prologue_section()
+
+def fingerprint(text):
+    """Returns a short content hash identifying a piece of text"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def group_articles(sections):
+    """
+    Groups sections by (part, question, article), keeping corpus order
+
+    The prologue is grouped under question 0 and each question's introduction
+    under article 0. Returns a dict of key -> (fingerprint, [sections]), where
+    the fingerprint covers the titles and text of all the sections, so it
+    changes whenever anything derived from the article would.
+    """
+    groups = {}
+    for section in sections:
+        groups.setdefault((section.part, section.question, section.article), []).append(section)
+    result = {}
+    for key, members in groups.items():
+        content = "\n".join(f"{s.question_title}|{s.article_title}|{s.kind}|{s.index}|{s.text}" for s in members)
+        result[key] = (fingerprint(content), members)
+    return result
+
+def split_units(text):
+    """
+    Splits a Summa*.txt file's text into the units scrape_summa wrote
+
+    Returns (question, article, text) tuples that join back into the whole
+    text: the part title and prologue as (0, 0), each question header as
+    (N, 0) and each article as (N, M).
+    """
+    units = []
+    question, article, start = 0, 0, 0
+    for match in UNIT_START.finditer(text):
+        kind, number = match.group(1), match.group(2)
+        if kind is None:
+            line_end = text.find("\n", match.start())
+            placeholder = PLACEHOLDER.match(text[match.start():line_end if line_end >= 0 else len(text)])
+            if placeholder is None:
+                continue
+            kind, number = placeholder.group(1), placeholder.group(2)
+        if match.start() > start:
+            units.append((question, article, text[start:match.start()]))
+        if kind == "Question":
+            question, article = int(number), 0
+        else:
+            article = int(number)
+        start = match.start()
+    if start < len(text):
+        units.append((question, article, text[start:]))
+    return units
+
+def question_regions(text_file):
+    """
+    Returns the byte range and fingerprint of every question of a Summa*.txt file, in file order
+
+    A question's fingerprint covers the fingerprints of the units written for
+    it. They come from the scrape journal while it still describes the file:
+    every unit journaled with its hash, the last one ending where the file
+    does, and the journal no older than the file. Otherwise the text is split
+    into units the way the scraper wrote them (see split_units) and each unit
+    is hashed, which gives the same fingerprints without a journal.
+
+    Returns a list of Region tuples; question 0 is the part title and prologue.
+    """
+    journal = ScrapeJournal(ScrapeJournal.path_for(text_file))
+    _, units, _ = journal.read()
+    stat = os.stat(text_file)
+    if (units and all("hash" in unit for unit in units) and units[-1]["end"] == stat.st_size
+            and os.path.getmtime(journal.path) >= stat.st_mtime):
+        hashed = [(unit["q"], unit["end"], unit["hash"]) for unit in units]
+    else:
+        with open(text_file, encoding="utf-8", newline="") as f:
+            text = f.read()
+        hashed, end = [], 0
+        for question, _, unit in split_units(text):
+            end += len(unit.encode("utf-8"))
+            hashed.append((question, end, fingerprint(unit)))
+
+    regions, start = [], 0
+    for question, end, digest in hashed:
+        if regions and regions[-1][0] == question:
+            regions[-1][2] = end
+            regions[-1][3].append(digest)
+        else:
+            regions.append([question, start, end, [digest]])
+        start = end
+    return [Region(question, start, end, fingerprint(" ".join(digests)))
+            for question, start, end, digests in regions]
+
+
+class CorpusDiff:
+    """
+    Works out which articles of some Summa*.txt files changed since something was built from them
+
+    Only the questions whose fingerprint (see question_regions) differs from
+    the one recorded at the last build are re-parsed. The articles of every
+    other question are taken to be the ones recorded, with the same
+    fingerprints, so an update costs in proportion to what changed rather
+    than to the size of the text.
+
+    Parameters:
+    - text_files: Text files written by scrape_summa, e.g. Summa1.txt, Summa2.txt
+    - questions: {absolute text file path: {question number as a string: fingerprint}}
+      recorded at the last build (default: None, nothing was built)
+    - articles: {(part, question, article): fingerprint} recorded at the last build
+      (default: None, nothing was built)
+
+    Attributes:
+    - articles: {(part, question, article): fingerprint} of every article, in corpus order
+    - changed: {(part, question, article): [sections]} of the articles that are new or changed
+    - removed: Keys of the recorded articles that are gone
+    - questions: The fingerprints to record for the next update, in the same form as the parameter
+    """
+
+    def __init__(self, text_files, questions=None, articles=None):
+        recorded = articles or {}
+        self.recorded_questions = questions or {}
+        by_question = {}
+        for key in recorded:
+            by_question.setdefault(key[:2], []).append(key)
+
+        self.articles = {}
+        self.changed = {}
+        self.questions = {}
+        self.regions = {}  # (part, question) -> (text file, Region)
+        self.parsed = {}   # (part, question, article) -> [sections] of every question re-parsed
+        for text_file in text_files:
+            part = read_part(text_file)
+            if part is None:
+                raise ValueError(f"Can't tell which part {text_file} holds")
+            source = os.path.abspath(text_file)
+            fingerprints = self.recorded_questions.get(source, {})
+            self.questions[source] = {}
+            for region in question_regions(text_file):
+                self.questions[source][str(region.question)] = region.fingerprint
+                self.regions[(part, region.question)] = (text_file, region)
+                if fingerprints.get(str(region.question)) == region.fingerprint:
+                    for key in sorted(by_question.get((part, region.question), ()), key=lambda key: key[2]):
+                        self.articles[key] = recorded[key]
+                    continue
+                for key, (digest, members) in self._parse(part, region.question).items():
+                    self.articles[key] = digest
+                    if recorded.get(key) != digest:
+                        self.changed[key] = members
+        self.removed = [key for key in recorded if key not in self.articles]
+
+    def _parse(self, part, question):
+        text_file, region = self.regions[(part, question)]
+        groups = group_articles(parse_summa(text_file, part, start=region.start, end=region.end))
+        self.parsed.update((key, members) for key, (_, members) in groups.items())
+        return groups
+
+    def sections(self, keys):
+        """Returns {key: [sections]} for some articles, parsing only the questions they are in"""
+        for part, question in {key[:2] for key in keys if key not in self.parsed}:
+            self._parse(part, question)
+        return {key: self.parsed[key] for key in keys}
+
+    def unchanged(self):
+        """Tells whether the text files, and every question in them, are the ones recorded at the last build"""
+        return list(self.questions.items()) == list(self.recorded_questions.items())
+
+
+def corpus_path_for(text_file):
+    """Returns the structured corpus path that goes with a Summa*.txt file"""
+    return os.path.splitext(text_file)[0] + ".jsonl"
+
+def convert_summa(text_file, corpus_file=None, part=None, previous=None):
+    """
+    Converts a Summa*.txt file into its structured JSONL corpus
+
+    Parameters:
+    - text_file: Text file written by scrape_summa
+    - corpus_file: Output path (default: the text file's path with a .jsonl extension)
+    - part: Part of the Summa (default: None, read from the file's title line)
+    - previous: Regions (see question_regions) of the text an existing corpus file was
+      written from (default: None, write it from scratch)
+
+    With previous, only the questions whose fingerprint changed are parsed
+    again; the lines of the others are copied from the existing corpus file,
+    with their byte offsets moved to where the question is now.
+
+    Returns the number of sections written.
+    """
+    corpus_file = corpus_file or corpus_path_for(text_file)
+    part = part or read_part(text_file)
+    regions = question_regions(text_file)
+    reused = _reusable_lines(corpus_file, previous, regions) if previous else {}
+    count = 0
+    tmp_path = corpus_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for region in regions:
+            if region.question in reused:
+                lines = reused[region.question]
+            else:
+                lines = [json.dumps(section._asdict(), ensure_ascii=False) + "\n"
+                         for section in parse_summa(text_file, part, start=region.start, end=region.end)]
+            f.writelines(lines)
+            count += len(lines)
+    os.replace(tmp_path, corpus_file)
+    return count
+
+def _reusable_lines(corpus_file, previous, regions):
+    """
+    Returns {question: [lines]} from an existing corpus file for the questions whose fingerprint is unchanged
+
+    Each line's byte range is shifted to where its question now starts. If a
+    line doesn't lie inside its question's previous region the file wasn't
+    written from that text, and nothing is reused.
+    """
+    old = {region.question: region for region in previous}
+    shifts = {region.question: (old[region.question], region.start - old[region.question].start) for region in regions
+              if region.question in old and old[region.question].fingerprint == region.fingerprint}
+    reused = {}
+    try:
+        with open(corpus_file, encoding="utf-8") as f:
+            for line in f:
+                key = RECORD_KEY.match(line)
+                if key is None:
+                    return {}
+                if int(key[1]) not in shifts:
+                    continue
+                question = int(key[1])
+                region, shift = shifts[question]
+                match = RECORD_RANGE.search(line)
+                if match is None or not region.start <= int(match[1]) <= int(match[2]) <= region.end:
+                    return {}
+                reused.setdefault(question, []).append(
+                    f'{line[:match.start()]}"start": {int(match[1]) + shift}, "end": {int(match[2]) + shift}}}\n')
+    except OSError:
+        return {}
+    return reused
+
+def load_sections(corpus_file, question=None, article=None, kinds=None):
+    """
+    Streams the sections of a JSONL corpus, optionally only some of them
+
+    Only the lines of the wanted question and article are decoded: their
+    numbers are read off the start of each line (see RECORD_KEY). A question's
+    sections are written together, so the scan stops once they are behind it.
+
+    Parameters:
+    - corpus_file: File written by convert_summa
+    - question: Only yield sections of this question (default: None, all)
+    - article: Only yield sections of this article (default: None, all)
+    - kinds: Only yield these section kinds, e.g. {"answer"} (default: None, all)
+    """
+    selective = question is not None or article is not None
+    found = False
+    with open(corpus_file, encoding="utf-8") as f:
+        for line in f:
+            key = RECORD_KEY.match(line) if selective else None
+            if key is not None:
+                if question is not None and int(key[1]) != question:
+                    if found:
+                        break
+                    continue
+                found = True
+                if article is not None and int(key[2]) != article:
+                    continue
+            record = Section(**json.loads(line))
+            if question is not None and record.question != question:
+                continue
+            if article is not None and record.article != article:
+                continue
+            if kinds is not None and record.kind not in kinds:
+                continue
+            yield record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Summa*.txt files into structured JSONL corpora")
+    parser.add_argument("text_files", nargs="+", help="Text files written by the scraper, e.g. Summa1.txt")
+    args = parser.parse_args()
+    for text_file in args.text_files:
+        count = convert_summa(text_file)
+        print(f"{text_file}: {count} sections -> {corpus_path_for(text_file)}")
@@ -0,0 +1,387 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from corpus import CorpusDiff
+from parts import PARTS
+from retrieval import article_key, parse_article_key
+
+# Default location of the graph, next to the Summa*.txt files
+DEFAULT_GRAPH_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "summa.xref")
+
+MAGIC = b"XREF"
+VERSION = 2
+PREAMBLE = struct.Struct("<4sHI")  # magic, version, header length
+
+PARENTHETICAL = re.compile(r'\(([^()]*)\)')
+
+# Back-references inside the Summa, one ";"-separated piece at a time, e.g.
+# "I-II, Q. 2, A. 3, ad 1", "QQ. 3, 4", "AA. 1, 2", "Q9, A1" or a bare "4, A. 3" continuing "QQ."
+INTERNAL = re.compile(r'''
+    ^(?:(?:cf\.|vide|here\ and)\s+)?
+    (?:(?P<part>I-II|II-II|III|I|First\ Part|FP|FS|SS|Suppl?\.|Supp\.),\s*)?
+    (?:QQ?\.?\s*(?P<questions>\d+(?:\s*,\s*\d+)*(?![\d:]))|(?P<continued>\d+)(?=,\s*A))?
+    (?:,?\s*(?:AA\.?,?|Art\.|A\.?)\s*(?P<articles>\d+(?:\s*[,–-]\s*\d+)*))?
+    (?P<rest>(?:[,\s]*(?:ad|Obj\.?|seqq\.|sqq\.|A\.?|\d+))*[,\s]*)$
+''', re.IGNORECASE | re.VERBOSE)
+
+# How the translation names the parts; the Supplement has no text file of its own
+PART_NAMES = {"i": "I", "first part": "I", "fp": "I", "i-ii": "II-I", "fs": "II-I", "ii-ii": "II-II", "ss": "II-II",
+              "iii": "III"}
+
+# Books of the Bible in canonical order, as the translation abbreviates them
+BOOKS = ("Gen", "Exod", "Lev", "Num", "Deut", "Josh", "Judg", "Ruth", "1 Sam", "2 Sam", "1 Kgs", "2 Kgs",
+         "1 Chr", "2 Chr", "Ezra", "Neh", "Tob", "Jdt", "Esth", "1 Macc", "2 Macc", "Job", "Ps", "Prov", "Eccl",
+         "Song", "Wis", "Sir", "Isa", "Jer", "Lam", "Bar", "Ezek", "Dan", "Hos", "Joel", "Amos", "Obad", "Jonah",
+         "Mic", "Nah", "Hab", "Zeph", "Hag", "Zech", "Mal", "Matt", "Mark", "Luke", "John", "Acts", "Rom",
+         "1 Cor", "2 Cor", "Gal", "Eph", "Phil", "Col", "1 Thess", "2 Thess", "1 Tim", "2 Tim", "Titus", "Phlm",
+         "Heb", "Jas", "1 Pet", "2 Pet", "1 John", "2 John", "3 John", "Jude", "Rev")
+
+# Older abbreviations that also occur, including the Vulgate names of Kings and Chronicles
+BOOK_ALIASES = {"Is": "Isa", "Ex": "Exod", "Dt": "Deut", "Mk": "Mark", "Lk": "Luke", "Matth": "Matt",
+                "Apoc": "Rev", "Psalm": "Ps", "3 Kgs": "1 Kgs", "4 Kgs": "2 Kgs", "1 Paral": "1 Chr",
+                "2 Paral": "2 Chr"}
+BOOK_CODES = {book: code for code, book in enumerate(BOOKS)}
+BOOK_CODES.update({alias: BOOK_CODES[book] for alias, book in BOOK_ALIASES.items()})
+
+_BOOK_NAMES = "|".join(re.escape(name) for name in sorted(BOOK_CODES, key=len, reverse=True))
+SCRIPTURE = re.compile(r'(?<![\w.])(' + _BOOK_NAMES + r')\.?\s+(\d+):(\d+[\d\s,–-]*)')
+CONTINUED_SCRIPTURE = re.compile(r'^\s*(\d+):(\d+[\d\s,–-]*)')
+VERSE_RANGE = re.compile(r'(\d+)(?:\s*[–-]\s*(\d+))?')
+VERSE_QUERY = re.compile(r'^(' + _BOOK_NAMES + r')\.?(?:\s+(\d+)(?::(\d+))?)?$')
+
+# Longest verse (or article) range expanded into single numbers; anything longer is taken as its first
+MAX_VERSE_RANGE = 50
+
+
+def internal_references(text, part, question):
+    """
+    Returns the (part, question, article) keys of the Summa passages a text refers to
+
+    References are resolved against the part and question they appear in, so
+    "(A. 2)" is article 2 of the same question and "(Q. 5, A. 1)" is in the
+    same part. Within one parenthetical the part and question carry over to
+    later pieces. Article 0 stands for a whole question. Pieces that don't
+    read as a Summa reference (e.g. "(83 Questions, Q. 5)") end the scan of
+    their parenthetical, and Supplement references are left out.
+    """
+    found = []
+    for parenthetical in PARENTHETICAL.finditer(text):
+        current_part, current_question = part, question
+        for piece in parenthetical.group(1).split(";"):
+            match = INTERNAL.match(piece.strip())
+            if match is None:
+                break
+            if match.group("part"):
+                current_part = PART_NAMES.get(match.group("part").lower())
+            if current_part is None:
+                break  # Supplement
+            questions = match.group("questions") or match.group("continued")
+            articles = match.group("articles")
+            if questions is None and articles is None:
+                continue  # "ad 2" and the like point within the same article
+            if questions is not None:
+                questions = [int(q) for q in re.split(r'\s*,\s*', questions)]
+                current_question = questions[-1]
+                found.extend((current_part, q, 0) for q in questions[:-1])
+            if articles is None:
+                found.append((current_part, current_question, 0))
+            else:
+                found.extend((current_part, current_question, a) for a in _numbers(articles))
+    return found
+
+def _numbers(spec):
+    """Expands a list like "1, 3–5" into [1, 3, 4, 5]"""
+    numbers = []
+    for match in VERSE_RANGE.finditer(spec):
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) else first
+        if last < first or last - first >= MAX_VERSE_RANGE:
+            last = first
+        numbers.extend(range(first, last + 1))
+    return numbers
+
+def _verses(book, chapter, spec):
+    return [(book, chapter, verse) for verse in _numbers(spec)]
+
+def scripture_references(text):
+    """
+    Returns the (book code, chapter, verse) of every Bible verse cited in a text
+
+    Ranges like "(1 Cor 3:1–2)" cite every verse in them, and a piece without
+    a book, like the "11:45" in "(Lev 19:2; 11:45)", is in the book before it.
+    """
+    found = []
+    for parenthetical in PARENTHETICAL.finditer(text):
+        book = None
+        for piece in parenthetical.group(1).split(";"):
+            match = SCRIPTURE.search(piece)
+            if match is not None:
+                book = BOOK_CODES[match.group(1)]
+                chapter, spec = match.group(2), match.group(3)
+            else:
+                match = CONTINUED_SCRIPTURE.match(piece)
+                if match is None or book is None:
+                    continue
+                chapter, spec = match.group(1), match.group(2)
+            found.extend(_verses(book, int(chapter), spec))
+    return found
+
+def verse_name(verse):
+    """Returns the usual name of a (book code, chapter, verse) tuple, e.g. "Rom 1:20" """
+    book, chapter, number = verse
+    return f"{BOOKS[book]} {chapter}:{number}"
+
+
+def graph_sources(graph_file=DEFAULT_GRAPH_FILE):
+    """Returns the absolute paths of the text files a graph was built from ([] if there is no graph)"""
+    try:
+        with CrossReferences(graph_file) as graph:
+            return graph.header["sources"]
+    except (OSError, ValueError):
+        return []
+
+def build_graph(text_files, graph_file=DEFAULT_GRAPH_FILE):
+    """
+    Extracts every back-reference and scripture citation of some Summa*.txt files
+
+    Parameters:
+    - text_files: Text files written by scrape_summa, e.g. Summa1.txt, Summa2.txt
+    - graph_file: Where to write the graph (default: DEFAULT_GRAPH_FILE)
+
+    Returns (number of article references, number of verse citations) kept.
+    """
+    diff = CorpusDiff(text_files)
+    references, citations = set(), set()
+    for key, members in diff.changed.items():
+        _add_edges(key, members, references, citations)
+    _write_edges(diff, references, citations, graph_file)
+    return len(references), len(citations)
+
+def update_graph(graph_file=DEFAULT_GRAPH_FILE, text_files=None):
+    """
+    Brings a graph up to date with its text files, extracting references only from what changed
+
+    The edges of every article whose fingerprint is unchanged (see
+    corpus.CorpusDiff) are read back from the graph; those of new and changed
+    articles are extracted again and those of removed articles dropped. The
+    result is the same file build_graph would write.
+
+    Parameters:
+    - graph_file: Graph written by build_graph (default: DEFAULT_GRAPH_FILE)
+    - text_files: Text files to read (default: None, the ones the graph was built from)
+
+    Returns the number of articles whose references were extracted again.
+    """
+    with CrossReferences(graph_file) as old:
+        header = old.header
+        text_files = text_files or header["sources"]
+        diff = CorpusDiff(text_files, header["questions"],
+                          {parse_article_key(key): digest for key, digest in header["articles"].items()})
+        if diff.unchanged():
+            return 0
+        stale = set(diff.changed) | set(diff.removed)
+        references, citations = set(), set()
+        for node_id, source in enumerate(old.nodes):
+            if source not in stale:
+                references.update((source, old.nodes[i]) for i in old._neighbours("cites", node_id))
+                citations.update((source, old.verses[i]) for i in old._neighbours("quotes", node_id))
+    for key, members in diff.changed.items():
+        _add_edges(key, members, references, citations)
+    _write_edges(diff, references, citations, graph_file)
+    return len(diff.changed)
+
+def _add_edges(source, sections, references, citations):
+    """Adds the (source, target) references and (source, verse) citations of an article's sections"""
+    part, question, _ = source
+    for section in sections:
+        for target in internal_references(section.text, part, question):
+            if target != source and target[1] > 0:
+                references.add((source, target))
+        for verse in scripture_references(section.text):
+            citations.add((source, verse))
+
+def _write_edges(diff, references, citations, graph_file):
+    # Integer ids: articles (cited ones included, even without a text file) and verses in canonical order
+    order = lambda key: (PARTS.index(key[0]), key[1], key[2])
+    nodes = sorted({key for edge in references for key in edge} | {source for source, _ in citations}, key=order)
+    node_ids = {key: i for i, key in enumerate(nodes)}
+    verses = sorted({verse for _, verse in citations})
+    verse_ids = {verse: i for i, verse in enumerate(verses)}
+
+    cites = [(node_ids[source], node_ids[target]) for source, target in references]
+    quotes = [(node_ids[source], verse_ids[verse]) for source, verse in citations]
+    blobs = {}
+    blobs["cites_ptr"], blobs["cites"] = _adjacency(cites, len(nodes))
+    blobs["cited_by_ptr"], blobs["cited_by"] = _adjacency([(b, a) for a, b in cites], len(nodes))
+    blobs["quotes_ptr"], blobs["quotes"] = _adjacency(quotes, len(nodes))
+    blobs["quoted_by_ptr"], blobs["quoted_by"] = _adjacency([(b, a) for a, b in quotes], len(verses))
+    _write_graph(blobs, {
+        "sources": list(diff.questions),
+        "questions": diff.questions,
+        "articles": {article_key(key): digest for key, digest in diff.articles.items()},
+        "nodes": [list(key) for key in nodes],
+        "verses": [list(verse) for verse in verses]
+    }, graph_file)
+
+def _adjacency(edges, count):
+    """Returns the (offsets, targets) arrays of the compressed adjacency lists of (from, to) id pairs"""
+    offsets, targets = array("I", [0] * (count + 1)), array("I")
+    for source, target in sorted(edges):
+        offsets[source + 1] += 1
+        targets.append(target)
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    return offsets, targets
+
+def _write_graph(blobs, fields, graph_file):
+    positions, position = {}, 0
+    for name, blob in blobs.items():
+        positions[name] = [position, blob.typecode, len(blob)]
+        position += len(blob) * blob.itemsize
+        position += -position % 8  # Keep every blob 8-byte aligned
+    header = dict(fields, byteorder=sys.byteorder, blobs=positions)
+    data = json.dumps(header).encode("utf-8")
+    data += b" " * (-(PREAMBLE.size + len(data)) % 8)
+
+    tmp_path = graph_file + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(data)))
+        f.write(data)
+        for blob in blobs.values():
+            data = blob.tobytes()
+            f.write(data + b"\0" * (-len(data) % 8))
+    os.replace(tmp_path, graph_file)
+
+
+class CrossReferences:
+    """
+    Lookups in the cross-reference graph written by build_graph
+
+    Articles and verses are numbered, and each relation is a pair of
+    compressed adjacency arrays mapped straight from the file, so every lookup
+    is a slice rather than a scan of the text.
+
+    Parameters:
+    - graph_file: File written by build_graph (default: DEFAULT_GRAPH_FILE)
+    """
+
+    def __init__(self, graph_file=DEFAULT_GRAPH_FILE):
+        self.graph_file = graph_file
+        self.file = open(graph_file, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{graph_file} is not a cross-reference graph this version can read")
+        header = json.loads(self.map[PREAMBLE.size:PREAMBLE.size + header_length])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{graph_file} was built on a machine with a different byte order")
+
+        self.header = header
+        self.nodes = [tuple(key) for key in header["nodes"]]
+        self.node_ids = {key: i for i, key in enumerate(self.nodes)}
+        self.verses = [tuple(verse) for verse in header["verses"]]
+        data = memoryview(self.map)[PREAMBLE.size + header_length:]
+        self.columns = {}
+        for name, (position, typecode, count) in header["blobs"].items():
+            size = array(typecode).itemsize
+            self.columns[name] = data[position:position + count * size].cast(typecode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.columns = {}
+        self.map.close()
+        self.file.close()
+
+    def _neighbours(self, relation, node_id):
+        offsets = self.columns[relation + "_ptr"]
+        return self.columns[relation][offsets[node_id]:offsets[node_id + 1]]
+
+    def cites(self, part, question, article=0):
+        """Returns the (part, question, article) keys an article refers to, e.g. cites("I", 2, 3)"""
+        node_id = self.node_ids.get((part, question, article))
+        return [] if node_id is None else [self.nodes[i] for i in self._neighbours("cites", node_id)]
+
+    def cited_by(self, part, question, article=0):
+        """
+        Returns the keys of the articles that refer to an article, e.g. cited_by("I", 2, 3)
+
+        With article 0 these are the references to the question as a whole.
+        """
+        node_id = self.node_ids.get((part, question, article))
+        return [] if node_id is None else [self.nodes[i] for i in self._neighbours("cited_by", node_id)]
+
+    def quotes(self, part, question, article=0):
+        """Returns the names of the verses an article cites, e.g. quotes("I", 2, 3) -> ["Rom 1:20", ...]"""
+        node_id = self.node_ids.get((part, question, article))
+        if node_id is None:
+            return []
+        return [verse_name(self.verses[i]) for i in self._neighbours("quotes", node_id)]
+
+    def quoting(self, reference):
+        """
+        Returns the keys of the articles citing a verse, chapter or book
+
+        reference is e.g. "Rom 1:20", "Rom 1" or "Rom"; older abbreviations
+        like "Apoc" work too.
+        """
+        match = VERSE_QUERY.match(reference.strip())
+        if match is None:
+            raise ValueError(f"Not a scripture reference: {reference}")
+        book = BOOK_CODES[match.group(1)]
+        chapter, verse = match.group(2), match.group(3)
+        if chapter is None:
+            low, high = (book, 0, 0), (book + 1, 0, 0)
+        elif verse is None:
+            low, high = (book, int(chapter), 0), (book, int(chapter) + 1, 0)
+        else:
+            low, high = (book, int(chapter), int(verse)), (book, int(chapter), int(verse) + 1)
+        node_ids = set()
+        for verse_id in range(bisect_left(self.verses, low), bisect_left(self.verses, high)):
+            node_ids.update(self._neighbours("quoted_by", verse_id))
+        return [self.nodes[i] for i in sorted(node_ids)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the cross-reference graph of the Summa")
+    parser.add_argument("--graph", default=DEFAULT_GRAPH_FILE, help=f"Graph file (default: {DEFAULT_GRAPH_FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Extract the references of Summa*.txt files")
+    build.add_argument("text_files", nargs="+")
+    commands.add_parser("update", help="Extract again only what changed in the text files the graph was built from")
+    for name, help_text in (("cites", "Articles an article refers to"), ("cited-by", "Articles referring to an article"),
+                            ("quotes", "Verses an article cites")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("part", choices=PARTS)
+        command.add_argument("question", type=int)
+        command.add_argument("article", type=int, nargs="?", default=0)
+    quoting = commands.add_parser("quoting", help="Articles citing a verse, chapter or book, e.g. \"Rom 1:20\"")
+    quoting.add_argument("reference")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        references, citations = build_graph(args.text_files, args.graph)
+        print(f"{references} article references and {citations} verse citations -> {args.graph}")
+    elif args.command == "update":
+        count = update_graph(args.graph)
+        print(f"Extracted the references of {count} articles again -> {args.graph}")
+    else:
+        with CrossReferences(args.graph) as graph:
+            if args.command == "quoting":
+                results = graph.quoting(args.reference)
+            else:
+                lookup = {"cites": graph.cites, "cited-by": graph.cited_by, "quotes": graph.quotes}[args.command]
+                results = lookup(args.part, args.question, args.article)
+            for result in results:
+                print(result if isinstance(result, str) else "{} Q{} A{}".format(*result))
@@ -0,0 +1,253 @@
+import heapq
+import re
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+
+WORD = re.compile(r"[^\W_]+")
+
+# Words per shingle, signature size and LSH banding: 16 bands of 4 bins make a
+# pair with Jaccard similarity 0.8 a candidate ~99.9% of the time and one at 0.3 ~12%
+SHINGLE_SIZE = 5
+NUM_BINS = 64
+BANDS = 16
+ROWS = NUM_BINS // BANDS
+
+# Estimated Jaccard similarity above which a paragraph counts as a repeat
+DEFAULT_THRESHOLD = 0.8
+
+# Paragraphs with fewer shingles than this are never flagged; short stock phrases
+# like "This is a sufficient answer to the Objections." legitimately recur
+MIN_SHINGLES = 8
+
+# Signatures remembered at once; the oldest are forgotten first
+DEFAULT_MAX_ENTRIES = 200000
+
+_EMPTY = 1 << 32
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Returns the set of 32-bit hashes of the overlapping word n-grams of a text"""
+    words = WORD.findall(text.lower())
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+def minhash(hashes, num_bins=NUM_BINS):
+    """
+    Returns the MinHash signature of a set of shingle hashes
+
+    Uses one-permutation hashing: each hash is spread over num_bins bins by its
+    low bits and every bin keeps the smallest remaining value, so a signature
+    costs one pass over the shingles instead of one per permutation. Empty
+    bins borrow the value of the next filled one (rotation densification).
+    Every value fits in 32 bits, so signatures can be stored as array("I").
+    """
+    shift = num_bins.bit_length() - 1
+    mask = num_bins - 1
+    signature = [_EMPTY] * num_bins
+    for h in hashes:
+        b = h & mask
+        value = h >> shift
+        if value < signature[b]:
+            signature[b] = value
+    if _EMPTY in signature and hashes:
+        filled = list(signature)
+        for b in range(num_bins):
+            offset = 1
+            while filled[b] == _EMPTY and filled[(b + offset) % num_bins] == _EMPTY:
+                offset += 1
+            if filled[b] == _EMPTY:
+                # Offsetting keeps a borrowed value from matching the donor bin itself;
+                # values are below 2**(32 - shift), so the offset goes in the bits above
+                signature[b] = filled[(b + offset) % num_bins] + (offset << (32 - shift))
+    return signature
+
+def paragraph_signature(text):
+    """Returns the MinHash signature of a paragraph, or None if it is too short to be compared (see MIN_SHINGLES)"""
+    hashes = shingle_hashes(text)
+    return minhash(hashes) if len(hashes) >= MIN_SHINGLES else None
+
+def similarity(signature, other):
+    """Returns the estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+class NearDuplicateFilter:
+    """
+    Streaming near-duplicate detector for paragraphs
+
+    Each paragraph's MinHash signature is split into bands and looked up in an
+    LSH table, so checking a paragraph against everything seen so far costs a
+    few dictionary lookups. Only the newest max_entries signatures are kept,
+    which bounds memory on arbitrarily long runs.
+
+    Parameters:
+    - threshold: Estimated Jaccard similarity that makes a repeat (default: DEFAULT_THRESHOLD)
+    - max_entries: Number of signatures remembered (default: DEFAULT_MAX_ENTRIES)
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.signatures = OrderedDict()  # entry id -> (signature, label)
+        self.buckets = {}                # (band, band values) -> [entry ids], oldest first
+        self.next_id = 0
+        self.checked = 0
+        self.duplicates = 0
+
+    def _bands(self, signature):
+        return [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+    def check(self, text, label=None):
+        """
+        Checks a paragraph against every one remembered, then remembers it if it is new
+
+        Returns (label, similarity) of the earlier paragraph it repeats, or None.
+        label is anything identifying where a paragraph came from, e.g. (question, article).
+        """
+        return self.check_signature(paragraph_signature(text), label)
+
+    def check_signature(self, signature, label=None):
+        """Same as check, for a signature from paragraph_signature (None is never a repeat)"""
+        if signature is None:
+            return None
+        self.checked += 1
+        bands = self._bands(signature)
+        candidates = set()
+        for key in bands:
+            candidates.update(self.buckets.get(key, ()))
+        best = None
+        for entry_id in sorted(candidates):
+            other, other_label = self.signatures[entry_id]
+            score = similarity(signature, other)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (other_label, score)
+        if best is not None:
+            self.duplicates += 1
+            return best
+
+        entry_id = self.next_id
+        self.next_id += 1
+        self.signatures[entry_id] = (signature, label)
+        for key in bands:
+            self.buckets.setdefault(key, []).append(entry_id)
+        if len(self.signatures) > self.max_entries:
+            old_id, (old_signature, _) = self.signatures.popitem(last=False)
+            for key in self._bands(old_signature):
+                bucket = self.buckets[key]
+                # Entries are forgotten oldest first, so the one to go is at the front of every bucket it is in
+                bucket.remove(old_id)
+                if not bucket:
+                    del self.buckets[key]
+        return None
+
+    def add(self, text, label=None):
+        """Remembers a paragraph without counting it as checked, e.g. when priming from an earlier run"""
+        checked, duplicates = self.checked, self.duplicates
+        self.check(text, label)
+        self.checked, self.duplicates = checked, duplicates
+
+    def add_signature(self, signature, label=None):
+        """Same as add, for a signature from paragraph_signature, e.g. one stored in an index"""
+        checked, duplicates = self.checked, self.duplicates
+        self.check_signature(signature, label)
+        self.checked, self.duplicates = checked, duplicates
+
+
+def unique_sections(sections, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES, seen=None,
+                    signatures=False):
+    """
+    Drops sections whose text nearly repeats an earlier section's, in one streaming pass
+
+    Parameters:
+    - sections: Iterable of corpus Sections, e.g. from parse_summa
+    - threshold: Estimated Jaccard similarity that makes a repeat (default: DEFAULT_THRESHOLD)
+    - max_entries: Number of signatures remembered (default: DEFAULT_MAX_ENTRIES)
+    - seen: NearDuplicateFilter to check against and extend (default: None, a fresh one)
+    - signatures: Yield (section, signature) pairs instead of sections (default: False)
+    """
+    if seen is None:
+        seen = NearDuplicateFilter(threshold, max_entries)
+    for section in sections:
+        signature = paragraph_signature(section.text)
+        if seen.check_signature(signature, (section.part, section.question, section.article)) is None:
+            yield (section, signature) if signatures else section
+
+def replay_unique(articles, removed=(), threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Repeats unique_sections over a corpus in which only some articles changed
+
+    A section of an unchanged article is only checked again if it shares an
+    LSH band with an earlier signature that was added, dropped or removed
+    since the last run: otherwise it meets the same candidates as it did then,
+    so it gets the same outcome. Each section that is checked and comes out
+    differently marks the later sections sharing its bands too, so a change
+    ripples on to the sections it affects and no further. Sections are found
+    through one table of every band, so the cost of a replay is that of
+    building the table plus the sections checked, not a check of every section.
+
+    Parameters:
+    - articles: List of (label, signatures, kept) for every article in corpus order: the
+      signature (or None) of each of its sections and the flags unique_sections gave
+      them last time, or None for an article that is new or changed
+    - removed: Signatures that were kept last time in articles that changed or are gone
+    - threshold, max_entries: As for unique_sections; past max_entries sections every
+      section is checked, since which ones were forgotten can differ between runs
+
+    Yields the list of kept flags of every article, in order.
+    """
+    signatures, previous, sizes = [], [], []
+    for _, article_signatures, kept in articles:
+        signatures.extend(article_signatures)
+        previous.extend(kept if kept is not None else [None] * len(article_signatures))
+        sizes.append(len(article_signatures))
+    if len(signatures) >= max_entries:
+        seen = NearDuplicateFilter(threshold, max_entries)
+        labels = [label for label, article_signatures, _ in articles for _ in article_signatures]
+        flags = [seen.check_signature(signature, label) is None for signature, label in zip(signatures, labels)]
+    else:
+        flags = _replay_flags(signatures, previous, removed, threshold)
+    position = 0
+    for size in sizes:
+        yield flags[position:position + size]
+        position += size
+
+def _replay_flags(signatures, previous, removed, threshold):
+    """Returns the kept flag of every section for replay_unique, checking only the ones a change can reach"""
+    # The bands of every section back to back, BANDS per section; most of them are in no other
+    # section, so only the shared ones (or those a removed signature had) go into the table
+    values, padding = [], (-1,) * NUM_BINS  # MinHash values are never negative
+    for signature in signatures:
+        values.extend(signature if signature is not None else padding)
+    bands = list(zip(*[iter(values)] * ROWS))
+    removed_bands = [key for signature in removed for key in enumerate(zip(*[iter(signature)] * ROWS))]
+    shared = {band for band, count in Counter(bands).items() if count > 1}
+    shared.update(band for _, band in removed_bands)
+    shared.discard(padding[:ROWS])
+    holders = {}  # (band, values) -> positions of the sections with it, in order
+    for i in [i for i, band in enumerate(bands) if band in shared]:
+        holders.setdefault((i % BANDS, bands[i]), []).append(i // BANDS)
+
+    flags = [keep if keep is not None else True for keep in previous]
+    pending = [position for position, keep in enumerate(previous) if keep is None and signatures[position] is not None]
+    for key in removed_bands:
+        pending.extend(holders.get(key, ()))
+    heapq.heapify(pending)
+    checked = set()
+    while pending:
+        position = heapq.heappop(pending)
+        if position in checked:
+            continue
+        checked.add(position)
+        signature = signatures[position]
+        section_holders = [holders[key] for key in enumerate(bands[position * BANDS:(position + 1) * BANDS])
+                           if key in holders]
+        candidates = set()
+        for holder in section_holders:
+            candidates.update(holder[:bisect_left(holder, position)])
+        keep = not any(flags[other] and similarity(signature, signatures[other]) >= threshold for other in candidates)
+        if previous[position] is None or keep != previous[position]:
+            for holder in section_holders:
+                for later in holder[bisect_right(holder, position):]:
+                    heapq.heappush(pending, later)
+        flags[position] = keep
+    return flags
@@ -0,0 +1,216 @@
+import re
+from html.parser import HTMLParser
+
+# Optional faster parsers; the standard library one always works
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Compiled once instead of on every page
+ARTICLE_MENTION = re.compile(r'Article (\d+)')
+ARTICLE_LINK = re.compile(r'ST\.([A-Za-z-]+)\.Q(\d+)\.A(\d+)')
+
+# Class markers of the aquinas.cc reader, in the order they are checked
+NODE_KINDS = ("t-r", "t-s", "t-i", "t-h", "t-o")
+
+# Elements that never have an end tag
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+def is_content_class(cls):
+    """Returns True for the class attribute of a c2-2 (English text column) vl-c node"""
+    return bool(cls) and any(token.startswith("c2-2") for token in cls.split())
+
+def classify(cls):
+    """Returns the kind of a c2-2 node: "t-r" (question title), "t-s" (article title),
+    "t-i" (article heading), "t-h"/"t-o" (other headings) or "" for body text"""
+    for kind in NODE_KINDS:
+        if kind in cls:
+            return kind
+    return ""
+
+
+class Page:
+    """
+    Everything the scraper needs from one aquinas.cc page, gathered in a single parse
+
+    Attributes:
+    - nodes: (kind, text) for every c2-2 vl-c node in document order, text stripped
+    - hrefs: href of every link on the page
+    - paragraphs: text of every <p> under div.body div.content (used as a fallback)
+    - strings: every text node of the document, for the last-resort fallback
+    - backend: Name of the parser that produced the record
+    """
+
+    def __init__(self, nodes, hrefs, paragraphs, strings, backend):
+        self.nodes = nodes
+        self.hrefs = hrefs
+        self.paragraphs = paragraphs
+        self.strings = strings
+        self.backend = backend
+
+    def texts(self):
+        """Returns the text of every c2-2 node in order"""
+        return [text for _, text in self.nodes]
+
+    def first(self, kind):
+        """Returns the text of the first node of a kind, or None if there is none"""
+        for node_kind, text in self.nodes:
+            if node_kind == kind:
+                return text
+        return None
+
+    def all_text(self):
+        """Returns the whole text of the page, like BeautifulSoup's get_text()"""
+        return "".join(self.strings)
+
+    def article_numbers(self, url_part, q_num):
+        """Returns every article number of the question mentioned on the page, via links, headings or text"""
+        numbers = set()
+        for href in self.hrefs:
+            for match in ARTICLE_LINK.finditer(href):
+                if match.group(1) == url_part and int(match.group(2)) == q_num:
+                    numbers.add(int(match.group(3)))
+        for kind, text in self.nodes:
+            if kind == "t-i":
+                match = ARTICLE_MENTION.search(text)
+                if match:
+                    numbers.add(int(match.group(1)))
+        for string in self.strings:
+            if "Article " in string:
+                numbers.update(int(n) for n in ARTICLE_MENTION.findall(string))
+        return numbers
+
+
+class _SinglePassParser(HTMLParser):
+    """Standard library fallback that builds a Page in one pass over the markup"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.nodes = []
+        self.hrefs = []
+        self.paragraphs = []
+        self.strings = []
+        self.stack = []  # (tag, collector) for every open element
+        self.collectors = []  # Text buffers of the open vl-c nodes and <p> paragraphs
+        self.body_divs = 0
+        self.content_divs = 0
+        self.ended = False  # Past </html>, where lxml keeps no text either
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        attrs = dict(attrs)
+        cls = attrs.get("class") or ""
+        collector = None
+        if tag == "vl-c" and is_content_class(cls):
+            collector = []
+            self.nodes.append((classify(cls), collector))
+        elif tag == "a" and attrs.get("href"):
+            self.hrefs.append(attrs["href"])
+        elif tag == "div":
+            tokens = cls.split()
+            if "body" in tokens:
+                self.body_divs += 1
+                tag = "div.body"
+            elif "content" in tokens and self.body_divs:
+                self.content_divs += 1
+                tag = "div.content"
+        elif tag == "p" and self.content_divs:
+            collector = []
+            self.paragraphs.append(collector)
+        self.stack.append((tag, collector))
+        if collector is not None:
+            self.collectors.append(collector)
+
+    def handle_endtag(self, tag):
+        if tag == "html":
+            self.ended = True
+        # Close everything up to the matching start tag, like a forgiving browser would
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0].split(".")[0] == tag:
+                while len(self.stack) > i:
+                    self._close(*self.stack.pop())
+                return
+
+    def _close(self, tag, collector):
+        if collector is not None:
+            self.collectors.remove(collector)
+        if tag == "div.body":
+            self.body_divs -= 1
+        elif tag == "div.content":
+            self.content_divs -= 1
+
+    def handle_data(self, data):
+        if self.ended:
+            return
+        self.strings.append(data)
+        for collector in self.collectors:
+            collector.append(data)
+
+    def page(self):
+        nodes = [(kind, "".join(parts).strip()) for kind, parts in self.nodes]
+        paragraphs = ["".join(parts).strip() for parts in self.paragraphs]
+        return Page(nodes, self.hrefs, paragraphs, self.strings, "html.parser")
+
+
+def _extract_stdlib(html):
+    parser = _SinglePassParser()
+    parser.feed(html)
+    parser.close()
+    return parser.page()
+
+def _extract_lxml(html):
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except lxml.etree.ParserError:
+        return Page([], [], [], [], "lxml")  # lxml rejects a blank document; the other backends find nothing in it
+    nodes, hrefs = [], []
+    for element in doc.iter("vl-c", "a"):
+        if element.tag == "a":
+            href = element.get("href")
+            if href:
+                hrefs.append(href)
+        elif is_content_class(element.get("class")):
+            nodes.append((classify(element.get("class")), element.text_content().strip()))
+    paragraphs = [p.text_content().strip() for p in doc.xpath(
+        "//div[contains(concat(' ', normalize-space(@class), ' '), ' body ')]"
+        "//div[contains(concat(' ', normalize-space(@class), ' '), ' content ')]//p")]
+    return Page(nodes, hrefs, paragraphs, list(doc.itertext()), "lxml")
+
+def _extract_selectolax(html):
+    tree = LexborHTMLParser(html)
+    nodes = []
+    for element in tree.css("vl-c"):
+        cls = element.attributes.get("class")
+        if is_content_class(cls):
+            nodes.append((classify(cls), element.text().strip()))
+    hrefs = [a.attributes["href"] for a in tree.css("a[href]") if a.attributes.get("href")]
+    paragraphs = [p.text().strip() for p in tree.css("div.body div.content p")]
+    strings = [node.text(deep=False) for node in tree.root.traverse(include_text=True) if node.tag == "-text"]
+    return Page(nodes, hrefs, paragraphs, strings, "selectolax")
+
+BACKENDS = {"html.parser": _extract_stdlib}
+if LexborHTMLParser is not None:
+    BACKENDS["selectolax"] = _extract_selectolax
+if lxml is not None:
+    BACKENDS["lxml"] = _extract_lxml
+
+# Use the fastest parser that is installed
+DEFAULT_BACKEND = "selectolax" if LexborHTMLParser is not None else "lxml" if lxml is not None else "html.parser"
+
+def extract_page(html, backend=None):
+    """
+    Parses an aquinas.cc page once and returns its Page record
+
+    Parameters:
+    - html: Page markup
+    - backend: "lxml", "selectolax" or "html.parser" if installed (default: the fastest one installed)
+    """
+    return BACKENDS[backend or DEFAULT_BACKEND](html)
@@ -0,0 +1,355 @@
+import threading
+import time
+import random
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import CachedResponse
+
+# Headers sent with every request (same as the scraper has always used)
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5"
+}
+
+# Statuses that mean a page doesn't exist; retrying can't change them
+MISSING_STATUSES = (404, 410)
+
+# Statuses that mean the server wants fewer requests
+THROTTLE_STATUSES = (429, 503)
+
+# Exponential backoff between retries, in seconds: the first delay and the cap
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+def backoff_delay(attempt):
+    """Returns how long to wait before retry number attempt (1, 2, ...): exponential, with jitter"""
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+
+def retry_after(response):
+    """Returns the seconds a response's Retry-After header asks to wait (capped at MAX_BACKOFF), or None"""
+    value = response.headers.get("Retry-After") if response.headers else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(MAX_BACKOFF, max(0.0, seconds))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to cap the request rate to a single host
+
+    Parameters:
+    - rate: Tokens added per second (None or 0 means unlimited)
+    - burst: Maximum number of tokens that can be saved up (default: 1)
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it"""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimit:
+    """
+    AIMD limit on the requests in flight to one host
+
+    The limit starts at the number of workers. A throttled response (429 or
+    503) halves it and pauses every request to the host, for as long as the
+    response's Retry-After asks or else for an exponential backoff; each
+    success raises it by 1/limit, so it grows back by about one request per
+    round trip. Requests sent before the last decrease can't cause another,
+    so a burst of 429s counts as one signal.
+
+    Parameters:
+    - maximum: Most requests ever allowed in flight
+    """
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self.backoff = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Blocks until a request may be sent; returns the seconds spent waiting"""
+        start = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def release(self, sent_at, throttled=False, wait=None):
+        """
+        Frees the slot of a request sent at sent_at (time.monotonic()) and adapts the limit
+
+        Parameters:
+        - throttled: Whether the server pushed back, or None if no answer came (default: False)
+        - wait: Seconds the server asked to wait via Retry-After (default: None)
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if sent_at >= self.decreased_at:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.decreased_at = now
+                    self.backoff = min(MAX_BACKOFF, self.backoff * 2 or BASE_BACKOFF)
+                    wait = self.backoff * (0.5 + random.random() / 2) if wait is None else wait
+                if wait is not None:
+                    self.paused_until = max(self.paused_until, now + wait)
+            elif throttled is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.backoff = 0.0
+            self.condition.notify_all()
+
+
+class FetchEngine:
+    """
+    Thread-pooled HTTP fetcher with keep-alive connections and a per-host rate budget
+
+    Requests to each host also go through an AdaptiveLimit, so when the site
+    starts answering 429 or 503 every worker backs off together instead of
+    each one sleeping on its own.
+
+    Parameters:
+    - workers: Most requests allowed in flight at once (default: 1)
+    - rate: Maximum requests per second to each host (default: None, unlimited)
+    - burst: Number of requests that may be sent back to back before the rate applies (default: 1)
+    - headers: Headers sent with every request (default: DEFAULT_HEADERS)
+    - verbose: Whether to print retry messages (default: False)
+    - cache: ResponseCache to store pages in and revalidate against (default: None)
+    - offline: Serve every request from the cache without touching the network (default: False)
+    - metrics: ScrapeMetrics to record requests, retries and sleeps in (default: None)
+    """
+
+    def __init__(self, workers=1, rate=None, burst=1, headers=None, verbose=False, cache=None, offline=False,
+                 metrics=None):
+        if offline and cache is None:
+            raise ValueError("Offline mode needs a response cache to replay from")
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.burst = burst
+        self.headers = headers or DEFAULT_HEADERS
+        self.verbose = verbose
+        self.cache = cache
+        self.offline = offline
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.local = threading.local()
+        self.sessions = []
+        self.buckets = {}
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Shuts down the worker threads and closes all pooled connections"""
+        self.executor.shutdown(wait=True)
+        for session in self.sessions:
+            session.close()
+
+    def _session(self):
+        # One Session per worker thread so each keeps its own keep-alive connection
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def _bucket(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def _limit(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.limits:
+                self.limits[host] = AdaptiveLimit(self.workers)
+            return self.limits[host]
+
+    def _sleep(self, seconds, reason="backoff"):
+        time.sleep(seconds)
+        if self.metrics:
+            self.metrics.observe_sleep(reason, seconds)
+
+    def _get(self, url, timeout, headers=None):
+        # One network round trip, timed for the metrics
+        start = time.monotonic()
+        try:
+            response = self._session().get(url, timeout=timeout, headers=headers)
+        except Exception:
+            if self.metrics:
+                self.metrics.observe_request(time.monotonic() - start, "error")
+            raise
+        if self.metrics:
+            self.metrics.observe_request(time.monotonic() - start, response.status_code, len(response.content))
+        return response
+
+    def _send(self, url, timeout, headers=None):
+        # Waits for the host's AdaptiveLimit and TokenBucket, then sends one request
+        limit = self._limit(url)
+        waited = limit.acquire()
+        if self.metrics and waited:
+            self.metrics.observe_sleep("throttle", waited)
+        start = time.monotonic()
+        self._bucket(url).acquire()
+        if self.metrics and self.rate:
+            self.metrics.observe_sleep("rate_limit", time.monotonic() - start)
+        sent_at = time.monotonic()
+        try:
+            response = self._get(url, timeout, headers)
+        except Exception:
+            limit.release(sent_at, throttled=None)
+            raise
+        throttled = response.status_code in THROTTLE_STATUSES
+        limit.release(sent_at, throttled, retry_after(response) if throttled else None)
+        return response
+
+    def get(self, url, timeout=120):
+        """
+        Sends a single GET request once the host's rate budget allows it
+
+        With a cache, a cached URL is revalidated with a conditional GET and the
+        cached copy is returned on a 304; fresh 200 responses are stored, and so
+        are 404s and 410s, so an offline replay knows where probing stopped. In
+        offline mode the cached copy is returned directly, and a URL that was
+        never cached gets a 504 like an HTTP "only-if-cached" miss.
+        """
+        if self.offline:
+            cached = self.cache.load(url)
+            if cached is not None and self.metrics:
+                self.metrics.observe_cache_hit()
+            return cached if cached is not None else CachedResponse(url, 504)
+
+        headers = self.cache.conditional_headers(url) if self.cache else None
+        response = self._send(url, timeout, headers)
+        if self.cache:
+            if response.status_code == 304:
+                cached = self.cache.load(url)
+                if cached is not None:
+                    self.cache.mark_validated(url)
+                    if self.metrics:
+                        self.metrics.observe_cache_hit()
+                    return cached
+                # The cached body went missing, so fetch it again unconditionally, within the same budget
+                response = self._send(url, timeout)
+            if response.status_code == 200 or response.status_code in MISSING_STATUSES:
+                self.cache.store(url, response)
+        return response
+
+    def fetch(self, url, max_retries=1, timeout=120):
+        """
+        Fetches a URL, retrying on errors and non-200 status codes
+
+        A 404 or 410 is returned at once, since retrying can't make the page
+        exist. After a 429 or 503 the host's AdaptiveLimit holds the retry back
+        (for the Retry-After the server asked for, if any); after other
+        failures the wait is an exponential backoff.
+
+        Returns the first 200 response, or the last response received once the
+        retries are used up. If the last attempt raised, the exception is re-raised.
+        """
+        if self.offline:
+            # Retrying can't change what is in the cache
+            return self.get(url, timeout=timeout)
+
+        retry_count = 0
+        while True:
+            try:
+                response = self.get(url, timeout=timeout)
+                if response.status_code == 200 or response.status_code in MISSING_STATUSES:
+                    return response
+                retry_count += 1
+                if retry_count >= max_retries:
+                    return response
+                if self.metrics:
+                    self.metrics.observe_retry(response.status_code)
+                if response.status_code in THROTTLE_STATUSES:
+                    # The host's limit has already been cut and its requests paused
+                    if self.verbose:
+                        print(f"    Rate limited ({response.status_code}). Retry {retry_count}: backing off")
+                else:
+                    if self.verbose:
+                        print(f"    Retry {retry_count}: Failed to access {url}, status code: {response.status_code}")
+                    self._sleep(backoff_delay(retry_count))
+            except Exception as e:
+                retry_count += 1
+                if retry_count >= max_retries:
+                    raise
+                if self.metrics:
+                    self.metrics.observe_retry("error")
+                if self.verbose:
+                    print(f"    Retry {retry_count}: Error accessing {url}: {str(e)}")
+                self._sleep(backoff_delay(retry_count))
+
+    def fetch_ordered(self, urls, max_retries=1, timeout=120, window=None):
+        """
+        Fetches many URLs concurrently and yields their futures in input order
+
+        At most `window` requests are queued ahead of the consumer (default: four
+        per worker), so memory stays bounded no matter how many URLs are given.
+        Call .result() on each yielded future to get the response or the error.
+        """
+        window = window or self.workers * 4
+        pending = deque()
+        for url in urls:
+            pending.append(self.executor.submit(self.fetch, url, max_retries, timeout))
+            if len(pending) >= window:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
@@ -0,0 +1,369 @@
+import argparse
+import os
+import struct
+import threading
+import zlib
+from bisect import bisect_right
+
+from corpus import question_regions, split_units
+from parts import part_from_title
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File layout: a header, the shared dictionary, the frames back to back, the
+# frame index and a footer pointing at the index, so frames can be written
+# as they come and the index last
+MAGIC = b"SFRM"
+VERSION = 1
+HEADER = struct.Struct("<4sHB16sI")  # magic, version, codec, part, dictionary length
+INDEX_ENTRY = struct.Struct("<HHQII")  # question, article, offset, compressed length, raw length
+FOOTER = struct.Struct("<QI4s")      # index offset, frame count, magic
+
+CODECS = ("zlib", "zstd")
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+# Size of the dictionary shared by every frame; small frames compress much
+# better when they can refer to text common to the whole part
+DICTIONARY_SIZE = 32768
+
+# Text held back by a streaming FrameWriter to sample its dictionary from
+WARMUP_SIZE = 8 * DICTIONARY_SIZE
+
+
+def frames_path_for(text_file):
+    """Returns the frame file path that goes with a Summa*.txt file"""
+    return os.path.splitext(text_file)[0] + ".frames"
+
+def sample_dictionary(frames, size=DICTIONARY_SIZE, slice_size=1024):
+    """
+    Returns a zlib dictionary of at most size bytes sampled evenly across the frames
+
+    Slices are taken from the middle of frames, where the running text of
+    objections and replies is, rather than from their headers.
+    """
+    step = max(1, len(frames) * slice_size // size)
+    sample = b"".join(frame[len(frame) // 2:len(frame) // 2 + slice_size] for frame in frames[::step])
+    return sample[-size:]  # zlib can only reach back 32 KB
+
+def make_dictionary(frames, codec=None):
+    """Returns the dictionary to compress some frames against: a trained one for zstd, a sampled one for zlib"""
+    if (codec or DEFAULT_CODEC) == "zstd" and zstandard is not None and len(frames) >= 8:
+        return zstandard.train_dictionary(DICTIONARY_SIZE, frames).as_bytes()
+    return sample_dictionary(frames)
+
+
+class FrameWriter:
+    """
+    Writes units of text as independently compressed frames
+
+    Units can be added as they are produced, e.g. by scrape_summa as it
+    writes them. Without a dictionary, the first warmup bytes of units are
+    held back, the dictionary is made from them (see make_dictionary), and
+    every later unit is compressed and written as soon as it is added.
+
+    Parameters:
+    - frames_file: Path of the frame file
+    - part: Part of the Summa stored in the file
+    - dictionary: Bytes every frame is compressed against (default: None, made from
+      the first units; b"" for none)
+    - codec: "zstd" or "zlib" (default: DEFAULT_CODEC, zstd when the zstandard package is installed)
+    - level: Compression level (default: None, the codec's strongest practical level)
+    - warmup: Bytes of units to make the dictionary from (default: WARMUP_SIZE)
+    """
+
+    def __init__(self, frames_file, part, dictionary=None, codec=None, level=None, warmup=WARMUP_SIZE):
+        self.codec = codec or DEFAULT_CODEC
+        if self.codec == "zstd" and zstandard is None:
+            raise ValueError("The zstd codec needs the zstandard package")
+        self.frames_file = frames_file
+        self.part = part
+        self.level = level
+        self.warmup = warmup
+        self.dictionary = None
+        self.held = []  # (question, article, data) added before the dictionary was made
+        self.index = []
+        self.tmp_path = frames_file + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        if dictionary is not None:
+            self._start(dictionary)
+
+    def _start(self, dictionary):
+        """Writes the header and dictionary, then the units held back until now"""
+        self.dictionary = dictionary
+        if self.codec == "zstd":
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self.compressor = zstandard.ZstdCompressor(level=self.level or 19, dict_data=dict_data)
+        self.file.write(HEADER.pack(MAGIC, VERSION, CODECS.index(self.codec), (self.part or "").encode("ascii"),
+                                    len(dictionary)))
+        self.file.write(dictionary)
+        held, self.held = self.held, []
+        for question, article, data in held:
+            self.add_frame(question, article, self.compress(data), len(data))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.tmp_path)
+
+    def compress(self, data):
+        if self.codec == "zstd":
+            return self.compressor.compress(data)
+        level = self.level or 9
+        compressor = zlib.compressobj(level, zdict=self.dictionary) if self.dictionary else zlib.compressobj(level)
+        return compressor.compress(data) + compressor.flush()
+
+    def add(self, question, article, text):
+        """Compresses and appends one unit (or holds it back until the dictionary is made)"""
+        data = text.encode("utf-8")
+        if self.dictionary is None:
+            self.held.append((question, article, data))
+            if sum(len(held) for _, _, held in self.held) >= self.warmup:
+                self._start(make_dictionary([held for _, _, held in self.held], self.codec))
+            return
+        self.add_frame(question, article, self.compress(data), len(data))
+
+    def add_frame(self, question, article, frame, raw_length):
+        """Appends a unit already compressed with this writer's codec and dictionary"""
+        self.index.append((question, article, self.file.tell(), len(frame), raw_length))
+        self.file.write(frame)
+
+    def close(self):
+        """Writes the frame index and moves the file into place"""
+        if self.dictionary is None:
+            self._start(make_dictionary([held for _, _, held in self.held], self.codec))
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), MAGIC))
+        self.file.close()
+        os.replace(self.tmp_path, self.frames_file)
+
+
+def write_frames(text_file, frames_file=None, part=None, codec=None, previous=None):
+    """
+    Stores a Summa*.txt file as one compressed frame per question header and article
+
+    scrape_summa writes the frames of what it scrapes as it goes; this is for
+    text files from elsewhere, and for bringing frames up to date after the
+    text was changed (e.g. by repair_summa).
+
+    Parameters:
+    - text_file: Text file written by scrape_summa
+    - frames_file: Output path (default: frames_path_for(text_file))
+    - part: Part of the Summa (default: None, read from the file's title line)
+    - codec: "zstd" or "zlib" (default: DEFAULT_CODEC)
+    - previous: Regions (see corpus.question_regions) of the text an existing frame file
+      was written from (default: None, compress everything)
+
+    With previous, the frames of every question whose fingerprint didn't
+    change are copied over as they are, and only the other questions are
+    compressed, against the existing file's dictionary.
+
+    Returns (number of frames, compressed size in bytes).
+    """
+    frames_file = frames_file or frames_path_for(text_file)
+    if previous:
+        try:
+            with FrameReader(frames_file) as reader:
+                count = _update_frames(reader, text_file, frames_file, previous)
+            if count is not None:
+                return count, os.path.getsize(frames_file)
+        except (OSError, ValueError):
+            pass  # No frame file this version can read, so it is written from scratch
+
+    with open(text_file, encoding="utf-8", newline="") as f:
+        text = f.read()
+    if part is None:
+        part = part_from_title(text.split("\n", 1)[0].strip())
+    units = split_units(text)
+    codec = codec or DEFAULT_CODEC
+    dictionary = make_dictionary([unit.encode("utf-8") for _, _, unit in units], codec)
+    with FrameWriter(frames_file, part, dictionary, codec) as writer:
+        for question, article, unit in units:
+            writer.add(question, article, unit)
+    return len(units), os.path.getsize(frames_file)
+
+def _update_frames(reader, text_file, frames_file, previous):
+    """
+    Rewrites a frame file, compressing only the questions whose fingerprint changed
+
+    Returns the number of frames, or None if the frames don't add up to the
+    previous regions, i.e. the file wasn't written from that text.
+    """
+    old = {region.question: region for region in previous}
+    entries = {}
+    for entry in reader.index:
+        entries.setdefault(entry[0], []).append(entry)
+    for question, region in old.items():
+        if sum(entry[4] for entry in entries.get(question, ())) != region.end - region.start:
+            return None
+
+    with FrameWriter(frames_file, reader.part, reader.dictionary, reader.codec) as writer, \
+            open(text_file, "rb") as f:
+        for region in question_regions(text_file):
+            unchanged = old.get(region.question)
+            if unchanged is not None and unchanged.fingerprint == region.fingerprint:
+                for question, article, offset, length, raw_length in entries.get(region.question, ()):
+                    reader.file.seek(offset)
+                    writer.add_frame(question, article, reader.file.read(length), raw_length)
+                continue
+            f.seek(region.start)
+            for question, article, unit in split_units(f.read(region.end - region.start).decode("utf-8")):
+                writer.add(question, article, unit)
+        count = len(writer.index)
+    return count
+
+
+class FrameReader:
+    """
+    Random and streaming access to a frame file
+
+    Only the index is read up front; a unit is read and decompressed when it
+    is asked for, so getting one article costs one small read no matter how
+    large the part is.
+
+    Parameters:
+    - frames_file: File written by write_frames
+    """
+
+    def __init__(self, frames_file):
+        self.frames_file = frames_file
+        self.file = open(frames_file, "rb")
+        self.lock = threading.Lock()
+        magic, version, codec, part, dictionary_length = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{frames_file} is not a frame file this version can read")
+        self.codec = CODECS[codec]
+        self.part = part.rstrip(b"\0").decode("ascii") or None
+        self.dictionary = self.file.read(dictionary_length)
+
+        self.file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, count, footer_magic = FOOTER.unpack(self.file.read(FOOTER.size))
+        if footer_magic != MAGIC:
+            raise ValueError(f"{frames_file} is incomplete")
+        self.file.seek(index_offset)
+        self.index = list(INDEX_ENTRY.iter_unpack(self.file.read(count * INDEX_ENTRY.size)))
+        self.positions = {}
+        self.starts = []  # Where each unit starts in the text the frames were made from
+        self.size = 0
+        for i, (question, article, _, _, raw_length) in enumerate(self.index):
+            self.positions.setdefault((question, article), i)
+            self.starts.append(self.size)
+            self.size += raw_length
+
+        if self.codec == "zstd":
+            if zstandard is None:
+                raise ValueError(f"{frames_file} uses zstd; install the zstandard package to read it")
+            dict_data = zstandard.ZstdCompressionDict(self.dictionary) if self.dictionary else None
+            self.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self.file.close()
+
+    def decompress(self, frame):
+        if self.codec == "zstd":
+            return self.decompressor.decompress(frame)
+        decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+        return decompressor.decompress(frame) + decompressor.flush()
+
+    def _read_bytes(self, i):
+        _, _, offset, length, _ = self.index[i]
+        with self.lock:
+            self.file.seek(offset)
+            frame = self.file.read(length)
+        return self.decompress(frame)
+
+    def _read(self, i):
+        return self._read_bytes(i).decode("utf-8")
+
+    def read_range(self, start, end):
+        """
+        Returns the bytes between two offsets of the text the frames were made from
+
+        Only the frames the range overlaps are decompressed, so byte ranges
+        recorded against the text (e.g. by offsets.build_offsets) can be read
+        without it.
+        """
+        if not self.index or start >= end:
+            return b""
+        first = max(bisect_right(self.starts, start) - 1, 0)
+        last = max(bisect_right(self.starts, end - 1), first + 1)
+        data = b"".join(self._read_bytes(i) for i in range(first, last))
+        return data[start - self.starts[first]:end - self.starts[first]]
+
+    def keys(self):
+        """Returns the (question, article) of every unit, in file order"""
+        return [(question, article) for question, article, _, _, _ in self.index]
+
+    def get(self, question, article=0):
+        """Returns the text of a question header (article 0) or an article, or None"""
+        i = self.positions.get((question, article))
+        return self._read(i) if i is not None else None
+
+    def units(self, question=None):
+        """Yields (question, article, text) for every unit, or every unit of one question, decompressing lazily"""
+        for i, (q, a, _, _, _) in enumerate(self.index):
+            if question is None or q == question:
+                yield q, a, self._read(i)
+
+    def __iter__(self):
+        return self.units()
+
+    def text(self):
+        """Returns the whole text file the frames were made from"""
+        return "".join(text for _, _, text in self.units())
+
+
+def export_text(frames_file, text_file):
+    """Writes the text file a frame file was made from back out, unit by unit"""
+    tmp_path = text_file + ".tmp"
+    with FrameReader(frames_file) as reader, open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        for _, _, text in reader:
+            f.write(text)
+    os.replace(tmp_path, text_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store Summa*.txt files as seekable compressed frames")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Compress text files into .frames files")
+    build.add_argument("text_files", nargs="+")
+    build.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC)
+    get = commands.add_parser("get", help="Print one question header or article")
+    get.add_argument("frames_file")
+    get.add_argument("question", type=int)
+    get.add_argument("article", type=int, nargs="?", default=0)
+    export = commands.add_parser("export", help="Write the original text file back out")
+    export.add_argument("frames_file")
+    export.add_argument("text_file")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for text_file in args.text_files:
+            count, size = write_frames(text_file, codec=args.codec)
+            print(f"{text_file}: {count} frames, {os.path.getsize(text_file)} -> {size} bytes ({args.codec})")
+    elif args.command == "get":
+        with FrameReader(args.frames_file) as reader:
+            text = reader.get(args.question, args.article)
+        if text is None:
+            raise SystemExit(f"No unit for Question {args.question}, Article {args.article}")
+        print(text, end="")
+    else:
+        export_text(args.frames_file, args.text_file)
@@ -0,0 +1,103 @@
+import json
+import os
+
+
+class ScrapeJournal:
+    """
+    Append-only checkpoint journal kept next to a scrape's output file
+
+    The first line describes the run (part and question range). Every unit that
+    is written to the output afterwards gets one JSON line holding its question
+    and article number and the byte offset where it ends in the output file:
+    - q=0, a=0: the part title, subtitle and prologue
+    - q=N, a=0: the header block of question N (with its article count)
+    - q=N, a=M: article M of question N
+    Each unit also carries a content hash of the text written for it, so tools
+    can tell which units changed between two scrapes without re-reading them.
+    A final {"done": true} line marks a finished run. Placeholder units written
+    after a failed fetch are journaled with "ok": false.
+
+    Parameters:
+    - path: Path of the journal file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    @staticmethod
+    def path_for(output_file):
+        """Returns the journal path used for an output file"""
+        return output_file + ".journal"
+
+    def read(self):
+        """Returns (run, units, done) from the journal, or (None, [], False) if there is none"""
+        run, units, done = None, [], False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # A torn last line from a crash; everything before it is good
+                    if run is None:
+                        run = entry
+                    elif entry.get("done"):
+                        done = True
+                    else:
+                        units.append(entry)
+        except OSError:
+            pass
+        return run, units, done
+
+    def resume_point(self, run):
+        """
+        Returns the last unit of an unfinished journal for the same run, or None
+
+        None means there is nothing to resume and the scrape should start fresh.
+        """
+        journal_run, units, done = self.read()
+        if journal_run != run or done or not units:
+            return None
+        return units[-1]
+
+    def units(self):
+        """Returns every journaled unit in the order it was written"""
+        return self.read()[1]
+
+    def start(self, run):
+        """Begins a new journal for a run, discarding any previous one"""
+        self.close()
+        self.file = open(self.path, "w", encoding="utf-8")
+        self._write(run)
+
+    def reopen(self):
+        """Continues appending to an existing journal when resuming"""
+        self.close()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def record(self, q, a, end, **extra):
+        """Journals a unit that has been fully written (and flushed) up to byte offset end"""
+        self._write(dict(q=q, a=a, end=end, **extra))
+
+    def finish(self):
+        """Marks the run as complete"""
+        self._write({"done": True})
+        self.close()
+
+    def rewrite(self, run, units, done):
+        """Replaces the journal contents, e.g. after a repair moved the byte offsets"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in [run] + units + ([{"done": True}] if done else []):
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
@@ -0,0 +1,214 @@
+import json
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the histogram buckets (Prometheus style, +Inf is implied)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations, cheap enough to update on every request
+
+    Parameters:
+    - bounds: Increasing upper bounds of the buckets, in seconds
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Returns an upper estimate of a quantile: the bound of the bucket it falls in (the max for +Inf)"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 6),
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + ("+Inf",), self.counts)}
+        }
+
+
+class ScrapeMetrics:
+    """
+    Thread-safe counters and histograms for one scrape
+
+    FetchEngine records every request, retry and sleep into it, and
+    scrape_summa adds parse times, phase timings and per-question throughput.
+    Read it back with summary() (JSON-ready) or prometheus() (text exposition
+    format), e.g. to tell whether rate limiting, the network or parsing is
+    what holds a run back.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.request_latency = Histogram(LATENCY_BUCKETS)
+        self.parse_time = Histogram(PARSE_BUCKETS)
+        self.responses = Counter()  # status code (or "error") -> responses received
+        self.retries = Counter()    # status code (or "error") -> retries it caused
+        self.sleep = Counter()      # reason ("backoff", "throttle", "rate_limit") -> seconds slept
+        self.bytes = 0
+        self.cache_hits = 0         # responses served from the cache (304s and offline replay)
+        self.phases = {}            # phase name -> seconds
+        self.questions = {}         # question -> (articles, seconds)
+
+    def observe_request(self, seconds, status, size=0):
+        with self.lock:
+            self.request_latency.observe(seconds)
+            self.responses[str(status)] += 1
+            self.bytes += size
+
+    def observe_retry(self, status):
+        with self.lock:
+            self.retries[str(status)] += 1
+
+    def observe_sleep(self, reason, seconds):
+        with self.lock:
+            self.sleep[reason] += seconds
+
+    def observe_cache_hit(self):
+        with self.lock:
+            self.cache_hits += 1
+
+    def observe_parse(self, seconds):
+        with self.lock:
+            self.parse_time.observe(seconds)
+
+    def observe_question(self, question, articles, seconds):
+        with self.lock:
+            self.questions[question] = (articles, seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """Times a block of the scrape, e.g. with metrics.phase("articles"): ..."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def summary(self):
+        """Returns every metric as a JSON-ready dict"""
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            articles = sum(count for count, _ in self.questions.values())
+            return {
+                "elapsed": round(elapsed, 3),
+                "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                "requests": {
+                    "count": self.request_latency.count,
+                    "bytes": self.bytes,
+                    "cache_hits": self.cache_hits,
+                    "responses": dict(self.responses),
+                    "retries": dict(self.retries),
+                    "latency": self.request_latency.summary()
+                },
+                # Time spent waiting compared with time spent on requests and parsing
+                "time": {
+                    "requests": round(self.request_latency.sum, 3),
+                    "parsing": round(self.parse_time.sum, 3),
+                    "backoff_sleep": round(self.sleep["backoff"], 3),
+                    "throttle_wait": round(self.sleep["throttle"], 3),
+                    "rate_limit_wait": round(self.sleep["rate_limit"], 3)
+                },
+                "parse": self.parse_time.summary(),
+                "articles": articles,
+                "articles_per_sec": round(articles / elapsed, 3) if elapsed else 0.0,
+                "questions": {
+                    str(question): {"articles": count, "seconds": round(seconds, 3),
+                                    "articles_per_sec": round(count / seconds, 3) if seconds else 0.0}
+                    for question, (count, seconds) in sorted(self.questions.items())
+                }
+            }
+
+    def report(self):
+        """Returns a one-line human summary for the end of a run"""
+        s = self.summary()
+        requests, waits = s["requests"], s["time"]
+        retries = ", ".join(f"{status}: {count}" for status, count in sorted(requests["retries"].items()))
+        return (f"Requests: {requests['count']} ({requests['bytes'] / 1e6:.1f} MB, p50 {requests['latency']['p50']}s), "
+                f"retries: {sum(requests['retries'].values())}{f' ({retries})' if retries else ''}, "
+                f"backoff sleep: {waits['backoff_sleep']:.1f}s, throttled: {waits['throttle_wait']:.1f}s, "
+                f"rate-limit wait: {waits['rate_limit_wait']:.1f}s, "
+                f"parsing: {waits['parsing']:.1f}s, {s['articles_per_sec']:.2f} articles/sec")
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+            f.write("\n")
+
+    def prometheus(self, prefix="summa_scrape"):
+        """Returns the metrics in the Prometheus text exposition format"""
+        with self.lock:
+            lines = []
+
+            def metric(name, kind, help_text, samples):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} {kind}")
+                for labels, value in samples:
+                    label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                    lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+            def histogram(name, help_text, h):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                cumulative = 0
+                for bound, count in zip(h.bounds + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_{name}_sum {h.sum}")
+                lines.append(f"{prefix}_{name}_count {h.count}")
+
+            histogram("request_duration_seconds", "Time from sending a request to reading its response",
+                      self.request_latency)
+            histogram("parse_duration_seconds", "Time to parse and render one page", self.parse_time)
+            metric("responses_total", "counter", "Responses received, by status code",
+                   [({"status": status}, count) for status, count in sorted(self.responses.items())])
+            metric("retries_total", "counter", "Retries, by the status code that caused them",
+                   [({"status": status}, count) for status, count in sorted(self.retries.items())])
+            metric("sleep_seconds_total", "counter", "Seconds spent sleeping instead of working, by reason",
+                   [({"reason": reason}, seconds) for reason, seconds in sorted(self.sleep.items())])
+            metric("downloaded_bytes_total", "counter", "Response body bytes downloaded", [({}, self.bytes)])
+            metric("cache_hits_total", "counter", "Responses served from the response cache", [({}, self.cache_hits)])
+            metric("phase_seconds", "gauge", "Wall-clock seconds per phase of the scrape",
+                   [({"phase": name}, seconds) for name, seconds in self.phases.items()])
+            metric("question_articles_per_second", "gauge", "Articles written per second, by question",
+                   [({"question": q}, count / seconds if seconds else 0.0)
+                    for q, (count, seconds) in sorted(self.questions.items())])
+            return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
@@ -0,0 +1,274 @@
+import argparse
+import mmap
+import os
+import struct
+
+from corpus import SECTION_KINDS, Region, parse_summa, question_regions, read_part
+from frames import FrameReader, frames_path_for
+from parts import part_from_title
+
+# Sidecar layout: a header, one fixed-size record per question, article and section,
+# then the byte range and fingerprint of every question the records were made from
+MAGIC = b"SOFF"
+VERSION = 2
+HEADER = struct.Struct("<4sH16sQdII")  # magic, version, part, text size, text mtime, record count, region count
+RECORD = struct.Struct("<HHBBII")      # question, article, kind, index, start, end
+REGION = struct.Struct("<HII16s")      # question, start, end, fingerprint
+
+# Record kinds: the section kinds plus whole articles and whole questions
+KINDS = SECTION_KINDS + ("article", "question")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+
+def offsets_path_for(text_file):
+    """Returns the offset sidecar path that goes with a Summa*.txt file"""
+    return os.path.splitext(text_file)[0] + ".offsets"
+
+def build_offsets(text_file, offsets_file=None, part=None):
+    """
+    Records the byte range of every question, article and section of a Summa*.txt file
+
+    The sidecar keeps the fingerprint of every question it was built from
+    (see corpus.question_regions), so rebuilding it after the text changed
+    only parses the questions that changed; the records of the others are
+    kept, moved by as many bytes as the text before them grew or shrank.
+
+    Parameters:
+    - text_file: Text file written by scrape_summa
+    - offsets_file: Sidecar to write (default: offsets_path_for(text_file))
+    - part: Part of the Summa (default: None, read from the file's title line)
+
+    Returns the number of ranges recorded.
+    """
+    offsets_file = offsets_file or offsets_path_for(text_file)
+    part = part or read_part(text_file)
+    regions = question_regions(text_file)
+    reused = _reusable_records(offsets_file, regions)
+    records = []
+    for region in regions:
+        if region.question in reused:
+            records.extend(reused[region.question])
+            continue
+        outline = []
+        for section in parse_summa(text_file, part, outline, region.start, region.end):
+            records.append((section.question, section.article, KIND_CODES[section.kind], section.index or 0,
+                            section.start, section.end))
+        for kind, question, article, start, end in outline:
+            records.append((question, article, KIND_CODES[kind], 0, start, end))
+
+    stat = os.stat(text_file)
+    tmp_path = offsets_file + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, (part or "").encode("ascii"), stat.st_size, stat.st_mtime, len(records),
+                            len(regions)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+        for region in regions:
+            f.write(REGION.pack(region.question, region.start, region.end, region.fingerprint.encode("ascii")))
+    os.replace(tmp_path, offsets_file)
+    return len(records)
+
+def _reusable_records(offsets_file, regions):
+    """Returns {question: [records]} from an existing sidecar for the questions whose fingerprint is unchanged"""
+    recorded = recorded_regions(offsets_file)
+    if recorded is None:
+        return {}
+    old = {region.question: region for region in recorded[0]}
+    shifts = {region.question: region.start - old[region.question].start for region in regions
+              if region.question in old and old[region.question].fingerprint == region.fingerprint}
+    reused = {}
+    for question, article, kind, index, start, end in _read_records(offsets_file):
+        if question in shifts:
+            shift = shifts[question]
+            reused.setdefault(question, []).append((question, article, kind, index, start + shift, end + shift))
+    return reused
+
+def recorded_regions(offsets_file):
+    """
+    Returns the Regions a sidecar was built from and the modification time the text had then
+
+    Files derived from the same text at the same time (the JSONL corpus, the
+    frames) can be updated against these regions too. Returns None if there
+    is no sidecar this version can read.
+    """
+    try:
+        with open(offsets_file, "rb") as f:
+            _, _, mtime, count = _read_header(offsets_file)
+            f.seek(HEADER.size + count * RECORD.size)
+            regions = [Region(question, start, end, fingerprint.decode("ascii"))
+                       for question, start, end, fingerprint in REGION.iter_unpack(f.read())]
+    except (OSError, ValueError, struct.error):
+        return None
+    return regions, mtime
+
+def _read_header(offsets_file):
+    with open(offsets_file, "rb") as f:
+        magic, version, part, size, mtime, count, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{offsets_file} is not an offset sidecar this version can read")
+    return part.rstrip(b"\0").decode("ascii"), size, mtime, count
+
+def _read_records(offsets_file):
+    _, _, _, count = _read_header(offsets_file)
+    with open(offsets_file, "rb") as f:
+        f.seek(HEADER.size)
+        return list(RECORD.iter_unpack(f.read(count * RECORD.size)))
+
+def is_stale(text_file, offsets_file=None):
+    """
+    Returns True if the sidecar is missing or was built from a different version of the text file
+
+    If only the frames of the text were kept (see scrape_summa), the sidecar
+    is checked against the size of the text they hold.
+    """
+    offsets_file = offsets_file or offsets_path_for(text_file)
+    try:
+        _, size, mtime, _ = _read_header(offsets_file)
+    except (OSError, ValueError, struct.error):
+        return True
+    if not os.path.exists(text_file):
+        try:
+            with FrameReader(frames_path_for(text_file)) as frames:
+                return frames.size != size
+        except (OSError, ValueError):
+            return True
+    stat = os.stat(text_file)
+    return size != stat.st_size or mtime != stat.st_mtime
+
+
+class SummaReader:
+    """
+    Constant-time random access into one Summa*.txt file
+
+    The text is memory-mapped rather than read, so processes that open the
+    same file share its pages, and only the slices that are asked for are
+    decoded. Ranges come from the offset sidecar, which is (re)built if it is
+    missing or older than the text. If only the frames of the text were kept,
+    passages are read from them instead, one frame at a time.
+
+    Parameters:
+    - text_file: Text file written by scrape_summa
+    - offsets_file: Offset sidecar (default: offsets_path_for(text_file))
+    """
+
+    def __init__(self, text_file, offsets_file=None):
+        self.text_file = text_file
+        self.offsets_file = offsets_file or offsets_path_for(text_file)
+        self.frames = None
+        if not os.path.exists(text_file):
+            if is_stale(text_file, self.offsets_file):
+                raise FileNotFoundError(f"{text_file} is missing and its offset sidecar doesn't match its frames")
+            self.frames = FrameReader(frames_path_for(text_file))
+        elif is_stale(text_file, self.offsets_file):
+            build_offsets(text_file, self.offsets_file)
+        self.part = _read_header(self.offsets_file)[0]
+
+        self.ranges = {}
+        for question, article, kind, index, start, end in _read_records(self.offsets_file):
+            self.ranges[(question, article, kind, index)] = (start, end)
+
+        if self.frames is None:
+            self.file = open(text_file, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.frames is not None:
+            self.frames.close()
+            return
+        self.map.close()
+        self.file.close()
+
+    def range(self, question, article=0, kind=None, index=None):
+        """
+        Returns the (start, end) byte range of a question, article or section, or None
+
+        kind is a section kind ("objection", "reply", ...); without one the range
+        is the whole article, or the whole question if article is 0 too.
+        """
+        if kind is None:
+            kind = "article" if article else "question"
+        code = KIND_CODES.get(kind)
+        if code is None:
+            raise ValueError(f"Unknown section kind: {kind}")
+        return self.ranges.get((question, article, code, index or 0))
+
+    def raw(self, question, article=0, kind=None, index=None):
+        """Returns the undecoded bytes of a question, article or section, or None"""
+        found = self.range(question, article, kind, index)
+        if not found:
+            return None
+        return self.map[found[0]:found[1]] if self.frames is None else self.frames.read_range(*found)
+
+    def get(self, question, article=0, kind=None, index=None):
+        """Returns the text of a question, article or section, e.g. get(1, 2, "reply", 1), or None"""
+        data = self.raw(question, article, kind, index)
+        return data.decode("utf-8") if data is not None else None
+
+    def sections(self, question, article):
+        """Returns the (kind, index) of every section of an article, in file order"""
+        found = [(start, KINDS[kind], index or None)
+                 for (q, a, kind, index), (start, _) in self.ranges.items()
+                 if q == question and a == article and kind < len(SECTION_KINDS)]
+        return [(kind, index) for _, kind, index in sorted(found)]
+
+
+class SummaLibrary:
+    """
+    Random access across several Summa*.txt files, keyed by part
+
+    Each file is only mapped the first time one of its passages is asked for.
+
+    Parameters:
+    - text_files: Text files written by scrape_summa, e.g. Summa1.txt, Summa2.txt
+    """
+
+    def __init__(self, text_files):
+        self.paths = {}
+        for text_file in text_files:
+            if os.path.exists(text_file):
+                with open(text_file, encoding="utf-8") as f:
+                    part = part_from_title(f.readline().strip())
+            else:
+                with FrameReader(frames_path_for(text_file)) as frames:
+                    part = frames.part
+            if part is not None:
+                self.paths[part] = text_file
+        self.readers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        self.readers = {}
+
+    def reader(self, part):
+        """Returns the SummaReader of a part, opening it on first use"""
+        if part not in self.readers:
+            if part not in self.paths:
+                raise KeyError(f"No text file loaded for part {part}")
+            self.readers[part] = SummaReader(self.paths[part])
+        return self.readers[part]
+
+    def get(self, part, question, article=0, kind=None, index=None):
+        """Returns the text of a passage, e.g. get("I", 1, 2, "reply", 1), or None"""
+        return self.reader(part).get(question, article, kind, index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build byte-offset sidecars for Summa*.txt files")
+    parser.add_argument("text_files", nargs="+", help="Text files written by the scraper, e.g. Summa1.txt")
+    args = parser.parse_args()
+    for text_file in args.text_files:
+        count = build_offsets(text_file)
+        print(f"{text_file}: {count} ranges -> {offsets_path_for(text_file)}")
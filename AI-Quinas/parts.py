@@ -0,0 +1,117 @@
+import json
+import os
+
+# The four parts of the Summa, in order
+PARTS = ("I", "II-I", "II-II", "III")
+
+def get_default_end_question(part):
+    """Returns the default end question number based on the part of the Summa"""
+    part_question_counts = {
+        "I": 119,      # Prima Pars has 119 questions
+        "II-I": 114,   # Prima Secundae has 114 questions
+        "II-II": 189,  # Secunda Secundae has 189 questions
+        "III": 90      # Tertia Pars has 90 questions
+    }
+    return part_question_counts.get(part, 119)  # Default to 119 if part not found
+
+# Article counts that can't be read off the question pages
+SPECIAL_ARTICLE_COUNTS = {
+    "I": {
+        119: 2,    # Question 119 in Prima Pars has 2 articles
+    },
+    "II-I": {
+        114: 10,   # Question 114 in Prima Secundae has 10 articles
+    },
+    "II-II": {
+        189: 10,   # Question 189 in Secunda Secundae has 10 articles
+    },
+    "III": {
+        90: 4,     # Question 90 in Tertia Pars has 4 articles
+    }
+}
+
+# Article counts learned by earlier scrapes (see record_article_counts)
+ARTICLE_COUNTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "article_counts.json")
+
+_learned_counts = {}  # manifest path -> {part: {question: count}}
+
+def load_article_counts(manifest_file=ARTICLE_COUNTS_FILE):
+    """Returns {part: {question: article count}} from a manifest ({} if there is none)"""
+    if manifest_file not in _learned_counts:
+        try:
+            with open(manifest_file, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        _learned_counts[manifest_file] = {part: {int(q): count for q, count in counts.items()}
+                                          for part, counts in data.items()}
+    return _learned_counts[manifest_file]
+
+def record_article_counts(part, counts, manifest_file=ARTICLE_COUNTS_FILE):
+    """
+    Adds {question: article count} pairs a scrape has confirmed to the manifest
+
+    Only counts the site confirmed (an article page past the last one answered
+    404) belong here, so the next scrape of those questions fetches exactly the
+    articles that exist.
+    """
+    if not counts:
+        return
+    manifest = load_article_counts(manifest_file)
+    manifest.setdefault(part, {}).update(counts)
+    tmp_path = manifest_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({p: {str(q): n for q, n in sorted(c.items())} for p, c in manifest.items()}, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, manifest_file)
+
+def get_article_count(part, question, manifest_file=ARTICLE_COUNTS_FILE):
+    """
+    Returns the known article count of a question, or None
+
+    Special cases come first, then counts learned by earlier scrapes from the
+    manifest (skipped if manifest_file is None).
+    """
+    if question in SPECIAL_ARTICLE_COUNTS.get(part, {}):
+        return SPECIAL_ARTICLE_COUNTS[part][question]
+    if manifest_file is None:
+        return None
+    return load_article_counts(manifest_file).get(part, {}).get(question)  # None if unknown
+
+def get_part_url_format(part):
+    """Returns the correct URL format for the given part"""
+    # The website uses different formats for different parts
+    part_formats = {
+        "I": "I",           # Prima Pars: ST.I.Q1
+        "II-I": "I-II",     # Prima Secundae: ST.I-II.Q1 (not ST.II-I.Q1)
+        "II-II": "II-II",   # Secunda Secundae: ST.II-II.Q1
+        "III": "III"        # Tertia Pars: ST.III.Q1
+    }
+    return part_formats.get(part, part)
+
+def get_part_title(part):
+    """Returns the title for the given part"""
+    part_titles = {
+        "I": "FIRST PART",
+        "II-I": "FIRST PART OF THE SECOND PART",
+        "II-II": "SECOND PART OF THE SECOND PART",
+        "III": "THIRD PART"
+    }
+    return part_titles.get(part, f"PART {part}")
+
+def part_from_title(title_line):
+    """Returns the part whose output title line this is (e.g. "SUMMA THEOLOGIAE FIRST PART"), or None"""
+    for part in PARTS:
+        if title_line == f"SUMMA THEOLOGIAE {get_part_title(part)}":
+            return part
+    return None
+
+def get_part_subtitle(part):
+    """Returns the subtitle for the given part"""
+    part_subtitles = {
+        "I": "SACRED DOCTRINE",
+        "II-I": "MAN'S LAST END",
+        "II-II": "FAITH, HOPE, AND CHARITY",
+        "III": "THE INCARNATION"
+    }
+    return part_subtitles.get(part, "")
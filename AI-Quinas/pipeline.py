@@ -0,0 +1,85 @@
+import contextlib
+import io
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Marks the end of the fetch stage's output on the raw page queue
+_DONE = object()
+
+
+class _FetchStageError:
+    """Carries an exception raised by the fetch stage over to the consuming thread"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _drain(fetched, raw_pages):
+    try:
+        for item in fetched:
+            raw_pages.put(item)
+    except BaseException as e:
+        raw_pages.put(_FetchStageError(e))
+    raw_pages.put(_DONE)
+
+
+def _timed(parse, *args):
+    # Runs in the parser process, so the time measured is the parse alone, not the queueing;
+    # what the parse prints is handed back instead of going to a stdout shared with other workers
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        result = parse(*args)
+    return time.perf_counter() - start, result, output.getvalue()
+
+def _result(future, on_parsed):
+    seconds, result, printed = future.result()
+    if printed:
+        print(printed, end="")
+    if on_parsed is not None:
+        on_parsed(seconds)
+    return result
+
+
+def ordered_pipeline(fetched, parse, executor=None, queue_size=64, on_parsed=None):
+    """
+    Runs the parse stage of a fetch -> parse -> write pipeline, yielding results in order
+
+    The fetch stage is drained on its own thread into a bounded queue of raw
+    pages, each page is parsed in the executor (normally a ProcessPoolExecutor,
+    so parsing runs on every core while the network is still busy), and the
+    results come back in the order the pages were fetched for the writer.
+    Anything a parse prints is printed by the consuming thread along with its
+    result, so progress messages stay in order instead of interleaving.
+
+    Parameters:
+    - fetched: Iterable of argument tuples for parse, in output order
+    - parse: Top-level (picklable) function called as parse(*args)
+    - executor: Pool to parse in (default: None, parse inline on the consuming thread)
+    - queue_size: Maximum number of raw pages, and of parses in flight, held at once (default: 64)
+    - on_parsed: Called with the seconds each parse took, e.g. ScrapeMetrics.observe_parse (default: None)
+    """
+    raw_pages = queue.Queue(maxsize=queue_size)
+    threading.Thread(target=_drain, args=(fetched, raw_pages), daemon=True).start()
+
+    pending = deque()
+    while True:
+        item = raw_pages.get()
+        if item is _DONE:
+            break
+        if isinstance(item, _FetchStageError):
+            raise item.error
+        if executor is None:
+            future = Future()
+            future.set_result(_timed(parse, *item))
+        else:
+            future = executor.submit(_timed, parse, *item)
+        pending.append(future)
+        if len(pending) >= queue_size:
+            yield _result(pending.popleft(), on_parsed)
+    while pending:
+        yield _result(pending.popleft(), on_parsed)
+
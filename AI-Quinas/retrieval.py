@@ -0,0 +1,552 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from corpus import SECTION_KINDS, CorpusDiff, parse_summa
+from dedup import NUM_BINS, paragraph_signature, replay_unique, unique_sections
+from parts import PARTS
+
+# Default location of the index, next to the Summa*.txt files
+DEFAULT_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "summa.bm25")
+
+MAGIC = b"BM25"
+VERSION = 4
+PREAMBLE = struct.Struct("<4sHI")  # magic, version, header length
+
+WORD = re.compile(r"[^\W\d_]+")
+
+# Very common English words that carry no weight in a query
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no nor not of on or our
+she so than that the their them then there these they this those to was we were what when which who whom why
+will with you your
+""".split())
+
+# Per-document columns stored next to the posting lists
+DOC_COLUMNS = (("part", "B"), ("question", "H"), ("article", "H"), ("kind", "B"), ("index", "B"), ("length", "I"))
+
+# Queries scored per dense score matrix; larger batches outgrow the CPU cache and get slower per query
+BATCH_SIZE = 16
+
+# Stored in place of the MinHash signature of a section too short to have one
+NO_SIGNATURE = [0xFFFFFFFF] * NUM_BINS
+
+Hit = namedtuple("Hit", ["score", "part", "question", "article", "kind", "index"])
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens, dropping stopwords"""
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+def section_tokens(section):
+    """Returns the tokens indexed for a section: its text plus its article's title"""
+    tokens = tokenize(section.text)
+    if section.article_title:
+        tokens += tokenize(section.article_title)
+    return tokens
+
+
+def parse_sections(text_files):
+    """Returns every section of some Summa*.txt files, in order"""
+    sections = []
+    for text_file in text_files:
+        sections.extend(parse_summa(text_file))
+    return sections
+
+def read_sections(text_files):
+    """
+    Returns the sections of some Summa*.txt files, in order, worth indexing
+
+    Sections that nearly repeat an earlier one (see unique_sections) are left
+    out so repeated passages don't count twice in document frequencies.
+    """
+    return list(unique_sections(parse_sections(text_files)))
+
+def article_key(key):
+    """Turns a (part, question, article) tuple into the string key used in index headers"""
+    return "{}:{}:{}".format(*key)
+
+def parse_article_key(text):
+    """Turns a string key from an index header back into a (part, question, article) tuple"""
+    part, question, article = text.split(":")
+    return part, int(question), int(article)
+
+def dedup_articles(diff, recorded=None):
+    """
+    Leaves out near-duplicate sections like read_sections, checking again only what a change can affect
+
+    Parameters:
+    - diff: CorpusDiff of the text files
+    - recorded: {key: (signatures, kept flags)} of every section, stored at the last
+      build (default: None, nothing was built)
+
+    Only the new and changed articles are signed; the decisions of the other
+    articles are replayed from what was recorded (see replay_unique).
+
+    Returns (dedup, rebuilt): dedup is {key: (signatures, kept flags)} of every
+    article, in corpus order, to store for the next update, and rebuilt is
+    {key: [sections kept]} of every article whose documents have to be written
+    again: the new and changed ones, and those in which the outcome of a
+    section flipped.
+    """
+    recorded = recorded or {}
+    signatures = {key: [paragraph_signature(section.text) for section in members]
+                  for key, members in diff.changed.items()}
+    removed = [signature for key, (old_signatures, kept) in recorded.items()
+               if key in diff.changed or key not in diff.articles
+               for signature, keep in zip(old_signatures, kept) if keep and signature is not None]
+    articles = [(key, signatures[key], None) if key in signatures else (key,) + recorded[key] for key in diff.articles]
+
+    dedup, flipped = {}, []
+    for (key, article_signatures, kept), flags in zip(articles, replay_unique(articles, removed)):
+        dedup[key] = (article_signatures, flags)
+        if kept is not None and flags != list(kept):
+            flipped.append(key)
+    sections = dict(diff.changed)
+    sections.update(diff.sections(flipped))
+    rebuilt = {key: [section for section, keep in zip(sections[key], dedup[key][1]) if keep]
+               for key in diff.articles if key in sections}
+    return dedup, rebuilt
+
+def pack_dedup(dedup):
+    """Returns the (signatures, kept flags) arrays of a dedup dict and {key: [first section, count]} into them"""
+    signatures, kept, positions = array("I"), array("B"), {}
+    for key, (article_signatures, flags) in dedup.items():
+        positions[key] = [len(kept), len(flags)]
+        for signature in article_signatures:
+            signatures.extend(signature or NO_SIGNATURE)
+        kept.extend(flags)
+    return signatures, kept, positions
+
+def unpack_dedup(positions, signatures, kept):
+    """Reverses pack_dedup for arrays read back from a file"""
+    dedup = {}
+    for key, (first, count) in positions.items():
+        article_signatures = []
+        for i in range(first, first + count):
+            signature = signatures[i * NUM_BINS:(i + 1) * NUM_BINS].tolist()
+            article_signatures.append(signature if signature != NO_SIGNATURE else None)
+        dedup[key] = (article_signatures, [bool(keep) for keep in kept[first:first + count]])
+    return dedup
+
+def index_sources(index_file=DEFAULT_INDEX_FILE):
+    """Returns the absolute paths of the text files an index was built from ([] if there is no index)"""
+    try:
+        with BM25Index(index_file) as index:
+            return index.header["sources"]
+    except (OSError, ValueError):
+        return []
+
+def build_index(text_files, index_file=DEFAULT_INDEX_FILE, k1=1.2, b=0.75):
+    """
+    Builds the BM25 index over every section of some Summa*.txt files
+
+    Parameters:
+    - text_files: Text files written by scrape_summa, e.g. Summa1.txt, Summa2.txt
+    - index_file: Where to write the index (default: DEFAULT_INDEX_FILE)
+    - k1, b: BM25 parameters (default: 1.2 and 0.75)
+
+    Near-duplicate sections are left out (see read_sections). The index
+    records what it was built from, so update_index only has to look at what
+    changed: the fingerprint of every question and article, and the MinHash
+    signature of every section with whether it was kept.
+
+    Returns the number of sections indexed.
+    """
+    diff = CorpusDiff(text_files)
+    dedup, rebuilt = dedup_articles(diff)
+    builder = _IndexBuilder()
+    articles = {}
+    for key, digest in diff.articles.items():
+        articles[key] = [digest, builder.num_docs, len(rebuilt[key])]
+        builder.add(rebuilt[key])
+    positions = builder.add_signatures(dedup)
+    builder.write(index_file, _index_fields(diff, articles, positions, [], k1, b))
+    return builder.num_docs
+
+def _index_fields(diff, articles, positions, deleted, k1, b):
+    return {
+        "k1": k1,
+        "b": b,
+        "sources": list(diff.questions),
+        "questions": diff.questions,
+        # Fingerprint, first document and document count, first section and section count
+        "articles": {article_key(key): entry + positions[key] for key, entry in articles.items()},
+        "deleted": sorted(deleted)
+    }
+
+def update_index(index_file=DEFAULT_INDEX_FILE, text_files=None, max_deleted=0.25):
+    """
+    Brings an index up to date with its text files, re-indexing only what changed
+
+    Only the questions whose fingerprint changed are parsed again (see
+    CorpusDiff), and only their new or changed articles are signed and
+    tokenized. The near-duplicate check is replayed over the stored
+    signatures, so an unchanged article whose sections are now kept or left
+    out differently is re-indexed too. Re-indexed articles have their old
+    documents tombstoned and new ones appended, while the posting lists of
+    every untouched term are copied over as they are. Once tombstones pass
+    max_deleted of the documents the index is rebuilt from scratch instead.
+
+    Parameters:
+    - index_file: Index written by build_index (default: DEFAULT_INDEX_FILE)
+    - text_files: Text files to index (default: None, the ones the index was built from)
+    - max_deleted: Share of tombstoned documents that triggers a full rebuild (default: 0.25)
+
+    Returns the number of articles that were re-indexed.
+    """
+    with BM25Index(index_file) as old:
+        header = old.header
+        text_files = text_files or header["sources"]
+        recorded = {parse_article_key(key): entry for key, entry in header["articles"].items()}
+        diff = CorpusDiff(text_files, header["questions"], {key: entry[0] for key, entry in recorded.items()})
+        if diff.unchanged():
+            return 0
+        dedup, rebuilt = dedup_articles(diff, unpack_dedup({key: entry[3:] for key, entry in recorded.items()},
+                                                           old.columns["signatures"], old.columns["kept"]))
+
+        deleted = set(header["deleted"])
+        for key in diff.removed + [key for key in rebuilt if key in recorded]:
+            _, first, count = recorded[key][:3]
+            deleted.update(range(first, first + count))
+        total_docs = len(old.columns["length"])
+        rebuild = len(deleted) > max_deleted * (total_docs + sum(len(members) for members in rebuilt.values()))
+        if not rebuild:
+            # Only the re-indexed articles are tokenized; everything else is reused as is
+            builder = _IndexBuilder(first_doc=total_docs)
+            articles = {}
+            for key, digest in diff.articles.items():
+                if key in rebuilt:
+                    articles[key] = [digest, builder.first_doc + builder.num_docs, len(rebuilt[key])]
+                    builder.add(rebuilt[key])
+                else:
+                    articles[key] = [digest] + recorded[key][1:3]
+            builder.merge_from(old)
+            positions = builder.add_signatures(dedup)
+            fields = _index_fields(diff, articles, positions, deleted, header["k1"], header["b"])
+        k1, b = header["k1"], header["b"]
+
+    if rebuild:
+        build_index(text_files, index_file, k1, b)
+        return len(diff.articles)
+    builder.write(index_file, fields)
+    return len(rebuilt)
+
+
+class _IndexBuilder:
+    """Accumulates documents and postings, then writes (or merges into) an index file"""
+
+    def __init__(self, first_doc=0):
+        self.first_doc = first_doc
+        self.num_docs = 0
+        self.postings = {}  # term -> [(doc id, tf)]
+        self.columns = {name: array(typecode) for name, typecode in DOC_COLUMNS}
+        self.signatures = array("I")  # NUM_BINS per section, kept or not, in corpus order
+        self.kept = array("B")        # Whether each section is a document
+        self.old_postings = {}  # term -> (doc id bytes, tf bytes) kept from a previous index
+
+    def add(self, sections):
+        """Adds sections as documents"""
+        for section in sections:
+            counts = Counter(section_tokens(section))
+            doc_id = self.first_doc + self.num_docs
+            self.num_docs += 1
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+            self.columns["part"].append(PARTS.index(section.part))
+            self.columns["question"].append(section.question)
+            self.columns["article"].append(section.article)
+            self.columns["kind"].append(SECTION_KINDS.index(section.kind))
+            self.columns["index"].append(section.index or 0)
+            self.columns["length"].append(sum(counts.values()))
+
+    def add_signatures(self, dedup):
+        """Stores the signatures and kept flags of every section (see dedup_articles), returning their positions"""
+        self.signatures, self.kept, positions = pack_dedup(dedup)
+        return positions
+
+    def merge_from(self, old):
+        """
+        Puts every document and posting list of an open index ahead of this builder's
+
+        Everything is copied out of the old index, so it can be closed (and the
+        file replaced) before write is called.
+        """
+        for name, typecode in DOC_COLUMNS:
+            column = array(typecode)
+            column.frombytes(old.columns[name].tobytes())
+            column.extend(self.columns[name])
+            self.columns[name] = column
+        self.old_postings = {term: (old.columns["doc_ids"][start:start + length].tobytes(),
+                                    old.columns["tfs"][start:start + length].tobytes())
+                             for term, (start, length, _) in old.terms.items()}
+
+    def write(self, index_file, fields):
+        """
+        Writes the index file
+
+        Layout: a small preamble, a JSON header (parameters, the term dictionary,
+        the per-question and per-article fingerprints and blob positions), then
+        flat arrays: the doc ids and term frequencies of every posting list back
+        to back, one column per document attribute, and the MinHash signature of
+        every section with whether it was kept.
+        """
+        terms = {}
+        doc_ids, tfs = array("I"), array("H")
+        deleted = set(fields.get("deleted", ()))
+        for term in sorted(set(self.postings) | set(self.old_postings)):
+            start = len(doc_ids)
+            if term in self.old_postings:
+                # An untouched posting list is copied over in one piece
+                old_doc_ids, old_tfs = self.old_postings[term]
+                doc_ids.frombytes(old_doc_ids)
+                tfs.frombytes(old_tfs)
+            for doc_id, tf in self.postings.get(term, ()):
+                doc_ids.append(doc_id)
+                tfs.append(min(tf, 65535))
+            count = len(doc_ids) - start
+            df = count - sum(1 for doc_id in doc_ids[start:] if doc_id in deleted) if deleted else count
+            terms[term] = [start, count, df]  # df leaves out tombstoned documents
+
+        columns = dict(self.columns, doc_ids=doc_ids, tfs=tfs, signatures=self.signatures, kept=self.kept)
+        blobs, position = {}, 0
+        for name, column in columns.items():
+            blobs[name] = [position, column.typecode, len(column)]
+            position += len(column) * column.itemsize
+            position += -position % 8  # Keep every blob 8-byte aligned
+
+        live_lengths = [length for doc_id, length in enumerate(columns["length"]) if doc_id not in deleted]
+        header = dict(fields)
+        header.update({
+            "byteorder": sys.byteorder,
+            "num_docs": len(live_lengths),
+            "avgdl": sum(live_lengths) / len(live_lengths) if live_lengths else 0.0,
+            "terms": terms,
+            "blobs": blobs
+        })
+        data = json.dumps(header).encode("utf-8")
+        data += b" " * (-(PREAMBLE.size + len(data)) % 8)
+
+        tmp_path = index_file + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, VERSION, len(data)))
+            f.write(data)
+            for column in columns.values():
+                blob = column.tobytes()
+                f.write(blob + b"\0" * (-len(blob) % 8))
+        os.replace(tmp_path, index_file)
+
+
+class BM25Index:
+    """
+    Read-only BM25 index over the article sections of the Summa
+
+    The file is memory-mapped and every posting list and document column is a
+    zero-copy memoryview into it, so opening the index is cheap and several
+    processes can share it. Queries are scored a batch at a time with NumPy
+    over the same mapped arrays (see search_batch).
+
+    Parameters:
+    - index_file: File written by build_index (default: DEFAULT_INDEX_FILE)
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE):
+        self.index_file = index_file
+        self.file = open(index_file, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{index_file} is not a BM25 index this version can read")
+        header = json.loads(self.map[PREAMBLE.size:PREAMBLE.size + header_length])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{index_file} was built on a machine with a different byte order")
+
+        self.header = header
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self.num_docs = header["num_docs"]
+        self.avgdl = header["avgdl"] or 1.0
+        self.terms = header["terms"]
+        self.deleted = frozenset(header["deleted"])  # Documents replaced by a later update
+        data = memoryview(self.map)[PREAMBLE.size + header_length:]
+        self.columns = {}
+        for name, (position, typecode, count) in header["blobs"].items():
+            size = array(typecode).itemsize
+            self.columns[name] = data[position:position + count * size].cast(typecode)
+
+        self.arrays = {name: np.frombuffer(column, dtype=column.format) for name, column in self.columns.items()}
+
+        # Per-document part of the BM25 denominator, computed once
+        self.norms = self.k1 * (1 - self.b + self.b * self.arrays["length"] / self.avgdl)
+        # Document ids run past num_docs once an update has replaced some of them
+        self.live = np.ones(len(self.norms), dtype=bool)
+        self.live[list(self.deleted)] = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.columns = {}
+        self.arrays = {}
+        self.norms = self.live = None
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # Arrays handed out are still alive; the map goes once they do
+        self.file.close()
+
+    def idf(self, term):
+        """Returns the BM25 inverse document frequency of a term (0 if it isn't indexed)"""
+        entry = self.terms.get(term)
+        if entry is None:
+            return 0.0
+        df = entry[2]
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def vectorize(self, queries):
+        """
+        Returns (query ids, term weights, posting starts, posting ends) arrays for a batch of queries
+
+        There is one entry per distinct indexed term of each query, weighted by
+        its idf and by how often the query repeats it.
+        """
+        query_ids, weights, starts, ends = [], [], [], []
+        for query_id, query in enumerate(queries):
+            for term, count in Counter(tokenize(query)).items():
+                entry = self.terms.get(term)
+                if entry is None:
+                    continue
+                start, length, _ = entry
+                query_ids.append(query_id)
+                weights.append(self.idf(term) * (self.k1 + 1) * count)
+                starts.append(start)
+                ends.append(start + length)
+        return (np.array(query_ids, dtype=np.int64), np.array(weights, dtype=np.float64),
+                np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64))
+
+    def score_batch(self, queries):
+        """
+        Returns the (queries, document ids) matrix of BM25 scores of a batch of queries
+
+        The postings of every query term are gathered at once, and their
+        contributions summed into their (query, document) cells in one bincount.
+        """
+        query_ids, weights, starts, ends = self.vectorize(queries)
+        positions, owners = range_positions(starts, ends)
+        doc_ids = self.arrays["doc_ids"][positions].astype(np.int64)
+        tfs = self.arrays["tfs"][positions].astype(np.float64)
+        contributions = weights[owners] * tfs / (tfs + self.norms[doc_ids])
+        num_ids = len(self.norms)
+        cells = query_ids[owners] * num_ids + doc_ids
+        scores = np.bincount(cells, weights=contributions, minlength=len(queries) * num_ids)
+        return scores.reshape(len(queries), num_ids)
+
+    def doc(self, doc_id, score=0.0):
+        """Returns the Hit for a document id"""
+        c = self.columns
+        return Hit(score, PARTS[c["part"][doc_id]], c["question"][doc_id], c["article"][doc_id],
+                   SECTION_KINDS[c["kind"][doc_id]], c["index"][doc_id] or None)
+
+    def search_batch(self, queries, k=10, parts=None):
+        """
+        Returns the top-k sections of every query as lists of Hits, best first
+
+        Queries are scored BATCH_SIZE at a time, each batch in one score_batch
+        call, so a burst of queries costs a few array passes rather than a
+        Python loop over every posting of every query.
+
+        Parameters:
+        - queries: List of free-text questions
+        - k: Number of results per query (default: 10)
+        - parts: Only return sections of these parts (default: None, all)
+        """
+        allowed = self.live
+        if parts is not None:
+            allowed = allowed & np.isin(self.arrays["part"], [PARTS.index(part) for part in parts])
+        results = []
+        for chunk in batch_chunks(queries):
+            scores = self.score_batch(chunk)
+            for row_scores, best in zip(scores, top_rows(scores, k, allowed)):
+                results.append([self.doc(int(doc_id), float(row_scores[doc_id])) for doc_id in best])
+        return results
+
+    def search(self, query, k=10, parts=None):
+        """
+        Returns the top-k sections for a query as Hits, best first
+
+        Parameters:
+        - query: Free-text question, e.g. "Whether God exists?"
+        - k: Number of results (default: 10)
+        - parts: Only return sections of these parts (default: None, all)
+        """
+        return self.search_batch([query], k, parts)[0]
+
+
+def range_positions(starts, ends):
+    """Returns the positions covered by the ranges [start, end) and which range each belongs to"""
+    lengths = ends - starts
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    if not len(owners):
+        return owners, owners
+    # Step by one within a range and jump to the next range's start between them
+    steps = np.ones(len(owners), dtype=np.int64)
+    filled = lengths > 0
+    firsts = np.cumsum(lengths)[filled] - lengths[filled]
+    steps[firsts] = starts[filled] - np.append(0, ends[filled][:-1] - 1)
+    return np.cumsum(steps), owners
+
+def batch_chunks(items):
+    """Splits a batch into chunks whose score matrices stay cache-sized"""
+    for i in range(0, len(items), BATCH_SIZE):
+        yield items[i:i + BATCH_SIZE]
+
+def top_rows(scores, k, allowed=None):
+    """
+    Returns, for every row of a score matrix, the columns of its k best positive scores, best first
+
+    allowed optionally masks out the columns that may not be returned.
+    """
+    if allowed is not None:
+        scores = np.where(allowed, scores, 0.0)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [[] for _ in scores]
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable"), axis=1)
+    return [row[row_scores[row] > 0] for row, row_scores in zip(best, scores)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index over the Summa")
+    parser.add_argument("--index", default=DEFAULT_INDEX_FILE, help=f"Index file (default: {DEFAULT_INDEX_FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index Summa*.txt files")
+    build.add_argument("text_files", nargs="+")
+    commands.add_parser("update", help="Re-index only the articles that changed since the last build")
+    search = commands.add_parser("search", help="Print the best sections for a query")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(args.text_files, args.index)
+        print(f"Indexed {count} sections -> {args.index}")
+    elif args.command == "update":
+        count = update_index(args.index)
+        print(f"Re-indexed {count} changed article(s) in {args.index}")
+    else:
+        with BM25Index(args.index) as index:
+            for hit in index.search(args.query, args.k):
+                where = f"{hit.part} Q{hit.question} A{hit.article} {hit.kind}{' ' + str(hit.index) if hit.index else ''}"
+                print(f"{hit.score:7.3f}  {where}")
@@ -1,73 +1,241 @@
-import requests
-from bs4 import BeautifulSoup
-import time
+import argparse
 import os
 import re
-import random
-
-def get_default_end_question(part):
-    """Returns the default end question number based on the part of the Summa"""
-    part_question_counts = {
-        "I": 119,      # Prima Pars has 119 questions
-        "II-I": 114,   # Prima Secundae has 114 questions
-        "II-II": 189,  # Secunda Secundae has 189 questions
-        "III": 90      # Tertia Pars has 90 questions
-    }
-    return part_question_counts.get(part, 119)  # Default to 119 if part not found
-
-def get_article_count(part, question):
-    """Returns known article counts for specific questions"""
-    special_cases = {
-        "I": {
-            119: 2,    # Question 119 in Prima Pars has 2 articles
-        },
-        "II-I": {
-            114: 10,   # Question 114 in Prima Secundae has 10 articles
-        },
-        "II-II": {
-            189: 10,   # Question 189 in Secunda Secundae has 10 articles
-        },
-        "III": {
-            90: 4,     # Question 90 in Tertia Pars has 4 articles
-        }
-    }
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from cache import DEFAULT_CACHE_DIR, ResponseCache
+from corpus import (PLACEHOLDER, QUESTION_HEADER, convert_summa, corpus_path_for, fingerprint, is_article_title,
+                    read_paragraphs, split_units)
+from crossrefs import DEFAULT_GRAPH_FILE, graph_sources, update_graph
+from dedup import NearDuplicateFilter
+from extract import extract_page
+from fetch import MISSING_STATUSES, FetchEngine
+from frames import FrameWriter, export_text, frames_path_for, write_frames
+from journal import ScrapeJournal
+from metrics import ScrapeMetrics
+from offsets import build_offsets, offsets_path_for, recorded_regions
+from parts import (ARTICLE_COUNTS_FILE, get_article_count, get_default_end_question, get_part_subtitle,
+                   get_part_title, get_part_url_format, part_from_title, record_article_counts)
+from pipeline import ordered_pipeline
+from retrieval import DEFAULT_INDEX_FILE, index_sources, update_index
+
+try:
+    from similarity import DEFAULT_MATRIX_FILE, matrix_sources, update_matrix
+except ImportError:  # NumPy isn't installed, so there is no matrix to refresh either
+    update_matrix = None
+
+# Root of the aquinas.cc reader; page paths like ~ST.I.Q1.A1 are appended to it
+BASE_URL = "https://aquinas.cc/la/en/"
+
+# Numbered entries of a question's points of inquiry, e.g. "(3) Whether..." or "3. Whether..."
+INQUIRY_ITEM = re.compile(r'^(\(\d+\)|\d+\.)')
+
+# Article requests in flight per question while probing for its article count,
+# and the article after which probing gives up (I Q14 has the most, 16)
+PROBE_WINDOW = 2
+PROBE_LIMIT = 40
+
+# Parser processes started when the caller doesn't say; parsing a page takes a
+# fraction of fetching it, so a couple keep up with the network
+DEFAULT_PARSE_WORKERS = 2
+
+def render_prologue(html):
+    """Returns the PROLOGUE block of a part page, or an empty string if there is none"""
+    page = extract_page(html)
     
-    if part in special_cases and question in special_cases[part]:
-        return special_cases[part][question]
-    return None  # No special case
-
-def get_part_url_format(part):
-    """Returns the correct URL format for the given part"""
-    # The website uses different formats for different parts
-    part_formats = {
-        "I": "I",           # Prima Pars: ST.I.Q1
-        "II-I": "I-II",     # Prima Secundae: ST.I-II.Q1 (not ST.II-I.Q1)
-        "II-II": "II-II",   # Secunda Secundae: ST.II-II.Q1
-        "III": "III"        # Tertia Pars: ST.III.Q1
-    }
-    return part_formats.get(part, part)
-
-def get_part_title(part):
-    """Returns the title for the given part"""
-    part_titles = {
-        "I": "FIRST PART",
-        "II-I": "FIRST PART OF THE SECOND PART",
-        "II-II": "SECOND PART OF THE SECOND PART",
-        "III": "THIRD PART"
-    }
-    return part_titles.get(part, f"PART {part}")
-
-def get_part_subtitle(part):
-    """Returns the subtitle for the given part"""
-    part_subtitles = {
-        "I": "SACRED DOCTRINE",
-        "II-I": "MAN'S LAST END",
-        "II-II": "FAITH, HOPE, AND CHARITY",
-        "III": "THE INCARNATION"
-    }
-    return part_subtitles.get(part, "")
+    # Look for prologue content
+    prologue_content = []
+    
+    # Find all content paragraphs before the first question
+    for text in page.texts():
+        if "question 1" in text.lower() or "q1" in text.lower():
+            break
+        if text and len(text) > 20 and "PART" not in text.upper() and not text.startswith("ST."):
+            prologue_content.append(text)
+    
+    # If we found prologue content, write it
+    if not prologue_content:
+        return ""
+    out = ["PROLOGUE\n\n"]
+    for text in prologue_content:
+        out.append(f"{text}\n\n")
+    return "".join(out)
 
-def scrape_summa(output_file, part="I", start_q=1, end_q=None, delay=0, verbose=False):
+def render_question(html, part, q_num, end_q, verbose=False, manifest_file=ARTICLE_COUNTS_FILE, repeat_title=True):
+    """
+    Renders the header block of a question page and works out its article count
+
+    The count comes from get_article_count (special cases, then the manifest of
+    counts learned by earlier scrapes, unless manifest_file is None), then from
+    the page. If neither tells, it is None and scrape_summa probes for it (see
+    probe_articles).
+
+    The title is written under the question number and, as the scraper always
+    has, once more at the top of the description; repeat_title=False leaves
+    out the second copy (scrape_summa does when deduplicating).
+
+    Returns a (text, num_articles) tuple, where text starts with the "Question N" line.
+    """
+    url_part = get_part_url_format(part)
+    
+    # Parse the main question page
+    page = extract_page(html)
+    
+    # Write question header
+    out = [f"Question {q_num}\n"]
+    
+    # Extract the question title
+    question_title = page.first("t-r")
+    if question_title is not None:
+        out.append(f"{question_title}\n\n")
+    
+    # Get the question description and points of inquiry
+    description_paras = []
+    inquiry_header = None
+    inquiry_items = []
+    
+    # Examine each content element
+    for text in page.texts():
+        if not text:
+            continue
+        
+        # The title was already written under the question number
+        if text == question_title and not repeat_title:
+            continue
+        
+        # Skip elements that are likely not part of the description
+        if "article" in text.lower() and len(text) < 30:
+            continue
+            
+        # Check if this is an inquiry list header
+        if ("points of inquiry" in text.lower() or "inquir" in text.lower()) and not inquiry_header:
+            inquiry_header = text
+            continue
+            
+        # Check if this is an inquiry list item
+        if inquiry_header and INQUIRY_ITEM.match(text):
+            inquiry_items.append(text)
+            continue
+            
+        # If we haven't found the inquiry header yet, this might be description text
+        if not inquiry_header and len(text) > 30 and not text.startswith("Article"):
+            description_paras.append(text)
+    
+    # Write the description paragraphs
+    for para in description_paras:
+        out.append(f"{para}\n\n")
+    
+    # Write the inquiry header and items
+    if inquiry_header:
+        out.append(f"{inquiry_header}\n\n")
+        for item in inquiry_items:
+            out.append(f"{item}\n")
+        out.append("\n")
+    
+    # Now determine how many articles are in this question
+    # First check if this is a special case with known article count
+    known_article_count = get_article_count(part, q_num, manifest_file)
+    
+    if known_article_count:
+        num_articles = known_article_count
+        if verbose:
+            print(f"  Using known article count for Q{q_num}: {num_articles} articles")
+    else:
+        # Try to detect the number of articles from links, headings and text
+        article_nums = page.article_numbers(url_part, q_num)
+        
+        # Determine the number of articles
+        if article_nums:
+            num_articles = max(article_nums)
+            if verbose:
+                print(f"  Detected {num_articles} articles: {sorted(article_nums)}")
+        else:
+            # Probe instead of guessing: requests stop at the first article that 404s
+            num_articles = None
+            if verbose:
+                print("  Could not detect articles, probing for them")
+    
+    # Special handling for the last questions of each part
+    if q_num == end_q:
+        # Last question of each part needs special attention
+        if verbose:
+            print(f"  Special handling for last question {q_num} of part {part}")
+        # For II-II Q189, ensure we get all 10 articles
+        if part == "II-II" and q_num == 189:
+            num_articles = 10
+        # For III Q90, ensure we get all 4 articles
+        elif part == "III" and q_num == 90:
+            num_articles = 4
+    
+    return "".join(out), num_articles
+
+def render_article(html, article_num, verbose=False):
+    """Renders an article page as the "Article N" block written to the output file"""
+    page = extract_page(html)
+    
+    # Write article header
+    out = [f"Article {article_num}\n"]
+    
+    # Extract article title
+    article_title = page.first("t-s")
+    if article_title is not None:
+        out.append(f"{article_title}\n\n")
+    else:
+        # Try alternate ways to find the title
+        for cls in ["t-h", "t-o"]:  # Try other class types
+            title = page.first(cls)
+            if title:
+                article_title = title
+                out.append(f"{article_title}\n\n")
+                break
+    
+    # Get all content elements for this article
+    content_texts = page.texts()
+    
+    # Track which texts we've already processed to avoid duplication
+    processed_texts = set()
+    
+    # Process the article content in order, keeping original formatting
+    for text in content_texts:
+        if not text or len(text) < 15 or text in processed_texts:
+            continue
+            
+        # Skip article title or headers
+        if (article_title and text == article_title) or text.startswith(f"Article {article_num}"):
+            continue
+        
+        # Write the text as it appears
+        out.append(f"{text}\n\n")
+        processed_texts.add(text)
+    
+    # Fallback for rare cases: if we didn't get any content, try extracting direct from HTML
+    if len(processed_texts) == 0:
+        if verbose:
+            print("    WARNING: No content found, trying direct HTML extraction")
+        
+        for text in page.paragraphs:
+            if text and len(text) > 20 and text not in processed_texts:
+                out.append(f"{text}\n\n")
+                processed_texts.add(text)
+        
+        # If still no content, try extracting any text blocks
+        if len(processed_texts) == 0:
+            all_text = page.all_text()
+            lines = [line.strip() for line in all_text.split('\n') if line.strip()]
+            
+            # Look for substantive paragraphs (not navigation or headers)
+            for line in lines:
+                if len(line) > 50 and line not in processed_texts:
+                    out.append(f"{line}\n\n")
+                    processed_texts.add(line)
+    
+    return "".join(out)
+
+def scrape_summa(output_file, part="I", start_q=1, end_q=None, delay=0, verbose=False,
+                 workers=1, rate=None, base_url=BASE_URL, cache_dir=None, offline=False, resume=True,
+                 parse_workers=None, corpus_file=None, dedup=None, metrics=None, article_counts=None, keep_text=True):
     """
     Scrape the Summa Theologica from Aquinas.cc preserving the exact format
     
@@ -76,16 +244,58 @@ def scrape_summa(output_file, part="I", start_q=1, end_q=None, delay=0, verbose=
     - part: Part of the Summa ("I" for Prima Pars, "II-I" for Prima Secundae, etc.)
     - start_q: First question to scrape
     - end_q: Last question to scrape (defaults to max questions for the selected part)
-    - delay: Seconds to wait between requests (default: 0)
+    - delay: Minimum seconds between requests to the site, used when no rate is given (default: 0)
     - verbose: Whether to print detailed progress messages (default: False)
+    - workers: Number of requests kept in flight at once (default: 1)
+    - rate: Maximum requests per second to the site (default: None, derived from delay)
+    - base_url: Site root the ~ST.* page paths are appended to (default: BASE_URL)
+    - cache_dir: Directory of the on-disk response cache (default: None, no caching)
+    - offline: Rebuild the output purely from the cache without any network requests (default: False)
+    - resume: Continue an interrupted run of the same scrape from its journal (default: True)
+    - parse_workers: Number of parser processes (default: None, DEFAULT_PARSE_WORKERS or one per
+      core if there are fewer; 0 parses inline)
+    - corpus_file: Where to write the structured JSONL corpus (default: None, next to the output file)
+    - dedup: "flag" to report paragraphs that nearly repeat earlier ones, "drop" to leave them
+      out as well (default: None, no checking; see filter_block)
+    - metrics: ScrapeMetrics to record request, retry, sleep, parse and per-question timings in
+      (default: None, a fresh one whose one-line report is printed at the end)
+    - article_counts: Manifest of article counts to read and extend with the ones this run confirms
+      (default: None, ARTICLE_COUNTS_FILE when scraping aquinas.cc itself, none for any other base_url)
+    - keep_text: Keep the plain output file once the run is over (default: True); without it
+      only the compressed frames stay, from which frames.export_text writes it back out
+    
+    Every unit is also compressed into the frame file next to the output
+    (see frames.FrameWriter) as soon as it is written.
+    
+    Progress is checkpointed in a journal next to the output file (see
+    ScrapeJournal), so a crashed run restarts at the first unit it hadn't
+    finished instead of from scratch.
+    
+    The output is identical for any number of workers: pages are fetched
+    concurrently, parsed in a process pool (see ordered_pipeline) and always
+    written in question/article order.
     """
     # Set default end question based on the part if not specified
     if end_q is None:
         end_q = get_default_end_question(part)
     
+    # The fixed delay between requests becomes a per-host rate budget
+    if rate is None and delay > 0:
+        rate = 1.0 / delay
+    
+    # Offline replay always needs a cache to read from
+    if offline and cache_dir is None:
+        cache_dir = DEFAULT_CACHE_DIR
+    cache = ResponseCache(cache_dir) if cache_dir else None
+    
     # Get the correct URL format for the part
     url_part = get_part_url_format(part)
     
+    metrics = metrics or ScrapeMetrics()
+    
+    # Counts learned from a stand-in server say nothing about the real site
+    manifest_file = article_counts or (ARTICLE_COUNTS_FILE if base_url == BASE_URL else None)
+    
     # Create directory for output file if it doesn't exist
     os.makedirs(os.path.dirname(output_file) if os.path.dirname(output_file) else '.', exist_ok=True)
 
@@ -97,315 +307,551 @@ def scrape_summa(output_file, part="I", start_q=1, end_q=None, delay=0, verbose=
         print(f"Starting scrape for part: {part} ({part_title})")
         print(f"Using URL part format: {url_part}")
         print(f"Questions range: {start_q} to {end_q}")
+        print(f"Concurrent requests: {workers}, rate limit: {rate or 'none'} req/s")
+        if cache:
+            print(f"Response cache: {os.path.abspath(cache_dir)}{' (offline replay)' if offline else ''}")
+
+    # Pick up where an interrupted run of the same scrape left off
+    journal = ScrapeJournal(ScrapeJournal.path_for(output_file))
+    run = {"part": part, "start_q": start_q, "end_q": end_q}
+    if dedup:
+        run["dedup"] = dedup  # Deduplicated output differs, so it never resumes a plain run or the other way round
+    last_unit = journal.resume_point(run) if resume and os.path.exists(output_file) else None
+    first_q, first_article, resumed_articles = start_q, 1, 0
+    if last_unit:
+        with open(output_file, "r+b") as f:
+            f.truncate(last_unit["end"])  # Drop anything written after the last journaled unit
+        if last_unit["q"] > 0:
+            question_unit = [u for u in journal.units() if u["q"] == last_unit["q"] and u["a"] == 0][-1]
+            resumed_articles = question_unit.get("articles", 0)
+            if last_unit["a"] < resumed_articles:
+                first_q, first_article = last_unit["q"], last_unit["a"] + 1
+            else:
+                first_q = last_unit["q"] + 1
+        print(f"Resuming {output_file} from Question {first_q}, Article {first_article}")
+        journal.reopen()
+    else:
+        journal.start(run)
+
+    # Paragraphs seen so far, across questions; a resumed run relearns the ones already written
+    seen = NearDuplicateFilter() if dedup else None
+    if seen is not None and last_unit:
+        for _, _, paragraph in read_paragraphs(output_file):
+            seen.add(paragraph)
 
     # Open the output file
-    with open(output_file, "w", encoding="utf-8") as f:
-        # Write title
-        f.write(f"SUMMA THEOLOGIAE {part_title}\n\n")
-        
-        # Write subtitle
-        f.write(f"{part_subtitle}\n\n")
+    # Parsing runs in its own processes so it overlaps with the network waits
+    if parse_workers is None:
+        parse_workers = min(DEFAULT_PARSE_WORKERS, os.cpu_count() or 1)
+    
+    with (ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else nullcontext()) as parser_pool, \
+            FetchEngine(workers=workers, rate=rate, verbose=verbose, cache=cache, offline=offline,
+                        metrics=metrics) as engine, \
+            FrameWriter(frames_path_for(output_file), part) as frames, \
+            open(output_file, "a" if last_unit else "w", encoding="utf-8") as f:
+        if last_unit:
+            # The frame file is only complete once a run finishes, so a resumed run compresses what is there again
+            with open(output_file, encoding="utf-8", newline="") as existing:
+                for q, a, unit in split_units(existing.read()):
+                    frames.add(q, a, unit)
+
+        def write_unit(text, q, a, ok=True, **extra):
+            # Flush before journaling so the recorded offset is really on disk
+            f.write(text)
+            f.flush()
+            frames.add(q, a, text)
+            if not ok:
+                extra["ok"] = False
+            journal.record(q, a, f.tell(), hash=fingerprint(text), **extra)
+
+        def write_block(text, q, a, ok=True, followed=False, **extra):
+            if seen is not None and ok:
+                text, repeats = filter_block(text, seen, (q, a), dedup, verbose, followed)
+                if repeats:
+                    extra["repeats"] = repeats
+            write_unit(text, q, a, ok, **extra)
+
+        if not last_unit:
+            # Write title
+            header = [f"SUMMA THEOLOGIAE {part_title}\n\n"]
+            
+            # Write subtitle
+            header.append(f"{part_subtitle}\n\n")
+            
+            # If this is the first question of the part, try to get the prologue
+            if start_q == 1:
+                try:
+                    # Try to get the part prologue
+                    part_url = f"{base_url}~ST.{url_part}"
+                    with metrics.phase("prologue"):
+                        resp = engine.get(part_url, timeout=60)
+                    if resp.status_code == 200:
+                        header.append(render_prologue(resp.text))
+                except Exception as e:
+                    if verbose:
+                        print(f"Error getting prologue: {str(e)}")
+            write_unit("".join(header), 0, 0)
+
+        print(f"Scraping Summa Theologica Part {part}, Questions {start_q}-{end_q}...")
+
+        # First pass: fetch every question page to learn the article counts
+        questions = []
+        if first_article > 1:
+            # The header of a half-finished question is already in the file
+            questions.append((first_q, None, resumed_articles, first_article, True))
+            first_q += 1
+        q_nums = list(range(first_q, end_q + 1))
+        question_urls = [f"{base_url}~ST.{url_part}.Q{q_num}" for q_num in q_nums]
         
-        # If this is the first question of the part, try to get the prologue
-        if start_q == 1:
-            try:
-                # Try to get the part prologue
-                part_url = f"https://aquinas.cc/la/en/~ST.{url_part}"
-                resp = requests.get(part_url, timeout=60)
-                if resp.status_code == 200:
-                    soup = BeautifulSoup(resp.text, "html.parser")
-                    
-                    # Look for prologue content
-                    prologue_content = []
-                    
-                    # Find all content paragraphs before the first question
-                    for element in soup.find_all("vl-c", class_=lambda c: c and c.startswith("c2-2")):
-                        text = element.text.strip()
-                        if "question 1" in text.lower() or "q1" in text.lower():
-                            break
-                        if text and len(text) > 20 and "PART" not in text.upper() and not text.startswith("ST."):
-                            prologue_content.append(text)
-                    
-                    # If we found prologue content, write it
-                    if prologue_content:
-                        f.write("PROLOGUE\n\n")
-                        for text in prologue_content:
-                            f.write(f"{text}\n\n")
-            except Exception as e:
+        def fetched_questions():
+            for q_num, question_url, future in zip(q_nums, question_urls, engine.fetch_ordered(question_urls, timeout=90)):
                 if verbose:
-                    print(f"Error getting prologue: {str(e)}")
+                    print(f"Scraping Question {q_num} from Part {part}...")
+                    print(f"  Accessing URL: {question_url}")
+                yield fetch_result(future), part, q_num, end_q, verbose, manifest_file, not dedup
+        
+        parsed = ordered_pipeline(fetched_questions(), question_block, parser_pool, on_parsed=metrics.observe_parse)
+        with metrics.phase("questions"):
+            for q_num, (text, num_articles, ok) in zip(q_nums, parsed):
+                questions.append((q_num, text, num_articles, 1, ok))
 
-        print(f"Scraping Summa Theologica Part {part}, Questions {start_q}-{end_q}...")
+        # Questions whose pages don't tell their article count are probed first, so
+        # their counts are known (and journaled) before anything of theirs is written
+        probed = {q_num: (f"{base_url}~ST.{url_part}.Q{q_num}", first)
+                  for q_num, _, num_articles, first, _ in questions if num_articles is None}
+        with metrics.phase("probe"):
+            probes, confirmed = probe_articles(engine, probed, verbose=verbose) if probed else ({}, set())
+        # Only counts the site confirmed from the first article on are worth keeping
+        learned = {q_num: len(found) for q_num, found in probes.items()
+                   if found and q_num in confirmed and probed[q_num][1] == 1}
+        questions = [(q_num, text, first - 1 + len(probes[q_num]) if q_num in probes else num_articles, first, ok)
+                     for q_num, text, num_articles, first, ok in questions]
 
-        for q_num in range(start_q, end_q + 1):
-            if verbose:
-                print(f"Scraping Question {q_num} from Part {part}...")
-            
-            # Get the question page
-            question_url = f"https://aquinas.cc/la/en/~ST.{url_part}.Q{q_num}"
-            if verbose:
-                print(f"  Accessing URL: {question_url}")
-                
-            try:
-                # Add user agent and vary request patterns to avoid blocking
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8"
-                }
-                response = requests.get(question_url, headers=headers, timeout=90)
-                
-                if response.status_code == 200:
-                    # Parse the main question page
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    
-                    # Write question header
-                    f.write(f"Question {q_num}\n")
-                    
-                    # Extract the question title
-                    question_title = None
-                    title_elem = soup.find("vl-c", class_=lambda c: c and "t-r" in c and c.startswith("c2-2"))
-                    if title_elem:
-                        question_title = title_elem.text.strip()
-                        f.write(f"{question_title}\n\n")
-                    
-                    # Get the question description and points of inquiry
-                    description_paras = []
-                    inquiry_header = None
-                    inquiry_items = []
-                    
-                    # Examine each content element
-                    for element in soup.find_all("vl-c", class_=lambda c: c and c.startswith("c2-2")):
-                        text = element.text.strip()
-                        if not text:
-                            continue
-                        
-                        # Skip elements that are likely not part of the description
-                        if "article" in text.lower() and len(text) < 30:
-                            continue
-                            
-                        # Check if this is an inquiry list header
-                        if ("points of inquiry" in text.lower() or "inquir" in text.lower()) and not inquiry_header:
-                            inquiry_header = text
-                            continue
-                            
-                        # Check if this is an inquiry list item
-                        if inquiry_header and (re.match(r'^\(\d+\)', text) or re.match(r'^\d+\.', text)):
-                            inquiry_items.append(text)
-                            continue
-                            
-                        # If we haven't found the inquiry header yet, this might be description text
-                        if not inquiry_header and len(text) > 30 and not text.startswith("Article"):
-                            description_paras.append(text)
-                    
-                    # Write the description paragraphs
-                    for para in description_paras:
-                        f.write(f"{para}\n\n")
-                    
-                    # Write the inquiry header and items
-                    if inquiry_header:
-                        f.write(f"{inquiry_header}\n\n")
-                        for item in inquiry_items:
-                            f.write(f"{item}\n")
-                        f.write("\n")
-                    
-                    # Now determine how many articles are in this question
-                    # First check if this is a special case with known article count
-                    known_article_count = get_article_count(part, q_num)
-                    
-                    if known_article_count:
-                        num_articles = known_article_count
-                        if verbose:
-                            print(f"  Using known article count for Q{q_num}: {num_articles} articles")
-                    else:
-                        # Try to detect the number of articles
-                        article_nums = set()
-                        
-                        # Check for article links
-                        article_pattern = re.compile(f"ST\\.{re.escape(url_part)}\\.Q{q_num}\\.A(\\d+)")
-                        for link in soup.find_all("a", href=lambda href: href and article_pattern.search(href)):
-                            match = article_pattern.search(link['href'])
-                            if match:
-                                article_nums.add(int(match.group(1)))
-                        
-                        # Check for article headers in the content
-                        for header in soup.find_all("vl-c", class_=lambda c: c and "t-i" in c and c.startswith("c2-2")):
-                            match = re.search(r'Article (\d+)', header.text)
-                            if match:
-                                article_nums.add(int(match.group(1)))
-                        
-                        # Additional check for links in the text
-                        for element in soup.find_all(string=re.compile(r'Article \d+')):
-                            matches = re.findall(r'Article (\d+)', element)
-                            for match in matches:
-                                article_nums.add(int(match))
-                        
-                        # Determine the number of articles
-                        if article_nums:
-                            num_articles = max(article_nums)
-                            if verbose:
-                                print(f"  Detected {num_articles} articles: {sorted(article_nums)}")
-                        else:
-                            # If we're at the last question, it might have more articles
-                            if q_num == end_q:
-                                num_articles = 10  # Assume 10 articles for the last question if we can't detect
-                            else:
-                                num_articles = 4  # Default for most questions
-                            if verbose:
-                                print(f"  Could not detect articles, using default: {num_articles}")
-                    
-                    # Special handling for the last questions of each part
-                    if q_num == end_q:
-                        # Last question of each part needs special attention
-                        if verbose:
-                            print(f"  Special handling for last question {q_num} of part {part}")
-                        # For II-II Q189, ensure we get all 10 articles
-                        if part == "II-II" and q_num == 189:
-                            num_articles = 10
-                        # For III Q90, ensure we get all 4 articles
-                        elif part == "III" and q_num == 90:
-                            num_articles = 4
-                    
-                    # Process each article with improved robustness
-                    for article_num in range(1, num_articles + 1):
-                        article_url = f"https://aquinas.cc/la/en/~ST.{url_part}.Q{q_num}.A{article_num}"
-                        
-                        if verbose:
-                            print(f"    Processing Article {article_num} from {article_url}")
-                        
-                        retry_count = 0
-                        max_retries = 7  # More retries for reliability
-                        article_retrieved = False
-                        
-                        while not article_retrieved and retry_count < max_retries:
-                            try:
-                                # Add varied user agent and add randomization to avoid blocking
-                                headers = {
-                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                                    "Accept-Language": "en-US,en;q=0.5"
-                                }
-                                
-                                # Random delay between 1-3 seconds to avoid rate limiting
-                                if retry_count > 0:
-                                    time.sleep(1 + random.random() * 2)
-                                
-                                article_resp = requests.get(article_url, headers=headers, timeout=120)  # Longer timeout
-                                
-                                if article_resp.status_code == 200:
-                                    article_retrieved = True
-                                    article_soup = BeautifulSoup(article_resp.text, "html.parser")
-                                    
-                                    # Write article header
-                                    f.write(f"Article {article_num}\n")
-                                    
-                                    # Extract article title
-                                    article_title = None
-                                    title_elem = article_soup.find("vl-c", class_=lambda c: c and "t-s" in c and c.startswith("c2-2"))
-                                    if title_elem:
-                                        article_title = title_elem.text.strip()
-                                        f.write(f"{article_title}\n\n")
-                                    else:
-                                        # Try alternate ways to find the title
-                                        for cls in ["t-h", "t-o"]:  # Try other class types
-                                            title_elem = article_soup.find("vl-c", class_=lambda c: c and cls in c and c.startswith("c2-2"))
-                                            if title_elem and title_elem.text.strip():
-                                                article_title = title_elem.text.strip()
-                                                f.write(f"{article_title}\n\n")
-                                                break
-                                    
-                                    # Get all content elements for this article
-                                    content_elements = article_soup.find_all("vl-c", class_=lambda c: c and c.startswith("c2-2"))
-                                    
-                                    # Track which texts we've already processed to avoid duplication
-                                    processed_texts = set()
-                                    
-                                    # Process the article content in order, keeping original formatting
-                                    for element in content_elements:
-                                        text = element.text.strip()
-                                        if not text or len(text) < 15 or text in processed_texts:
-                                            continue
-                                            
-                                        # Skip article title or headers
-                                        if (article_title and text == article_title) or text.startswith(f"Article {article_num}"):
-                                            continue
-                                        
-                                        # Write the text as it appears
-                                        f.write(f"{text}\n\n")
-                                        processed_texts.add(text)
-                                    
-                                    # Fallback for rare cases: if we didn't get any content, try extracting direct from HTML
-                                    if len(processed_texts) == 0:
-                                        if verbose:
-                                            print(f"    WARNING: No content found, trying direct HTML extraction")
-                                        
-                                        paragraphs = article_soup.select("div.body div.content p")
-                                        for p in paragraphs:
-                                            text = p.text.strip()
-                                            if text and len(text) > 20 and text not in processed_texts:
-                                                f.write(f"{text}\n\n")
-                                                processed_texts.add(text)
-                                        
-                                        # If still no content, try extracting any text blocks
-                                        if len(processed_texts) == 0:
-                                            all_text = article_soup.get_text()
-                                            lines = [line.strip() for line in all_text.split('\n') if line.strip()]
-                                            
-                                            # Look for substantive paragraphs (not navigation or headers)
-                                            for line in lines:
-                                                if len(line) > 50 and line not in processed_texts:
-                                                    f.write(f"{line}\n\n")
-                                                    processed_texts.add(line)
-                                
-                                elif article_resp.status_code == 429:  # Too Many Requests
-                                    retry_count += 1
-                                    if verbose:
-                                        print(f"    Rate limited (429). Retry {retry_count}: waiting longer")
-                                    time.sleep(5 + random.random() * 5)  # Wait 5-10 seconds
-                                else:
-                                    retry_count += 1
-                                    if verbose:
-                                        print(f"    Retry {retry_count}: Failed to access Article {article_num}, status code: {article_resp.status_code}")
-                                    time.sleep(2 + random.random() * 3)  # Wait 2-5 seconds
-                            except Exception as e:
-                                retry_count += 1
-                                if verbose:
-                                    print(f"    Retry {retry_count}: Error processing Article {article_num}: {str(e)}")
-                                time.sleep(2 + random.random() * 3)  # Wait 2-5 seconds
-                        
-                        # If we couldn't retrieve the article
-                        if not article_retrieved:
-                            if verbose:
-                                print(f"    ERROR: Failed to retrieve Article {article_num} after {max_retries} attempts")
-                            f.write(f"*Content could not be retrieved for Article {article_num}*\n\n")
-                        
-                        # Delay between article requests
-                        if delay > 0:
-                            jittered_delay = delay * (0.8 + 0.4 * random.random())  # 80-120% of specified delay
-                            time.sleep(jittered_delay)
+        # Second pass: fetch all the other articles and write everything in order
+        article_urls = [
+            f"{base_url}~ST.{url_part}.Q{q_num}.A{article_num}"
+            for q_num, _, num_articles, first, _ in questions if q_num not in probes
+            for article_num in range(first, num_articles + 1)
+        ]
+        
+        def fetched_articles():
+            futures = engine.fetch_ordered(article_urls, max_retries=7, timeout=120)
+            for q_num, _, num_articles, first, _ in questions:
+                if q_num in probes:
+                    results = probes.pop(q_num)  # Already fetched while probing
                 else:
+                    results = (fetch_result(next(futures)) for _ in range(first, num_articles + 1))
+                for article_num, result in enumerate(results, first):
+                    yield result, article_num, verbose
+        
+        articles = ordered_pipeline(fetched_articles(), article_block, parser_pool, on_parsed=metrics.observe_parse)
+        with metrics.phase("articles"):
+            question_start = time.monotonic()
+            for q_num, text, num_articles, first, ok in questions:
+                if text is not None:
+                    write_block(text, q_num, 0, ok, articles=num_articles)
+                written = 0
+                for article_num in range(first, num_articles + 1):
                     if verbose:
-                        print(f"  ERROR: Failed to access Question {q_num}, status code: {response.status_code}")
-                    f.write(f"*Content could not be retrieved for Question {q_num}*\n\n")
-            except Exception as e:
-                if verbose:
-                    print(f"  ERROR: Exception when accessing Question {q_num}: {str(e)}")
-                f.write(f"*Content could not be retrieved for Question {q_num} due to an error*\n\n")
-            
-            # Delay between question requests
-            if delay > 0:
-                jittered_delay = delay * (0.8 + 0.4 * random.random())  # 80-120% of specified delay
-                time.sleep(jittered_delay)
+                        print(f"    Processing Article {article_num} of Question {q_num}")
+                    text, ok = next(articles)
+                    if text is None:
+                        continue  # A known count said more articles than the site has
+                    # Only an article whose successor gets a block of its own can be cut where it runs on
+                    write_block(text, q_num, article_num, ok, followed=article_num < num_articles)
+                    written += 1
+                # Questions are written in order, so each one's time runs from the end of the previous one
+                now = time.monotonic()
+                metrics.observe_question(q_num, written, now - question_start)
+                question_start = now
+
+        if manifest_file:
+            record_article_counts(part, learned, manifest_file)
 
+        journal.finish()
+    
+    if seen is not None and seen.duplicates:
+        print(f"Near-duplicate paragraphs: {seen.duplicates} of {seen.checked} checked")
+    
+    corpus_file = corpus_file or corpus_path_for(output_file)
+    with metrics.phase("derived"):
+        count = write_derived_files(output_file, corpus_file, part, frames=False)
+    if keep_text:
         print(f"Scraping complete! Results saved to: {os.path.abspath(output_file)}")
+    else:
+        os.remove(output_file)
+        print(f"Scraping complete! Results saved to: {os.path.abspath(frames_path_for(output_file))}")
+    print(f"Structured corpus ({count} sections) saved to: {os.path.abspath(corpus_file)}")
+    print(metrics.report())
+
+def write_derived_files(output_file, corpus_file, part, frames=True):
+    """
+    Brings everything derived from an output file up to date so nothing downstream has to re-parse the text
+
+    The fingerprint of every question, taken from the journal's per-unit
+    hashes (see corpus.question_regions), is compared with the ones the
+    byte-offset sidecar recorded, and only the questions that changed are
+    parsed again: the structured JSONL corpus and the compressed frames copy
+    the others over from their previous version. The search index, the TF-IDF
+    matrix and the cross-reference graph, if they cover this file, then
+    process only the articles that changed (see update_index). frames=False
+    leaves the frames alone, for when they were written with the text.
+    Returns the number of sections in the corpus.
+    """
+    previous, text_mtime = recorded_regions(offsets_path_for(output_file)) or (None, None)
+
+    def written_from_previous(path):
+        # A file older than the text the sidecar was built from wasn't written from those regions
+        return previous if previous and os.path.exists(path) and os.path.getmtime(path) >= text_mtime else None
+
+    count = convert_summa(output_file, corpus_file, part, previous=written_from_previous(corpus_file))
+    if frames:
+        frames_file = frames_path_for(output_file)
+        write_frames(output_file, frames_file, part, previous=written_from_previous(frames_file))
+    build_offsets(output_file, part=part)  # Last, as it records the regions the others now match
+    text_file = os.path.abspath(output_file)
+    if text_file in index_sources(DEFAULT_INDEX_FILE):
+        update_index(DEFAULT_INDEX_FILE)
+    if update_matrix is not None and text_file in matrix_sources(DEFAULT_MATRIX_FILE):
+        update_matrix(DEFAULT_MATRIX_FILE)
+    if text_file in graph_sources(DEFAULT_GRAPH_FILE):
+        update_graph(DEFAULT_GRAPH_FILE)
+    return count
+
+def filter_block(text, seen, label, mode="flag", verbose=False, followed=False):
+    """
+    Runs the paragraphs of an output block through a NearDuplicateFilter
+
+    In "flag" mode the block is written as it is and repeats are only counted
+    (and printed when verbose). In "drop" mode paragraphs repeating earlier
+    ones are left out, and an article block that is followed by the next
+    article's own block (followed=True) is first cut off where its page runs
+    on into it. The last block of a question is never cut: when the article
+    count was under-detected, the articles after it only exist as that
+    spill-over (as corpus.article_count keeps them too).
+    Question blocks are only flagged: their introduction is often carried at
+    the end of the previous question's last article, so the copy seen first
+    is not the one to keep.
+
+    Returns (text, number of near-duplicate paragraphs).
+    """
+    paragraphs = text.split("\n\n")
+    q_num, article_num = label
+    if mode == "drop" and article_num and followed:
+        # Skip the header, and the title paragraph if it wasn't on the header line
+        first = 1 if "\n" in paragraphs[0] else 2
+        for i in range(first, len(paragraphs) - 1):
+            if is_article_title(paragraphs[i], paragraphs[i + 1]):
+                paragraphs = paragraphs[:i] + [""]
+                break
+
+    kept, repeats = [], 0
+    for paragraph in paragraphs:
+        original = seen.check(paragraph, label)
+        if original is None:
+            kept.append(paragraph)
+            continue
+        repeats += 1
+        if verbose:
+            (q, a), score = original
+            print(f"    Near-duplicate ({score:.2f}) of Question {q}, Article {a}: {paragraph[:60]}...")
+        if mode != "drop" or not article_num:
+            kept.append(paragraph)
+    return "\n\n".join(kept), repeats
+
+def fetch_result(future):
+    """
+    Resolves a fetch future into a picklable (status_code, html, error) tuple
+
+    html is only set for a 200 response and error only if the request raised, so
+    the result can be handed to a parser process instead of the response object.
+    """
+    try:
+        response = future.result()
+    except Exception as e:
+        return None, None, str(e)
+    return response.status_code, response.text if response.status_code == 200 else None, None
+
+def probe_articles(engine, questions, window=PROBE_WINDOW, verbose=False):
+    """
+    Fetches the articles of questions whose article count isn't known, up to the first one the site doesn't have
+
+    Each question has at most window article requests in flight, so probing
+    costs at most window - 1 requests past a question's last article, while
+    the questions themselves are probed concurrently. In offline mode an
+    article that isn't in the cache counts as missing from the site too.
+
+    Parameters:
+    - engine: FetchEngine to fetch with
+    - questions: {question number: (question URL, first article number)}
+    - window: Article requests in flight per question (default: PROBE_WINDOW)
+    - verbose: Whether to print detailed progress messages (default: False)
+
+    Returns (found, confirmed): found is {question number: [fetch_result of
+    each article from the first on]}, and confirmed the set of questions whose
+    end the site itself confirmed with a 404 or 410. A question that stopped at
+    an offline cache miss or at PROBE_LIMIT isn't confirmed, so its count can't
+    be trusted for later scrapes (see record_article_counts).
+    """
+    found = {q_num: [] for q_num in questions}
+    confirmed = set()
+    next_article = {q_num: first for q_num, (_, first) in questions.items()}
+    probing = list(questions)
+    while probing:
+        batch = [(q_num, next_article[q_num] + i) for q_num in probing for i in range(window)
+                 if next_article[q_num] + i <= PROBE_LIMIT]
+        urls = [f"{questions[q_num][0]}.A{article_num}" for q_num, article_num in batch]
+        ended = set()
+        for (q_num, article_num), future in zip(batch, engine.fetch_ordered(urls, max_retries=7, timeout=120)):
+            result = fetch_result(future)
+            if q_num in ended:
+                continue
+            if result[0] in MISSING_STATUSES or (engine.offline and result[0] == 504):
+                ended.add(q_num)
+                if not engine.offline:
+                    confirmed.add(q_num)
+                if verbose:
+                    print(f"  Question {q_num} has {article_num - 1} articles")
+                continue
+            found[q_num].append(result)
+        still_probing = []
+        for q_num in probing:
+            next_article[q_num] += window
+            if q_num in ended:
+                continue
+            if next_article[q_num] > PROBE_LIMIT:
+                print(f"Warning: stopped probing Question {q_num} at Article {PROBE_LIMIT}; "
+                      f"any articles after it are missing")
+                continue
+            still_probing.append(q_num)
+        probing = still_probing
+    return found, confirmed
+
+def question_block(result, part, q_num, end_q, verbose=False, manifest_file=ARTICLE_COUNTS_FILE, repeat_title=True):
+    """
+    Turns a fetched question page into its output block
+
+    Returns (text, num_articles, ok); num_articles is None if the page doesn't
+    tell it (see probe_articles). On failure text is the placeholder line and
+    there are no articles to fetch.
+    """
+    status_code, html, error = result
+    try:
+        if error is not None:
+            raise RuntimeError(error)
+        if status_code == 200:
+            text, num_articles = render_question(html, part, q_num, end_q, verbose, manifest_file, repeat_title)
+            return text, num_articles, True
+        if verbose:
+            print(f"  ERROR: Failed to access Question {q_num}, status code: {status_code}")
+        return f"*Content could not be retrieved for Question {q_num}*\n\n", 0, False
+    except Exception as e:
+        if verbose:
+            print(f"  ERROR: Exception when accessing Question {q_num}: {str(e)}")
+        return f"*Content could not be retrieved for Question {q_num} due to an error*\n\n", 0, False
+
+def article_block(result, article_num, verbose=False):
+    """
+    Turns a fetched article page into its output block, returning (text, ok)
+
+    text is None if the site says the article doesn't exist (see MISSING_STATUSES).
+    A page that can't be rendered, e.g. an empty 200 body, gets a placeholder
+    like a failed fetch, so one bad page never stops the scrape.
+    """
+    status_code, html, error = result
+    if error is not None and verbose:
+        print(f"    Error processing Article {article_num}: {error}")
+    
+    if status_code == 200:
+        try:
+            if not html.strip():
+                raise ValueError("empty page")
+            return render_article(html, article_num, verbose), True
+        except Exception as e:
+            if verbose:
+                print(f"    ERROR: Could not render Article {article_num}: {str(e)}")
+            return f"*Content could not be retrieved for Article {article_num} due to an error*\n\n", False
+    if status_code in MISSING_STATUSES:
+        if verbose:
+            print(f"    Article {article_num} does not exist (status code {status_code})")
+        return None, False
+    # If we couldn't retrieve the article
+    if verbose:
+        print(f"    ERROR: Failed to retrieve Article {article_num}, status code: {status_code}")
+    return f"*Content could not be retrieved for Article {article_num}*\n\n", False
+
+def repair_summa(output_file, part=None, verbose=False, workers=1, rate=None, base_url=BASE_URL, cache_dir=None,
+                 metrics=None):
+    """
+    Re-fetch only the placeholder entries of an existing output file and splice them in
+    
+    Parameters:
+    - output_file: Path to a text file written by scrape_summa
+    - part: Part of the Summa (default: None, read from the file's title line)
+    - verbose: Whether to print detailed progress messages (default: False)
+    - workers: Number of requests kept in flight at once (default: 1)
+    - rate: Maximum requests per second to the site (default: None, unlimited)
+    - base_url: Site root the ~ST.* page paths are appended to (default: BASE_URL)
+    - cache_dir: Directory of the on-disk response cache (default: None, no caching)
+    - metrics: ScrapeMetrics to record requests, retries and sleeps in (default: None)
+    
+    Returns the number of placeholders that were successfully replaced. Entries
+    that still can't be fetched keep their placeholder for a later repair.
+    If only the frames of a scrape were kept, the text is written back out
+    from them for the repair and removed again afterwards.
+    """
+    restored = not os.path.exists(output_file) and os.path.exists(frames_path_for(output_file))
+    if restored:
+        export_text(frames_path_for(output_file), output_file)
+    with open(output_file, "rb") as f:
+        data = f.read()
+    lines = data.decode("utf-8").splitlines(keepends=True)
+    
+    if part is None:
+        part = part_from_title(lines[0].strip()) if lines else None
+        if part is None:
+            raise ValueError(f"Can't tell which part {output_file} holds; pass part explicitly")
+    url_part = get_part_url_format(part)
+    end_q = get_default_end_question(part)
+    
+    # Find every placeholder with its byte range and the question it belongs to
+    placeholders = []
+    offset, current_q = 0, None
+    for line in lines:
+        size = len(line.encode("utf-8"))
+        match = QUESTION_HEADER.match(line.rstrip("\n"))
+        if match:
+            current_q = int(match.group(1))
+        match = PLACEHOLDER.match(line.rstrip("\n"))
+        if match:
+            kind, number = match.group(1), int(match.group(2))
+            if kind == "Question":
+                placeholders.append((offset, offset + size, number, None))
+                current_q = number
+            elif current_q is not None:
+                placeholders.append((offset, offset + size, current_q, number))
+        offset += size
+    
+    print(f"Found {len(placeholders)} placeholder(s) in {output_file}")
+    if not placeholders:
+        if restored:
+            os.remove(output_file)
+        return 0
+    
+    # A file scraped with dedup has each question title once; repaired questions match it
+    journal = ScrapeJournal(ScrapeJournal.path_for(output_file))
+    run, units, done = journal.read()
+    repeat_title = not (run or {}).get("dedup")
+    
+    cache = ResponseCache(cache_dir) if cache_dir else None
+    replacements = []
+    article_counts = {}  # question -> articles written with a repaired question
+    with FetchEngine(workers=workers, rate=rate, verbose=verbose, cache=cache, metrics=metrics) as engine:
+        for start, end, q_num, article_num in placeholders:
+            if article_num is not None:
+                if verbose:
+                    print(f"  Re-fetching Question {q_num}, Article {article_num}")
+                url = f"{base_url}~ST.{url_part}.Q{q_num}.A{article_num}"
+                text, ok = article_block(fetch_result(next(engine.fetch_ordered([url], max_retries=7))), article_num, verbose)
+                if text is None:
+                    # The site has no such article, so its placeholder goes away
+                    text, ok = "", True
+            else:
+                if verbose:
+                    print(f"  Re-fetching Question {q_num}")
+                url = f"{base_url}~ST.{url_part}.Q{q_num}"
+                text, num_articles, ok = question_block(fetch_result(next(engine.fetch_ordered([url], timeout=90))), part, q_num, end_q, verbose,
+                                                       repeat_title=repeat_title)
+                if ok:
+                    if num_articles is None:
+                        results = probe_articles(engine, {q_num: (url, 1)}, verbose=verbose)[0][q_num]
+                    else:
+                        article_urls = [f"{url}.A{n}" for n in range(1, num_articles + 1)]
+                        results = (fetch_result(future) for future in engine.fetch_ordered(article_urls, max_retries=7))
+                    blocks = [text]
+                    for n, result in enumerate(results, 1):
+                        article_text = article_block(result, n, verbose)[0]
+                        if article_text is None:
+                            break  # Past the question's last article
+                        blocks.append(article_text)
+                    text = "".join(blocks)
+                    article_counts[q_num] = len(blocks) - 1
+            if ok:
+                # The placeholder's trailing blank line is part of what gets replaced
+                if data[end:end + 1] == b"\n":
+                    end += 1
+                replacements.append((start, end, text.encode("utf-8"), (q_num, article_num or 0)))
+    
+    # Splice the new blocks in back to front so earlier offsets stay valid
+    new_data = bytearray(data)
+    for start, end, block, _ in reversed(replacements):
+        new_data[start:end] = block
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(new_data)
+    os.replace(tmp_path, output_file)
+    
+    # Keep a journal in step with the moved byte offsets so a resume still works
+    if run is not None:
+        repaired = {key for _, _, _, key in replacements}
+        unit_start = 0
+        for unit in units:
+            shift = sum(len(block) - (end - start) for start, end, block, _ in replacements if end <= unit["end"])
+            unit["end"] += shift
+            if (unit["q"], unit["a"]) in repaired:
+                unit.pop("ok", None)
+                unit["hash"] = fingerprint(bytes(new_data[unit_start:unit["end"]]).decode("utf-8"))
+                if unit["a"] == 0 and unit["q"] in article_counts:
+                    unit["articles"] = article_counts[unit["q"]]
+            unit_start = unit["end"]
+        journal.rewrite(run, units, done)
+    
+    # Bring the structured corpus and sidecars up to date with the repaired text
+    write_derived_files(output_file, corpus_path_for(output_file), part)
+    if restored:
+        os.remove(output_file)
+    print(f"Repaired {len(replacements)} of {len(placeholders)} placeholder(s) in {output_file}")
+    return len(replacements)
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the Summa Theologica from aquinas.cc")
+    parser.add_argument("--cache-dir", help="Keep raw pages in this on-disk cache and revalidate them on later runs")
+    parser.add_argument("--offline", action="store_true",
+                        help=f"Rebuild the output purely from the cache (default cache: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--repair", action="store_true",
+                        help="Re-fetch only the placeholder entries of an existing output file")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Start over instead of resuming an interrupted scrape of the same file")
+    parser.add_argument("--dedup", choices=["flag", "drop"],
+                        help="Report (flag) or leave out (drop) paragraphs that nearly repeat earlier ones")
+    parser.add_argument("--parse-workers", type=int,
+                        help=f"Parser processes (default: {DEFAULT_PARSE_WORKERS}; 0 parses in the main process)")
+    parser.add_argument("--metrics", help="Write request, retry, sleep and parse metrics to this JSON file")
+    parser.add_argument("--prometheus", help="Write the same metrics in the Prometheus text format to this file")
+    parser.add_argument("--no-text", action="store_true",
+                        help="Keep only the compressed .frames file of the output, not the plain text")
+    args = parser.parse_args()
+    metrics = ScrapeMetrics()
+    
+    def save_metrics():
+        if args.metrics:
+            metrics.write_json(args.metrics)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
+
     print("SUMMA THEOLOGICA SCRAPER")
     print("------------------------")
 
     # Get user input for scraping parameters
     output_file = input("Output file path [default: summa_output.txt]: ") or "summa_output.txt"
     
+    if args.repair:
+        verbose = input("\nShow detailed progress? (y/n) [default: n]: ").lower() == 'y'
+        repair_summa(output_file, verbose=verbose, cache_dir=args.cache_dir, metrics=metrics)
+        save_metrics()
+        raise SystemExit(0)
+    
     part_options = {
         "1": "I",      # Prima Pars
         "2": "II-I",   # Prima Secundae
@@ -429,6 +875,10 @@ if __name__ == "__main__":
     
     verbose = input("\nShow detailed progress? (y/n) [default: n]: ").lower() == 'y'
     delay = float(input("Delay between requests in seconds [default: 0]: ") or "0")
+    workers = int(input("Concurrent requests [default: 1]: ") or "1")
     
     # Run the scraper
-    scrape_summa(output_file, part, start_q, end_q, delay, verbose)
\ No newline at end of file
+    scrape_summa(output_file, part, start_q, end_q, delay, verbose, workers=workers, cache_dir=args.cache_dir,
+                 offline=args.offline, resume=not args.no_resume, parse_workers=args.parse_workers, dedup=args.dedup,
+                 metrics=metrics, keep_text=not args.no_text)
+    save_metrics()
\ No newline at end of file
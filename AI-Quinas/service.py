@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from offsets import KINDS, SummaLibrary
+from parts import PARTS
+from retrieval import BATCH_SIZE, DEFAULT_INDEX_FILE, BM25Index, tokenize
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Results per query when the request doesn't say
+DEFAULT_K = 10
+
+# Cached answers and passages, and how long an answer stays valid; both caches are
+# also dropped whenever the index file is replaced (see QueryService.reload)
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_TTL = 600.0
+
+# How long the first query of a batch waits for others to join it; a batch is
+# also sent as soon as it is full, and queries that arrive while one is being
+# scored simply wait for the next
+BATCH_WINDOW = 0.002
+MAX_BATCH = 4 * BATCH_SIZE
+
+
+def normalize_query(query):
+    """
+    Returns the cache key of a free-text query: its sorted tokens
+
+    Scoring only looks at which words a query has and how often, so
+    "Whether God exists?" and "whether god EXISTS" share one entry.
+    """
+    return " ".join(sorted(tokenize(query)))
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache whose entries also expire after a while
+
+    Not thread-safe; the service only touches it from the event loop.
+
+    Parameters:
+    - max_entries: Entries kept before the least recently used go (default: DEFAULT_CACHE_SIZE)
+    - ttl: Seconds an entry stays valid (default: None, until evicted)
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expiry, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Returns the value of a live entry, or None"""
+        entry = self.entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value):
+        expiry = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.entries[key] = (expiry, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class QueryService:
+    """
+    Resident query engine over the BM25 index and the Summa*.txt files
+
+    The index is memory-mapped once at startup and mapped again whenever its
+    file is replaced (e.g. by retrieval.update_index after a scrape); a part's
+    text file is only mapped the first time one of its passages is asked for
+    (see SummaLibrary). Answers are cached per normalized query. Queries that
+    miss the cache are collected for up to BATCH_WINDOW seconds and scored
+    together in one search_batch call on a worker thread, and identical queries
+    in flight share one slot of the batch, so a burst of users costs a few
+    vectorized scoring passes (see BM25Index.score_batch) rather than one
+    scan each.
+
+    Queries are ranked by BM25 rather than by the TF-IDF matrix: BM25
+    saturates repeated words and discounts long sections, which suits short
+    questions, while the matrix is meant for comparing whole articles (see
+    TfidfMatrix.related_articles).
+
+    Parameters:
+    - index_file: File written by retrieval.build_index (default: DEFAULT_INDEX_FILE)
+    - text_files: Text files passages are read from (default: None, the ones the index was built from)
+    - cache_size: Answers and passages cached, each (default: DEFAULT_CACHE_SIZE)
+    - ttl: Seconds a cached answer stays valid (default: DEFAULT_TTL)
+    - batch_window: Seconds a batch stays open for more queries (default: BATCH_WINDOW)
+    - max_batch: Queries sent at once at most (default: MAX_BATCH)
+    """
+
+    def __init__(self, index_file=DEFAULT_INDEX_FILE, text_files=None, cache_size=DEFAULT_CACHE_SIZE,
+                 ttl=DEFAULT_TTL, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.index_file = index_file
+        self.index = BM25Index(index_file)
+        self.index_stat = _file_identity(index_file)
+        self.library = SummaLibrary(text_files or self.index.header["sources"])
+        self.answers = LRUCache(cache_size, ttl)
+        self.passages = LRUCache(cache_size)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        # One scoring thread: batches queue up behind each other instead of competing for the CPU
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summa-score")
+        self.pending = {}   # key -> future shared by everyone waiting on it
+        self.queue = []     # keys waiting for the next batch
+        self.timer = None
+        self.scoring = False
+        self.queries = 0
+        self.coalesced = 0  # queries that joined an identical one already in flight
+        self.batches = 0
+        self.batched = 0    # queries scored in batches
+        self.reloads = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.library.close()
+        self.index.close()
+
+    def reload(self):
+        """
+        Maps the index again if its file was replaced since it was opened
+
+        The text files are reopened too and both caches dropped, since an
+        index is only rebuilt after the text changed. Waits while a batch is
+        being scored, so the worker thread never reads a closed index.
+        Returns True if the index was reloaded.
+        """
+        identity = _file_identity(self.index_file)
+        if self.scoring or identity is None or identity == self.index_stat:
+            return False
+        index = BM25Index(self.index_file)
+        self.index.close()
+        self.index, self.index_stat = index, identity
+        self.library.close()
+        self.answers.clear()
+        self.passages.clear()
+        self.reloads += 1
+        return True
+
+    async def search(self, query, k=DEFAULT_K, parts=None, text=False):
+        """
+        Returns the top-k sections for a query as dicts, best first
+
+        Parameters:
+        - query: Free-text question, e.g. "Whether God exists?"
+        - k: Number of results (default: DEFAULT_K)
+        - parts: Only return sections of these parts (default: None, all)
+        - text: Include each section's text under "text" (default: False)
+        """
+        self.queries += 1
+        key = (normalize_query(query), k, tuple(sorted(parts)) if parts else None)
+        if not key[0]:
+            return []
+        self.reload()
+        hits = self.answers.get(key)
+        if hits is None:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = asyncio.get_running_loop().create_future()
+                self.queue.append(key)
+                self._schedule()
+            else:
+                self.coalesced += 1
+            # Shielded so one caller giving up doesn't cancel the answer for the others
+            hits = await asyncio.shield(future)
+        if text:
+            return [dict(hit, text=self.passage(hit["part"], hit["question"], hit["article"], hit["kind"],
+                                                hit["index"]))
+                    for hit in hits]
+        return hits
+
+    def passage(self, part, question, article=0, kind=None, index=None):
+        """Returns the text of a question, article or section (see SummaLibrary.get), or None"""
+        key = (part, question, article, kind, index)
+        self.reload()
+        text = self.passages.get(key)
+        if text is None:
+            text = self.library.get(part, question, article, kind, index)
+            if text is not None:
+                self.passages.put(key, text)
+        return text
+
+    def _schedule(self):
+        if self.scoring:
+            return  # _score_batch picks the queue up when it's done
+        if len(self.queue) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+        if batch:
+            self.scoring = True
+            asyncio.get_running_loop().create_task(self._score_batch(batch))
+
+    async def _score_batch(self, batch):
+        self.batches += 1
+        self.batched += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self._score, batch)
+        except Exception as e:
+            for key in batch:
+                self.pending.pop(key).set_exception(e)
+        else:
+            for key, hits in zip(batch, results):
+                self.answers.put(key, hits)
+                self.pending.pop(key).set_result(hits)
+        finally:
+            self.scoring = False
+            if self.queue:
+                self._schedule()
+
+    def _score(self, batch):
+        """Scores a batch on the worker thread, one search_batch call per distinct (k, parts)"""
+        groups = {}
+        for i, (query, k, parts) in enumerate(batch):
+            groups.setdefault((k, parts), []).append(i)
+        results = [None] * len(batch)
+        for (k, parts), positions in groups.items():
+            found = self.index.search_batch([batch[i][0] for i in positions], k, parts)
+            for i, hits in zip(positions, found):
+                results[i] = [hit._asdict() for hit in hits]
+        return results
+
+    def stats(self):
+        """Returns the cache and batching counters as a JSON-ready dict"""
+        return {
+            "queries": self.queries,
+            "answers": {"entries": len(self.answers), "hits": self.answers.hits, "misses": self.answers.misses},
+            "passages": {"entries": len(self.passages), "hits": self.passages.hits, "misses": self.passages.misses},
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "reloads": self.reloads,
+            "mean_batch": round(self.batched / self.batches, 3) if self.batches else 0.0,
+            "parts_loaded": sorted(self.library.readers)
+        }
+
+    async def handle(self, message):
+        """
+        Answers one request dict
+
+        Requests are {"op": "search", "query": ..., "k": ..., "parts": [...], "text": bool},
+        {"op": "passage", "part": ..., "question": ..., "article": ..., "kind": ..., "index": ...}
+        or {"op": "stats"}; "op" defaults to "search".
+        """
+        op = message.get("op", "search")
+        if op == "search":
+            parts = message.get("parts")
+            unknown = set(parts or ()) - set(PARTS)
+            if unknown:
+                raise ValueError(f"Unknown part(s): {', '.join(sorted(unknown))}")
+            return {"hits": await self.search(message["query"], int(message.get("k", DEFAULT_K)), parts,
+                                              bool(message.get("text")))}
+        if op == "passage":
+            kind, index = message.get("kind"), message.get("index")
+            if kind is not None and kind not in KINDS:
+                raise ValueError(f"Unknown section kind: {kind}")
+            return {"text": self.passage(message["part"], int(message["question"]), int(message.get("article", 0)),
+                                         kind, int(index or 0) or None)}
+        if op == "stats":
+            return self.stats()
+        raise ValueError(f"Unknown op: {op}")
+
+    async def serve_client(self, reader, writer):
+        """
+        Serves one connection of newline-delimited JSON requests
+
+        Requests are answered concurrently, so one client can pipeline many;
+        each reply carries the request's "id".
+        """
+        tasks = set()
+
+        async def respond(line):
+            request_id = None
+            try:
+                message = json.loads(line)
+                request_id = message.get("id")
+                reply = await self.handle(message)
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            reply["id"] = request_id
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+
+def _file_identity(path):
+    """Returns what changes when a file is replaced or rewritten, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Starts serving a QueryService over TCP and returns the asyncio server"""
+    return await asyncio.start_server(service.serve_client, host, port)
+
+
+class ServiceClient:
+    """
+    Client for a running QueryService
+
+    Requests can be sent concurrently over one connection; replies are matched
+    to them by id. Open one with await ServiceClient.connect(host, port).
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.waiting = {}  # request id -> future
+        self.listener = asyncio.create_task(self._listen())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await asyncio.gather(self.listener, return_exceptions=True)
+
+    async def _listen(self):
+        try:
+            while line := await self.reader.readline():
+                reply = json.loads(line)
+                future = self.waiting.pop(reply.pop("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the query service closed"))
+            self.waiting = {}
+
+    async def request(self, **message):
+        """Sends one request and returns its reply, raising RuntimeError if the service answered with an error"""
+        self.next_id += 1
+        message["id"] = self.next_id
+        future = self.waiting[self.next_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(json.dumps(message).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        reply = await future
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    async def search(self, query, k=DEFAULT_K, parts=None, text=False):
+        """Returns the top-k sections for a query as dicts, best first (see QueryService.search)"""
+        return (await self.request(op="search", query=query, k=k, parts=parts, text=text))["hits"]
+
+    async def passage(self, part, question, article=0, kind=None, index=None):
+        """Returns the text of a question, article or section, or None"""
+        return (await self.request(op="passage", part=part, question=question, article=article, kind=kind,
+                                   index=index))["text"]
+
+    async def stats(self):
+        return await self.request(op="stats")
+
+
+async def _run_server(args):
+    started = time.perf_counter()
+    with QueryService(args.index, args.text_files or None, args.cache_size, args.ttl) as service:
+        server = await serve(service, args.host, args.port)
+        print(f"Serving {service.index.num_docs} sections on {args.host}:{args.port} "
+              f"(ready in {time.perf_counter() - started:.2f}s)")
+        async with server:
+            await server.serve_forever()
+
+async def _run_queries(args):
+    async with await ServiceClient.connect(args.host, args.port) as client:
+        found = await asyncio.gather(*(client.search(query, args.k, args.parts, args.text) for query in args.queries))
+        for query, hits in zip(args.queries, found):
+            print(query)
+            for hit in hits:
+                where = f"{hit['part']} Q{hit['question']} A{hit['article']} {hit['kind']}{' ' + str(hit['index']) if hit['index'] else ''}"
+                print(f"  {hit['score']:.3f}  {where}")
+                if args.text:
+                    print(f"    {hit['text'].strip()}")
+        if args.stats:
+            print(json.dumps(await client.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve or query the Summa from a long-lived process")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("serve", help="Load the index and answer queries until interrupted")
+    run.add_argument("text_files", nargs="*", help="Text files to read passages from (default: the index's sources)")
+    run.add_argument("--index", default=DEFAULT_INDEX_FILE, help=f"Index file (default: {DEFAULT_INDEX_FILE})")
+    run.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    run.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="Seconds a cached answer stays valid")
+    query = commands.add_parser("query", help="Send queries to a running service, all at once")
+    query.add_argument("queries", nargs="+")
+    query.add_argument("-k", type=int, default=DEFAULT_K)
+    query.add_argument("--parts", nargs="+", choices=PARTS)
+    query.add_argument("--text", action="store_true", help="Print each section's text too")
+    query.add_argument("--stats", action="store_true", help="Print the service's cache and batching counters")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_run_server(args) if args.command == "serve" else _run_queries(args))
+    except KeyboardInterrupt:
+        pass
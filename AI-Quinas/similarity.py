@@ -0,0 +1,430 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from corpus import SECTION_KINDS, CorpusDiff
+from parts import PARTS
+from retrieval import (Hit, article_key, batch_chunks, dedup_articles, pack_dedup, parse_article_key, range_positions,
+                       section_tokens, tokenize, top_rows, unpack_dedup)
+
+# Default location of the matrix, next to the Summa*.txt files
+DEFAULT_MATRIX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "summa.tfidf")
+
+MAGIC = b"TFID"
+VERSION = 2
+PREAMBLE = struct.Struct("<4sHI")  # magic, version, header length
+
+# Number of hashed feature columns; collisions are rare at this size and it needs no vocabulary
+DEFAULT_DIM = 1 << 18
+
+# Metadata stored for every row, next to its features
+ROW_COLUMNS = (("part", np.uint8), ("question", np.uint16), ("article", np.uint16), ("kind", np.uint8),
+               ("index", np.uint8))
+
+# Features kept from an article's centroid when looking for related articles
+DEFAULT_MAX_TERMS = 64
+
+
+def feature(token, dim=DEFAULT_DIM):
+    """Returns the hashed column of a token (stable across runs and processes, unlike hash())"""
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+def hashed_counts(tokens, dim=DEFAULT_DIM):
+    """Returns {column: count} for a list of tokens"""
+    counts = {}
+    for token in tokens:
+        column = feature(token, dim)
+        counts[column] = counts.get(column, 0) + 1
+    return counts
+
+
+def matrix_sources(matrix_file=DEFAULT_MATRIX_FILE):
+    """Returns the absolute paths of the text files a matrix was built from ([] if there is no matrix)"""
+    try:
+        with TfidfMatrix(matrix_file) as matrix:
+            return matrix.header["sources"]
+    except (OSError, ValueError):
+        return []
+
+
+def build_matrix(text_files, matrix_file=DEFAULT_MATRIX_FILE, dim=DEFAULT_DIM):
+    """
+    Builds the TF-IDF matrix over every section of some Summa*.txt files
+
+    Each row is one section, weighted (1 + log tf) * idf over hashed features
+    and scaled to unit length, so the dot product of two rows is their cosine
+    similarity. Rows are kept in corpus order, which keeps each article's
+    sections next to each other. Near-duplicate sections are left out, as in
+    the BM25 index (see retrieval.dedup_articles).
+
+    Parameters:
+    - text_files: Text files written by scrape_summa, e.g. Summa1.txt, Summa2.txt
+    - matrix_file: Where to write the matrix (default: DEFAULT_MATRIX_FILE)
+    - dim: Number of hashed feature columns (default: DEFAULT_DIM)
+
+    Returns the number of rows written.
+    """
+    diff = CorpusDiff(text_files)
+    dedup, rebuilt = dedup_articles(diff)
+    rows = {key: _section_rows(rebuilt[key], dim) for key in diff.articles if rebuilt[key]}
+    blobs, fields = _matrix_blobs(diff, dedup, rows, dim)
+    write_matrix(blobs, fields, matrix_file)
+    return fields["rows"]
+
+def update_matrix(matrix_file=DEFAULT_MATRIX_FILE, text_files=None):
+    """
+    Brings a matrix up to date with its text files, vectorizing only what changed
+
+    Like update_index, only the questions whose fingerprint changed are
+    parsed again, and only their articles (plus those whose near-duplicate
+    outcome flipped) are tokenized. The raw feature counts of every other
+    article are copied from the old matrix; the weights are then recomputed
+    for the whole matrix, since a change to any row moves the idf of its
+    features. The result is the same file build_matrix would write.
+
+    Parameters:
+    - matrix_file: Matrix written by build_matrix (default: DEFAULT_MATRIX_FILE)
+    - text_files: Text files to vectorize (default: None, the ones the matrix was built from)
+
+    Returns the number of articles that were vectorized again.
+    """
+    with TfidfMatrix(matrix_file) as old:
+        header = old.header
+        text_files = text_files or header["sources"]
+        recorded = {parse_article_key(key): entry for key, entry in header["fingerprints"].items()}
+        diff = CorpusDiff(text_files, header["questions"], {key: entry[0] for key, entry in recorded.items()})
+        if diff.unchanged():
+            return 0
+        dedup, rebuilt = dedup_articles(diff, unpack_dedup({key: entry[1:] for key, entry in recorded.items()},
+                                                           old.arrays["signatures"], old.arrays["kept"]))
+        rows = {}
+        for key in diff.articles:
+            if key in rebuilt:
+                if rebuilt[key]:
+                    rows[key] = _section_rows(rebuilt[key], old.dim)
+            elif key in old.article_ids:
+                rows[key] = old.article_rows(old.article_ids[key])
+        # Everything is copied out of the old matrix, so it can be closed before the file is replaced
+        blobs, fields = _matrix_blobs(diff, dedup, rows, old.dim)
+    write_matrix(blobs, fields, matrix_file)
+    return len(rebuilt)
+
+def _section_rows(sections, dim):
+    """Returns the rows of some sections: their metadata, feature count and the (column, count) of every feature"""
+    meta = {name: [] for name, _ in ROW_COLUMNS}
+    lengths, columns, counts = [], [], []
+    for section in sections:
+        cells = sorted(hashed_counts(section_tokens(section), dim).items())
+        lengths.append(len(cells))
+        columns.extend(column for column, _ in cells)
+        counts.extend(count for _, count in cells)
+        meta["part"].append(PARTS.index(section.part))
+        meta["question"].append(section.question)
+        meta["article"].append(section.article)
+        meta["kind"].append(SECTION_KINDS.index(section.kind))
+        meta["index"].append(section.index or 0)
+    rows = {name: np.array(meta[name], dtype=dtype) for name, dtype in ROW_COLUMNS}
+    rows.update(lengths=np.array(lengths, dtype=np.int64), columns=np.array(columns, dtype=np.int32),
+                counts=np.array(counts, dtype=np.int32))
+    return rows
+
+def _matrix_blobs(diff, dedup, rows, dim):
+    """
+    Weighs the rows of every article into the arrays and header fields of a matrix file
+
+    rows is {key: rows} (see _section_rows) of every article with at least
+    one section left after near-duplicates are dropped, in corpus order.
+    """
+    def joined(name, dtype):
+        return np.concatenate([np.zeros(0, dtype=dtype)] + [article_rows[name] for article_rows in rows.values()])
+
+    lengths = joined("lengths", np.int64)
+    columns = joined("columns", np.int32)
+    counts = joined("counts", np.int32)
+    num_rows = len(lengths)
+    row_ids = np.repeat(np.arange(num_rows, dtype=np.int32), lengths)
+    df = np.bincount(columns, minlength=dim)
+    idf = np.log((1 + num_rows) / (1 + df)).astype(np.float32) + 1
+    data = (1 + np.log(counts.astype(np.float32))) * idf[columns]
+    norms = np.sqrt(np.bincount(row_ids, weights=data * data, minlength=num_rows))
+    data = (data / np.maximum(norms, 1e-12)[row_ids]).astype(np.float32)
+
+    # Row-major copy for reading a section's vector, column-major copy for scoring
+    row_ptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(lengths, out=row_ptr[1:])
+    by_column = np.argsort(columns, kind="stable")
+    col_ptr = np.zeros(dim + 1, dtype=np.int64)
+    np.cumsum(df, out=col_ptr[1:])
+    article_starts = np.zeros(len(rows), dtype=np.int64)
+    np.cumsum([len(article_rows["lengths"]) for article_rows in rows.values()][:-1], out=article_starts[1:])
+
+    signatures, kept, positions = pack_dedup(dedup)
+    blobs = {
+        "idf": idf,
+        "row_ptr": row_ptr,
+        "row_columns": columns,
+        "row_counts": counts,
+        "row_data": data,
+        "col_ptr": col_ptr,
+        "col_rows": row_ids[by_column],
+        "col_data": data[by_column],
+        "article_starts": article_starts
+    }
+    blobs.update((name, joined(name, dtype)) for name, dtype in ROW_COLUMNS)
+    blobs.update(signatures=np.frombuffer(signatures, dtype=np.uint32), kept=np.frombuffer(kept, dtype=np.uint8))
+    fields = {
+        "dim": dim,
+        "rows": num_rows,
+        "sources": list(diff.questions),
+        "questions": diff.questions,
+        "articles": [list(key) for key in rows],
+        # Fingerprint, first section and section count of every article, rows or not
+        "fingerprints": {article_key(key): [digest] + positions[key] for key, digest in diff.articles.items()}
+    }
+    return blobs, fields
+
+def write_matrix(blobs, fields, matrix_file):
+    """
+    Writes named arrays to a matrix file
+
+    Layout: a small preamble, a JSON header (fields plus the dtype, shape and
+    position of every array), then the arrays themselves, each 8-byte aligned
+    so they can be mapped in place.
+    """
+    positions, position = {}, 0
+    for name, blob in blobs.items():
+        positions[name] = [position, blob.dtype.str, len(blob)]
+        position += blob.nbytes
+        position += -position % 8
+    header = dict(fields, byteorder=sys.byteorder, blobs=positions)
+    data = json.dumps(header).encode("utf-8")
+    data += b" " * (-(PREAMBLE.size + len(data)) % 8)
+
+    tmp_path = matrix_file + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(data)))
+        f.write(data)
+        for blob in blobs.values():
+            f.write(blob.tobytes())
+            f.write(b"\0" * (-blob.nbytes % 8))
+    os.replace(tmp_path, matrix_file)
+
+
+class TfidfMatrix:
+    """
+    Memory-mapped TF-IDF matrix for batched similarity queries
+
+    Every array is a read-only NumPy view straight into the mapped file, so
+    worker processes that open the same matrix share one copy of it in the
+    page cache. A batch of queries is scored in one sparse product (gathered
+    column slices summed with bincount) rather than a loop per query.
+
+    Parameters:
+    - matrix_file: File written by build_matrix (default: DEFAULT_MATRIX_FILE)
+    """
+
+    def __init__(self, matrix_file=DEFAULT_MATRIX_FILE):
+        self.matrix_file = matrix_file
+        self.file = open(matrix_file, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{matrix_file} is not a TF-IDF matrix this version can read")
+        header = json.loads(self.map[PREAMBLE.size:PREAMBLE.size + header_length])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{matrix_file} was built on a machine with a different byte order")
+
+        self.header = header
+        self.dim = header["dim"]
+        self.num_rows = header["rows"]
+        self.articles = [tuple(key) for key in header["articles"]]
+        self.article_ids = {key: i for i, key in enumerate(self.articles)}
+        self.is_article = np.array([key[2] != 0 for key in self.articles])  # False for prologues and introductions
+        offset = PREAMBLE.size + header_length
+        self.arrays = {}
+        for name, (position, dtype, count) in header["blobs"].items():
+            self.arrays[name] = np.frombuffer(self.map, dtype=dtype, count=count, offset=offset + position)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.arrays = {}
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # Arrays handed out are still alive; the map goes once they do
+        self.file.close()
+
+    def article_rows(self, article_id):
+        """Returns the rows of one article in the form _section_rows builds them, as copies"""
+        a = self.arrays
+        start = a["article_starts"][article_id]
+        end = a["article_starts"][article_id + 1] if article_id + 1 < len(self.articles) else self.num_rows
+        cells = slice(a["row_ptr"][start], a["row_ptr"][end])
+        rows = {name: a[name][start:end].copy() for name, _ in ROW_COLUMNS}
+        rows.update(lengths=np.diff(a["row_ptr"][start:end + 1]), columns=a["row_columns"][cells].copy(),
+                    counts=a["row_counts"][cells].copy())
+        return rows
+
+    def vectorize(self, queries):
+        """
+        Turns free-text queries into a sparse batch of unit vectors
+
+        Returns (query ids, columns, weights) arrays with one entry per distinct
+        feature of each query.
+        """
+        query_ids, columns, counts = [], [], []
+        for query_id, query in enumerate(queries):
+            for column, count in hashed_counts(tokenize(query), self.dim).items():
+                query_ids.append(query_id)
+                columns.append(column)
+                counts.append(count)
+        columns = np.array(columns, dtype=np.int64)
+        weights = (1 + np.log(np.array(counts, dtype=np.float64))) * self.arrays["idf"][columns]
+        return self._normalized(np.array(query_ids, dtype=np.int64), columns, weights, len(queries))
+
+    def article_vectors(self, keys, max_terms=DEFAULT_MAX_TERMS):
+        """
+        Returns the sparse batch of centroid vectors of some (part, question, article) keys
+
+        Only the max_terms heaviest features of each centroid are kept: the
+        light ones barely move the scores but carry the longest columns.
+        """
+        a = self.arrays
+        starts, ends = [], []
+        for key in keys:
+            article_id = self.article_ids[tuple(key)]
+            starts.append(a["row_ptr"][a["article_starts"][article_id]])
+            next_row = a["article_starts"][article_id + 1] if article_id + 1 < len(self.articles) else self.num_rows
+            ends.append(a["row_ptr"][next_row])
+        positions, owners = range_positions(np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64))
+        columns = a["row_columns"][positions].astype(np.int64)
+        # Merge the features the sections of an article share
+        cells, inverse = np.unique(owners * self.dim + columns, return_inverse=True)
+        weights = np.bincount(inverse, weights=a["row_data"][positions])
+        query_ids = cells // self.dim
+        order = np.lexsort((-weights, query_ids))
+        rank = np.arange(len(order)) - np.searchsorted(query_ids[order], query_ids[order])
+        keep = np.sort(order[rank < max_terms])
+        return self._normalized(query_ids[keep], cells[keep] % self.dim, weights[keep], len(keys))
+
+    @staticmethod
+    def _normalized(query_ids, columns, weights, num_queries):
+        norms = np.sqrt(np.bincount(query_ids, weights=weights * weights, minlength=num_queries))
+        return query_ids, columns, weights / np.maximum(norms, 1e-12)[query_ids]
+
+    def score_batch(self, batch, num_queries):
+        """
+        Returns the (num_queries, rows) matrix of cosine similarities for a sparse batch
+
+        Every query feature pulls its column out of the column-major copy; the
+        products are summed into their (query, row) cells in one bincount.
+        """
+        query_ids, columns, weights = batch
+        a = self.arrays
+        positions, owners = range_positions(a["col_ptr"][columns], a["col_ptr"][columns + 1])
+        cells = query_ids[owners] * self.num_rows + a["col_rows"][positions]
+        products = weights[owners] * a["col_data"][positions]
+        scores = np.bincount(cells, weights=products, minlength=num_queries * self.num_rows)
+        return scores.reshape(num_queries, self.num_rows)
+
+    def search_batch(self, queries, k=10, parts=None):
+        """
+        Returns the top-k sections of every query as lists of Hits, best first
+
+        Parameters:
+        - queries: List of free-text questions
+        - k: Number of results per query (default: 10)
+        - parts: Only return sections of these parts (default: None, all)
+        """
+        a = self.arrays
+        allowed = None
+        if parts is not None:
+            allowed = np.isin(a["part"], [PARTS.index(part) for part in parts])
+        results = []
+        for chunk in batch_chunks(queries):
+            scores = self.score_batch(self.vectorize(chunk), len(chunk))
+            for row_scores, best in zip(scores, top_rows(scores, k, allowed)):
+                results.append([Hit(float(row_scores[i]), PARTS[a["part"][i]], int(a["question"][i]),
+                                    int(a["article"][i]), SECTION_KINDS[a["kind"][i]], int(a["index"][i]) or None)
+                                for i in best])
+        return results
+
+    def search(self, query, k=10, parts=None):
+        """Returns the top-k sections for one query as Hits, best first"""
+        return self.search_batch([query], k, parts)[0]
+
+    def related_articles_batch(self, keys, k=10):
+        """
+        Returns the k articles most similar to each of some articles
+
+        Articles are compared through the centroid of their sections, and an
+        article scores as its best-matching section. The article itself and the
+        question introductions are left out.
+
+        Parameters:
+        - keys: List of (part, question, article) tuples
+        - k: Number of suggestions per article (default: 10)
+
+        Returns one list of (score, part, question, article) tuples per key,
+        empty for a key with no rows: one that names no article, or an
+        article whose every section was left out as a near-duplicate.
+        """
+        found = list(dict.fromkeys(tuple(key) for key in keys if tuple(key) in self.article_ids))
+        related = {}
+        for chunk in batch_chunks(found):
+            scores = self.score_batch(self.article_vectors(chunk), len(chunk))
+            by_article = np.maximum.reduceat(scores, self.arrays["article_starts"], axis=1)
+            by_article[np.arange(len(chunk)), [self.article_ids[key] for key in chunk]] = 0.0
+            for key, article_scores, best in zip(chunk, by_article, top_rows(by_article, k, self.is_article)):
+                related[key] = [(float(article_scores[i]),) + self.articles[i] for i in best]
+        return [related.get(tuple(key), []) for key in keys]
+
+    def related_articles(self, part, question, article, k=10):
+        """Returns the k articles most similar to one article, e.g. related_articles("I", 2, 3)"""
+        return self.related_articles_batch([(part, question, article)], k)[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the TF-IDF similarity matrix over the Summa")
+    parser.add_argument("--matrix", default=DEFAULT_MATRIX_FILE, help=f"Matrix file (default: {DEFAULT_MATRIX_FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the matrix from Summa*.txt files")
+    build.add_argument("text_files", nargs="+")
+    commands.add_parser("update", help="Re-vectorize only what changed in the text files the matrix was built from")
+    search = commands.add_parser("search", help="Print the most similar sections for one or more queries")
+    search.add_argument("queries", nargs="+")
+    search.add_argument("-k", type=int, default=10)
+    related = commands.add_parser("related", help="Print the articles most similar to an article")
+    related.add_argument("part", choices=PARTS)
+    related.add_argument("question", type=int)
+    related.add_argument("article", type=int)
+    related.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_matrix(args.text_files, args.matrix)
+        print(f"Vectorized {count} sections -> {args.matrix}")
+    elif args.command == "update":
+        count = update_matrix(args.matrix)
+        print(f"Re-vectorized {count} articles -> {args.matrix}")
+    elif args.command == "search":
+        with TfidfMatrix(args.matrix) as matrix:
+            for query, hits in zip(args.queries, matrix.search_batch(args.queries, args.k)):
+                print(query)
+                for hit in hits:
+                    where = f"{hit.part} Q{hit.question} A{hit.article} {hit.kind}{' ' + str(hit.index) if hit.index else ''}"
+                    print(f"  {hit.score:.3f}  {where}")
+    else:
+        with TfidfMatrix(args.matrix) as matrix:
+            for score, part, question, article in matrix.related_articles(args.part, args.question, args.article, args.k):
+                print(f"{score:.3f}  {part} Q{question} A{article}")
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Matches the page paths of the aquinas.cc reader, e.g. /la/en/~ST.I-II.Q4.A2
+PAGE_PATH = re.compile(r"~ST\.([A-Z-]+)(?:\.Q(\d+)(?:\.A(\d+))?)?$")
+
+
+def synthetic_page(url_part, q_num=None, article_num=None, articles_per_question=3):
+    """
+    Returns a made-up page with the same markup as aquinas.cc, or None for unknown pages
+
+    Part pages carry a prologue, question pages a title, description, points of
+    inquiry and article links, and article pages a title with objections, the
+    sed contra, the body and replies.
+    """
+    def vl(text, cls=""):
+        return f'<vl-c class="c2-2{" " + cls if cls else ""}"><span>{text}</span></vl-c>\n'
+
+    body = []
+    if q_num is None:
+        body.append(vl(f"This stand-in prologue for {url_part} takes the place of the real prologue text."))
+    elif article_num is None:
+        body.append(vl(f"Stand-in Question {q_num} of Part {url_part}", "t-r"))
+        body.append(vl(f"We now consider the stand-in matter of question {q_num}, which is served locally for testing."))
+        body.append(vl(f"Concerning this there are {articles_per_question} points of inquiry:"))
+        for n in range(1, articles_per_question + 1):
+            body.append(vl(f"({n}) Whether stand-in point {n} holds?"))
+        for n in range(1, articles_per_question + 1):
+            body.append(f'<a href="/la/en/~ST.{url_part}.Q{q_num}.A{n}">Article {n}</a>\n')
+    elif article_num <= articles_per_question:
+        body.append(vl(f"Article {article_num}", "t-i"))
+        body.append(vl(f"Whether stand-in point {article_num} of question {q_num} holds?", "t-s"))
+        for n in (1, 2, 3):
+            body.append(vl(f"{'Objection' if n == 1 else 'Obj.'} {n}: It would seem that point {article_num} of question {q_num} does not hold, for reason {n}."))
+        body.append(vl(f"On the contrary, The stand-in authority says that point {article_num} holds."))
+        body.append(vl(f"I answer that, Point {article_num} of question {q_num} holds, as is shown at some length here."))
+        for n in (1, 2, 3):
+            body.append(vl(f"Reply Obj. {n}: Reason {n} is answered by what was said above about point {article_num}."))
+    else:
+        return None
+    return "<html><body><div class=\"body\"><div class=\"content\">\n" + "".join(body) + "</div></div></body></html>\n"
+
+
+class StandinServer:
+    """
+    Local HTTP server that stands in for aquinas.cc so the scraper can run offline
+
+    Parameters:
+    - latency: Seconds each response is held back to simulate the network (default: 0)
+    - page_source: Function taking (url_part, q_num, article_num) and returning HTML, None for a
+      404, or a status code to answer with instead, e.g. 429 or 500 (default: synthetic_page)
+    - retry_after: Retry-After header value sent with 429 and 503 answers (default: None, none)
+
+    Use it as a context manager; base_url is then the value to pass to scrape_summa.
+    """
+
+    def __init__(self, latency=0, page_source=None, retry_after=None):
+        self.latency = latency
+        self.page_source = page_source or synthetic_page
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.not_modified_served = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real site
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests_served += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                html = None
+                match = PAGE_PATH.search(self.path)
+                if match:
+                    url_part, q_num, article_num = match.groups()
+                    html = server.page_source(url_part,
+                                              int(q_num) if q_num else None,
+                                              int(article_num) if article_num else None)
+                if html is None or isinstance(html, int):
+                    status = html or 404
+                    self.send_response(status)
+                    if status in (429, 503) and server.retry_after is not None:
+                        self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = html.encode("utf-8")
+                etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    with server.lock:
+                        server.not_modified_served += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/la/en/"
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def compare_speed(questions=5, latency=0.05, workers=8):
+    """Scrapes the stand-in sequentially and concurrently, checks the outputs match and prints both timings"""
+    from scrape import scrape_summa
+
+    with StandinServer(latency=latency) as server, tempfile.TemporaryDirectory() as tmp:
+        timings = {}
+        for n in (1, workers):
+            output_file = os.path.join(tmp, f"summa_{n}.txt")
+            start = time.perf_counter()
+            scrape_summa(output_file, "I", 1, questions, workers=n, base_url=server.base_url)
+            timings[n] = time.perf_counter() - start
+        with open(os.path.join(tmp, "summa_1.txt"), encoding="utf-8") as f:
+            sequential = f.read()
+        with open(os.path.join(tmp, f"summa_{workers}.txt"), encoding="utf-8") as f:
+            concurrent = f.read()
+
+    if sequential != concurrent:
+        raise AssertionError("Concurrent scrape output differs from the sequential output")
+    print(f"Sequential:  {timings[1]:.2f}s")
+    print(f"{workers} workers: {timings[workers]:.2f}s ({timings[1] / timings[workers]:.1f}x faster, identical output)")
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sequential and concurrent scraping against a local stand-in for aquinas.cc")
+    parser.add_argument("--questions", type=int, default=5, help="Number of questions to scrape (default: 5)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per response (default: 0.05)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests for the fast run (default: 8)")
+    args = parser.parse_args()
+    compare_speed(args.questions, args.latency, args.workers)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in AI-Quinas/ and import each other by name; the Summa*.txt files sit next to them
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+import fetch
+from corpus import PLACEHOLDER
+from scrape import scrape_summa
+from standin import StandinServer, synthetic_page
+
+
+def placeholders(text):
+    """Returns the placeholder lines of a text written by scrape_summa"""
+    return [line for line in text.splitlines() if PLACEHOLDER.match(line)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Retries happen at once, so pages that fail on purpose don't slow the tests down"""
+    monkeypatch.setattr(fetch, "backoff_delay", lambda attempt: 0)
+
+
+class Pages:
+    """Page source for StandinServer whose pages can be switched to a status code, or edited, mid-test"""
+
+    def __init__(self, source=synthetic_page):
+        self.source = source
+        self.failing = {}  # (question, article) -> status code answered instead of the page
+
+    def __call__(self, url_part, q_num=None, article_num=None):
+        status = self.failing.get((q_num, article_num))
+        return status if status is not None else self.source(url_part, q_num, article_num)
+
+
+@pytest.fixture
+def pages():
+    return Pages()
+
+
+@pytest.fixture
+def server(pages):
+    with StandinServer(page_source=pages) as server:
+        yield server
+
+
+@pytest.fixture
+def scrape():
+    """Returns a function that scrapes from a server into a file and returns the text written"""
+    def scrape(server, output_file, part="I", start_q=1, end_q=4, **kwargs):
+        kwargs.setdefault("parse_workers", 0)
+        scrape_summa(str(output_file), part, start_q, end_q, base_url=server.base_url, **kwargs)
+        return output_file.read_text(encoding="utf-8")
+    return scrape
@@ -0,0 +1,29 @@
+from cache import ResponseCache
+from fetch import FetchEngine
+
+
+def test_a_cached_page_is_revalidated_and_served_from_the_cache(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    url = server.base_url + "~ST.I.Q2.A1"
+    with FetchEngine(cache=cache) as engine:
+        first = engine.fetch(url)
+    entry = cache.lookup(url)
+    assert first.status_code == 200 and entry["etag"]
+    assert cache.conditional_headers(url) == {"If-None-Match": entry["etag"]}
+
+    with FetchEngine(cache=cache) as engine:
+        second = engine.fetch(url)
+    assert server.not_modified_served == 1
+    assert second.from_cache and second.status_code == 200 and second.text == first.text
+    assert cache.lookup(url)["validated_at"] >= entry["validated_at"]
+
+
+def test_a_scrape_replays_offline_from_the_cache(server, tmp_path, scrape):
+    cache_dir = str(tmp_path / "cache")
+    online = scrape(server, tmp_path / "online.txt", cache_dir=cache_dir)
+    served = server.requests_served
+    revalidated = scrape(server, tmp_path / "revalidated.txt", cache_dir=cache_dir)
+    assert server.not_modified_served == server.requests_served - served  # Every page came back as a 304
+    offline = scrape(server, tmp_path / "offline.txt", cache_dir=cache_dir, offline=True)
+    assert server.requests_served - served == server.not_modified_served
+    assert revalidated == offline == online
@@ -0,0 +1,32 @@
+import os
+
+from conftest import HERE
+from corpus import convert_summa, load_sections, parse_summa
+
+
+def article(text_file, question, number):
+    return [s for s in parse_summa(os.path.join(HERE, text_file)) if s.question == question and s.article == number]
+
+
+def test_the_most_complete_copy_of_a_repeated_article_is_kept():
+    # I Q3 A3 is first carried, cut off after the sed contra, on the page of A1, and only later whole
+    sections = article("Summa1.txt", 3, 3)
+    assert [(s.kind, s.index) for s in sections] == [("objection", 1), ("objection", 2), ("contrary", None),
+                                                     ("answer", None), ("reply", 1), ("reply", 2)]
+    assert sections[3].text.startswith("I answer that, God is the same as His essence or nature.")
+    # III Q1 A4: the truncated copy comes first, the whole one later on another article's page
+    assert "answer" in [s.kind for s in article("Summa4.txt", 1, 4)]
+
+
+def test_load_sections_reads_only_what_is_asked_for(tmp_path):
+    text_file = os.path.join(HERE, "Summa1.txt")
+    corpus_file = str(tmp_path / "Summa1.jsonl")
+    sections = list(parse_summa(text_file))
+    assert convert_summa(text_file, corpus_file) == len(sections)
+
+    assert list(load_sections(corpus_file)) == sections
+    assert list(load_sections(corpus_file, question=3, article=3)) == article("Summa1.txt", 3, 3)
+    assert list(load_sections(corpus_file, question=2)) == [s for s in sections if s.question == 2]
+    answers = list(load_sections(corpus_file, article=1, kinds={"answer"}))
+    assert answers and all(s.article == 1 and s.kind == "answer" for s in answers)
+    assert len(answers) == len({s.question for s in sections if s.article == 1 and s.kind == "answer"})
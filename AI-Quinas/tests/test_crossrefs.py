@@ -0,0 +1,30 @@
+import os
+
+from conftest import HERE
+from crossrefs import CrossReferences, build_graph, internal_references, scripture_references, verse_name
+
+
+def test_internal_references_resolve_against_where_they_appear():
+    text = "as stated above (Q. 5, A. 1; A. 2), and (I-II, Q. 2, A. 3, ad 1), but not (83 Questions, Q. 5)"
+    assert internal_references(text, "I", 3) == [("I", 5, 1), ("I", 5, 2), ("II-I", 2, 3)]
+    assert internal_references("(QQ. 3, 4)", "I", 9) == [("I", 3, 0), ("I", 4, 0)]
+    assert internal_references("(A. 2)", "III", 7) == [("III", 7, 2)]
+    assert internal_references("(Suppl., Q. 1)", "I", 9) == []
+
+
+def test_scripture_references_expand_ranges_and_carry_the_book():
+    verses = scripture_references("(1 Cor 3:1–2), then (Lev 19:2; 11:45) and (Apoc 1:8)")
+    assert [verse_name(verse) for verse in verses] == ["1 Cor 3:1", "1 Cor 3:2", "Lev 19:2", "Lev 11:45", "Rev 1:8"]
+
+
+def test_graph_lookups_go_both_ways(tmp_path):
+    graph_file = str(tmp_path / "summa.xref")
+    references, citations = build_graph([os.path.join(HERE, "Summa1.txt")], graph_file)
+    assert references and citations
+    with CrossReferences(graph_file) as graph:
+        assert graph.quotes("I", 2, 3) == ["Exod 3:14"]  # "I am Who am"
+        assert ("I", 2, 2) in graph.quoting("Rom 1:20") and ("I", 2, 2) in graph.quoting("Rom")
+        citing = graph.cited_by("I", 2, 3)
+        assert ("I", 3, 1) in citing
+        assert all(("I", 2, 3) in graph.cites(*key) for key in citing)
+        assert graph.cites("I", 200, 1) == graph.cited_by("I", 200, 1) == []
@@ -0,0 +1,38 @@
+import pytest
+
+from bench import FixtureSource, fixture_questions, load_fixtures
+from corpus import parse_summa
+from dedup import NearDuplicateFilter
+from standin import StandinServer
+
+
+def article_keys(text_file):
+    return {(s.question, s.article) for s in parse_summa(str(text_file))}
+
+
+def test_every_paragraph_sharing_a_band_is_a_candidate():
+    seen = NearDuplicateFilter(threshold=0.7)
+    original = list(range(64))
+    seen.check_signature(original, "original")
+    # Shares only the first band with the original, so it is new, and files itself under that band too
+    assert seen.check_signature(original[:4] + [1000 + i for i in range(60)], "other") is None
+    # Differs from the original in one bin of every other band: only the first band can find it
+    near = [value + 500 if i >= 4 and i % 4 == 0 else value for i, value in enumerate(original)]
+    assert seen.check_signature(near) == ("original", 49 / 64)
+
+
+def test_question_titles_are_written_twice_unless_deduplicating(tmp_path, scrape):
+    title = "The Nature and Extent of Sacred Doctrine\n\n"
+    with StandinServer(page_source=FixtureSource(load_fixtures(parts=["I"]))) as server:
+        assert scrape(server, tmp_path / "plain.txt", end_q=1).count(title) == 2
+        assert scrape(server, tmp_path / "flag.txt", end_q=1, dedup="flag").count(title) == 1
+
+
+@pytest.mark.parametrize("part", sorted(load_fixtures()))
+def test_dropping_duplicates_keeps_every_article(tmp_path, part, scrape):
+    with StandinServer(page_source=FixtureSource(load_fixtures())) as server:
+        q_num = fixture_questions(part)[0]
+        scrape(server, tmp_path / "plain.txt", part, q_num, q_num)
+        scrape(server, tmp_path / "drop.txt", part, q_num, q_num, dedup="drop")
+    # Repeated paragraphs may go, but never an article that follows a repeated one
+    assert article_keys(tmp_path / "drop.txt") == article_keys(tmp_path / "plain.txt")
@@ -0,0 +1,46 @@
+import pytest
+
+import extract
+from bench import load_fixtures
+from parts import get_default_end_question
+from scrape import render_article, render_question
+from standin import PAGE_PATH
+
+
+def fixture_pages():
+    """Returns (part, question, article, html) for every fixture page, plus a blank article page"""
+    pages = []
+    for part, part_pages in load_fixtures().items():
+        for path, html in part_pages.items():
+            match = PAGE_PATH.search(path)
+            q_num, article_num = match.group(2), match.group(3)
+            pages.append((part, int(q_num) if q_num else None, int(article_num) if article_num else None, html))
+    # An empty 200 body, which lxml refuses to parse and the scraper turns into a placeholder
+    pages.append(("I", 1, 1, ""))
+    return pages
+
+def extracted(monkeypatch, backend, pages):
+    """Returns the Page record and the rendered block of every page, parsed with one backend"""
+    monkeypatch.setattr(extract, "DEFAULT_BACKEND", backend)
+    results = []
+    for part, q_num, article_num, html in pages:
+        page = extract.extract_page(html)
+        assert page.backend == backend
+        record = {name: value for name, value in vars(page).items() if name != "backend"}
+        if article_num:
+            rendered = render_article(html, article_num)
+        elif q_num:
+            rendered = render_question(html, part, q_num, get_default_end_question(part))
+        else:
+            rendered = None
+        results.append((record, rendered))
+    return results
+
+
+@pytest.mark.parametrize("backend", sorted(set(extract.BACKENDS) - {"html.parser"}))
+def test_every_backend_extracts_the_same_pages(monkeypatch, backend):
+    pages = fixture_pages()
+    assert len(pages) > 1
+    expected = extracted(monkeypatch, "html.parser", pages)
+    assert extracted(monkeypatch, backend, pages) == expected
+    assert any(record["nodes"] for record, _ in expected)
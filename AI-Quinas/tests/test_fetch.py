@@ -0,0 +1,24 @@
+import os
+
+from cache import ResponseCache
+from fetch import FetchEngine
+
+
+def test_refetching_a_lost_cache_body_stays_within_the_rate_budget(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    url = server.base_url + "~ST.I.Q1.A1"
+    with FetchEngine(cache=cache) as engine:
+        assert engine.fetch(url).status_code == 200
+    # The entry still has its ETag, so the next request is answered with a 304
+    os.remove(cache._object_path(cache.lookup(url)["object"]))
+
+    with FetchEngine(rate=1000, cache=cache) as engine:
+        bucket, limit = engine._bucket(url), engine._limit(url)
+        acquired = []
+        for gate in (bucket, limit):
+            gate.acquire = lambda acquire=gate.acquire, gate=gate: acquired.append(gate) or acquire()
+        response = engine.fetch(url)
+    assert response.status_code == 200 and "Article 1" in response.text
+    assert server.not_modified_served == 1
+    assert acquired.count(bucket) == acquired.count(limit) == 2
+    assert limit.in_flight == 0
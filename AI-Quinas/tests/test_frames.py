@@ -0,0 +1,50 @@
+from corpus import split_units
+from frames import FrameReader, FrameWriter, export_text
+from offsets import SummaReader
+from scrape import repair_summa, scrape_summa
+
+
+def test_a_scrape_writes_a_frame_per_unit(server, tmp_path, scrape):
+    text = scrape(server, tmp_path / "Summa1.txt")
+    units = split_units(text)
+    with FrameReader(str(tmp_path / "Summa1.frames")) as frames:
+        assert frames.keys() == [(q, a) for q, a, _ in units]
+        assert frames.text() == text
+        assert frames.get(2, 3) == [unit for q, a, unit in units if (q, a) == (2, 3)][0]
+        with SummaReader(str(tmp_path / "Summa1.txt")) as reader:
+            for question, article in ((1, 0), (2, 3), (4, 1)):
+                assert frames.read_range(*reader.range(question, article)) == reader.raw(question, article)
+
+    # Units added before the dictionary is made are held back and written once it is
+    with FrameWriter(str(tmp_path / "streamed.frames"), "I", warmup=256) as writer:
+        for q, a, unit in units:
+            writer.add(q, a, unit)
+        assert writer.dictionary is not None and not writer.held
+    with FrameReader(str(tmp_path / "streamed.frames")) as frames:
+        assert frames.text() == text
+        assert frames.read_range(100, 100) == b""
+
+    with FrameWriter(str(tmp_path / "empty.frames"), "I"):
+        pass
+    with FrameReader(str(tmp_path / "empty.frames")) as frames:
+        assert len(frames) == 0 and frames.read_range(0, 10) == b""
+
+
+def test_only_the_frames_can_be_kept(server, pages, tmp_path, scrape):
+    full = scrape(server, tmp_path / "full.txt")
+    pages.failing = {(2, 2): 500}
+    output_file = tmp_path / "Summa1.txt"
+    scrape_summa(str(output_file), "I", 1, 4, base_url=server.base_url, parse_workers=0, keep_text=False)
+    assert not output_file.exists()
+
+    with SummaReader(str(tmp_path / "full.txt")) as expected, SummaReader(str(output_file)) as reader:
+        assert reader.part == "I"
+        assert reader.get(1, 1, "answer") == expected.get(1, 1, "answer")
+        assert reader.get(3) == expected.get(3)
+
+    # A repair writes the text back out from the frames, and leaves only the frames again
+    pages.failing = {}
+    assert repair_summa(str(output_file), base_url=server.base_url) == 1
+    assert not output_file.exists()
+    export_text(str(tmp_path / "Summa1.frames"), str(tmp_path / "exported.txt"))
+    assert (tmp_path / "exported.txt").read_text(encoding="utf-8") == full
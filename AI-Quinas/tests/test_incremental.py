@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from corpus import convert_summa, question_regions
+from crossrefs import CrossReferences, build_graph, update_graph
+from frames import FrameReader, write_frames
+from journal import ScrapeJournal
+from offsets import build_offsets
+from retrieval import BM25Index, build_index, update_index
+from scrape import scrape_summa, write_derived_files
+from similarity import TfidfMatrix, build_matrix, update_matrix
+
+QUERIES = ["Whether God exists?", "objection answer reply", "Question article", "contrary", "first cause"]
+
+# The stand-in replies repeat from question to question, so every copy after the first is a near-duplicate
+FIRST_REPLY = "Reply Obj. 1: Reason 1 is answered by what was said above about point 1."
+NEW_REPLY = "Reply Obj. 1: The first reason fails, since God is the first cause of all things (Q. 2, A. 3; Rom 1:20)."
+
+
+@pytest.fixture
+def text_file(server, tmp_path):
+    output_file = tmp_path / "Summa1.txt"
+    scrape_summa(str(output_file), "I", 1, 6, base_url=server.base_url, parse_workers=0)
+    return output_file
+
+def search_all(index_file):
+    """Returns the number of documents and every hit of each query, with ties in a fixed order"""
+    with BM25Index(str(index_file)) as index:
+        # An update appends the changed articles' documents, so equal scores can come back in another order
+        return index.num_docs, [sorted((-round(hit.score, 9), hit.part, hit.question, hit.article, hit.kind, hit.index)
+                                       for hit in index.search(query, index.num_docs)) for query in QUERIES]
+
+def build_all(text_file, directory):
+    """Builds every file derived from a text file from scratch into a directory"""
+    directory.mkdir()
+    paths = {name: str(directory / name) for name in ("Summa1.jsonl", "Summa1.offsets", "Summa1.frames",
+                                                      "summa.bm25", "summa.tfidf", "summa.xref")}
+    convert_summa(str(text_file), paths["Summa1.jsonl"])
+    build_offsets(str(text_file), paths["Summa1.offsets"])
+    write_frames(str(text_file), paths["Summa1.frames"])
+    build_index([str(text_file)], paths["summa.bm25"])
+    build_matrix([str(text_file)], paths["summa.tfidf"])
+    build_graph([str(text_file)], paths["summa.xref"])
+    return paths
+
+
+def test_journal_hashes_give_the_same_fingerprints_as_the_text(text_file):
+    journaled = question_regions(str(text_file))
+    # A journal older than the text no longer describes it, so the text is split and hashed instead
+    os.utime(ScrapeJournal.path_for(str(text_file)), (0, 0))
+    assert question_regions(str(text_file)) == journaled
+    assert [region.question for region in journaled] == list(range(7))
+
+
+def test_update_without_changes_does_nothing(text_file, tmp_path):
+    paths = build_all(text_file, tmp_path / "built")
+    assert update_index(paths["summa.bm25"]) == 0
+    assert update_matrix(paths["summa.tfidf"]) == 0
+    assert update_graph(paths["summa.xref"]) == 0
+
+
+def test_incremental_updates_match_a_full_rebuild(text_file, tmp_path):
+    updated = build_all(text_file, tmp_path / "updated")
+
+    text = text_file.read_text(encoding="utf-8")
+    assert text.count(FIRST_REPLY) == 6
+    text_file.write_text(text.replace(FIRST_REPLY, NEW_REPLY, 1), encoding="utf-8")
+    # Question 1 changed; article 1 of question 2 has its reply kept now that question 1 no longer has it first
+    write_derived_files(str(text_file), str(tmp_path / "Summa1.jsonl"), "I")
+    assert update_index(updated["summa.bm25"]) == 2
+    assert update_matrix(updated["summa.tfidf"]) == 2
+    assert update_graph(updated["summa.xref"]) == 1
+
+    rebuilt = build_all(text_file, tmp_path / "rebuilt")
+    assert (tmp_path / "Summa1.jsonl").read_bytes() == open(rebuilt["Summa1.jsonl"], "rb").read()
+    assert (tmp_path / "Summa1.offsets").read_bytes() == open(rebuilt["Summa1.offsets"], "rb").read()
+    with FrameReader(str(tmp_path / "Summa1.frames")) as frames:
+        assert frames.text() == text_file.read_text(encoding="utf-8")
+    assert search_all(updated["summa.bm25"]) == search_all(rebuilt["summa.bm25"])
+    for name in ("summa.tfidf", "summa.xref"):
+        assert open(updated[name], "rb").read() == open(rebuilt[name], "rb").read()
+
+    with TfidfMatrix(updated["summa.tfidf"]) as matrix:
+        assert [(hit.question, hit.article, hit.kind) for hit in matrix.search(NEW_REPLY, k=1)] == [(1, 1, "reply")]
+    with CrossReferences(updated["summa.xref"]) as graph:
+        assert graph.cites("I", 1, 1) == [("I", 2, 3)] and graph.quoting("Rom 1:20") == [("I", 1, 1)]
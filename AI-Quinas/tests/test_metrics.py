@@ -0,0 +1,31 @@
+import json
+
+from metrics import ScrapeMetrics
+
+
+def test_a_scrape_exports_its_metrics_as_json_and_prometheus(server, pages, tmp_path, scrape):
+    pages.failing[(2, 1)] = 500
+    metrics = ScrapeMetrics()
+    scrape(server, tmp_path / "Summa1.txt", end_q=3, metrics=metrics)
+    metrics.write_json(str(tmp_path / "metrics.json"))
+    metrics.write_prometheus(str(tmp_path / "metrics.prom"))
+
+    with open(tmp_path / "metrics.json", encoding="utf-8") as f:
+        summary = json.load(f)
+    requests = summary["requests"]
+    assert requests["count"] == server.requests_served == sum(requests["responses"].values())
+    assert requests["retries"] == {"500": requests["responses"]["500"] - 1}  # The last attempt isn't retried
+    assert set(summary["phases"]) >= {"prologue", "questions", "probe", "articles", "derived"}
+    assert summary["articles"] == 9 and sorted(summary["questions"]) == ["1", "2", "3"]
+    assert summary["parse"]["count"] == requests["responses"]["200"]
+
+    samples = {}
+    for line in (tmp_path / "metrics.prom").read_text(encoding="utf-8").splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    assert samples["summa_scrape_request_duration_seconds_count"] == requests["count"]
+    assert samples['summa_scrape_request_duration_seconds_bucket{le="+Inf"}'] == requests["count"]
+    assert samples['summa_scrape_responses_total{status="500"}'] == requests["responses"]["500"]
+    assert samples['summa_scrape_retries_total{status="500"}'] == requests["retries"]["500"]
+    assert samples["summa_scrape_downloaded_bytes_total"] == requests["bytes"] > 0
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+from conftest import HERE
+from corpus import parse_summa
+from offsets import SummaLibrary, SummaReader, is_stale, offsets_path_for
+
+
+def test_passages_are_read_by_their_byte_offsets(tmp_path):
+    text_file = str(tmp_path / "Summa1.txt")
+    shutil.copy(os.path.join(HERE, "Summa1.txt"), text_file)
+    sections = {(s.question, s.article, s.kind, s.index): s for s in parse_summa(text_file)}
+
+    with SummaReader(text_file) as reader:
+        assert not is_stale(text_file)
+        answer = reader.get(3, 3, "answer")
+        assert answer == sections[(3, 3, "answer", None)].text
+        assert answer.startswith("I answer that, God is the same as His essence or nature.")
+        assert reader.get(1, 2, "reply", 1) == sections[(1, 2, "reply", 1)].text
+        assert reader.sections(3, 3)[:3] == [("objection", 1), ("objection", 2), ("contrary", None)]
+        article = reader.get(3, 3)
+        assert article.startswith("Whether God is the same as his essence or nature?") and answer in article
+        assert reader.get(3).startswith("Question 3\nThe Simplicity of God")
+        assert reader.get(3, 99) is None
+
+    with SummaLibrary([text_file]) as library:
+        assert library.get("I", 3, 3, "answer") == answer
+
+
+def test_a_stale_sidecar_is_rebuilt(tmp_path):
+    text_file = tmp_path / "Summa1.txt"
+    text = open(os.path.join(HERE, "Summa1.txt"), encoding="utf-8").read()
+    text_file.write_text(text, encoding="utf-8")
+    with SummaReader(str(text_file)):
+        pass
+    text_file.write_text(text.replace("I answer that, God is the same", "I answer that, Truly, God is the same"),
+                         encoding="utf-8")
+    assert is_stale(str(text_file)) and os.path.exists(offsets_path_for(str(text_file)))
+    with SummaReader(str(text_file)) as reader:
+        assert reader.get(3, 3, "answer").startswith("I answer that, Truly, God is the same")
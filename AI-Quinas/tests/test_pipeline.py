@@ -0,0 +1,13 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline import ordered_pipeline
+from scrape import article_block
+
+
+def test_parser_processes_print_through_the_consumer_in_order(capsys):
+    missing = [((404, None, None), n, True) for n in range(1, 41)]
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        results = list(ordered_pipeline(iter(missing), article_block, pool, queue_size=8))
+    assert results == [(None, False)] * len(missing)
+    assert capsys.readouterr().out.splitlines() == [
+        f"    Article {n} does not exist (status code 404)" for n in range(1, 41)]
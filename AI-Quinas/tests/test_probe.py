@@ -0,0 +1,71 @@
+import json
+import os
+import re
+
+import scrape as scrape_module
+from cache import ResponseCache
+from conftest import placeholders
+from standin import StandinServer, synthetic_page
+
+
+def unlisted_articles(counts):
+    """Returns a page source whose question pages don't link their articles, so the counts can only be probed"""
+    def source(url_part, q_num=None, article_num=None):
+        if q_num is None:
+            return synthetic_page(url_part)
+        if article_num is None:
+            html = synthetic_page(url_part, q_num, articles_per_question=counts[q_num])
+            return re.sub(r'<a href=[^>]*>Article \d+</a>\n', '', html)
+        return synthetic_page(url_part, q_num, article_num, counts[q_num]) if article_num <= counts[q_num] else None
+    return source
+
+def article_counts(text):
+    return [len(re.findall(r"^Article \d+$", block, re.M)) for block in re.split(r"^Question \d+$", text, flags=re.M)[1:]]
+
+
+def test_a_missing_article_is_not_retried_or_written(server, pages, tmp_path, scrape):
+    pages.failing = {(2, 3): 404}
+    text = scrape(server, tmp_path / "missing.txt")
+    assert not placeholders(text)
+    assert "Question 2" in text and not re.search(r"^Article 3$", text.split("Question 3")[0].split("Question 2")[1], re.M)
+
+
+def test_unlisted_article_counts_are_probed_and_replay_offline(tmp_path, scrape):
+    counts = {1: 3, 2: 16, 3: 2}
+    cache_dir = str(tmp_path / "cache")
+    manifest = tmp_path / "counts.json"
+    with StandinServer(page_source=unlisted_articles(counts)) as server:
+        online = scrape(server, tmp_path / "online.txt", end_q=3, workers=4, cache_dir=cache_dir)
+        # Past each question's last article at most the other request of the probe window goes out
+        assert server.requests_served <= 1 + 3 + sum(counts.values()) + 2 * len(counts)
+        offline = scrape(server, tmp_path / "offline.txt", end_q=3, workers=4, cache_dir=cache_dir, offline=True,
+                         article_counts=str(manifest))
+    assert not placeholders(online)
+    assert article_counts(online) == [3, 16, 2]
+    assert offline == online
+    assert not manifest.exists()  # Cached 404s replayed offline confirm nothing about the site
+
+
+def test_only_counts_the_site_confirmed_are_learned(tmp_path, scrape):
+    cache_dir = str(tmp_path / "cache")
+    manifest = tmp_path / "counts.json"
+    with StandinServer(page_source=unlisted_articles({1: 5})) as server:
+        scrape(server, tmp_path / "online.txt", end_q=1, cache_dir=cache_dir, article_counts=str(manifest))
+        assert json.loads(manifest.read_text(encoding="utf-8")) == {"I": {"1": 5}}
+
+        # An offline replay that misses A3 in the cache stops there, but must not record 2 articles
+        os.remove(ResponseCache(cache_dir)._entry_path(server.base_url + "~ST.I.Q1.A3"))
+        offline_manifest = tmp_path / "offline_counts.json"
+        offline = scrape(server, tmp_path / "offline.txt", end_q=1, cache_dir=cache_dir, offline=True,
+                         article_counts=str(offline_manifest))
+        assert article_counts(offline) == [2]
+        assert not offline_manifest.exists()
+
+
+def test_probing_stopped_at_the_limit_is_not_learned(tmp_path, scrape, monkeypatch):
+    monkeypatch.setattr(scrape_module, "PROBE_LIMIT", 3)
+    manifest = tmp_path / "counts.json"
+    with StandinServer(page_source=unlisted_articles({1: 5})) as server:
+        text = scrape(server, tmp_path / "limited.txt", end_q=1, article_counts=str(manifest))
+    assert article_counts(text) == [3]
+    assert not manifest.exists()
@@ -0,0 +1,36 @@
+import json
+
+from conftest import placeholders
+from scrape import repair_summa
+
+
+def test_resume_after_a_crash_finishes_the_same_file(server, tmp_path, scrape):
+    full = scrape(server, tmp_path / "full.txt")
+    output_file = tmp_path / "resumed.txt"
+    scrape(server, output_file)
+
+    # Crash after the first few units: the journal stops there and the output has a torn write
+    journal_file = tmp_path / "resumed.txt.journal"
+    lines = journal_file.read_text(encoding="utf-8").splitlines()
+    journal_file.write_text("\n".join(lines[:6]) + "\n", encoding="utf-8")
+    with open(output_file, "a", encoding="utf-8") as f:
+        f.write("partial garbage")
+
+    served = server.requests_served
+    assert scrape(server, output_file) == full
+    assert server.requests_served - served < len(lines) - 2  # Only what was lost is fetched again
+    assert json.loads(journal_file.read_text(encoding="utf-8").splitlines()[-1]) == {"done": True}
+
+
+def test_repair_fills_in_every_placeholder(server, pages, tmp_path, scrape):
+    full = scrape(server, tmp_path / "full.txt")
+    pages.failing = {(2, 2): 500, (3, None): 500}
+    output_file = tmp_path / "repaired.txt"
+    broken = scrape(server, output_file)
+    assert len(placeholders(broken)) == 2
+
+    pages.failing = {}
+    assert repair_summa(str(output_file), base_url=server.base_url) == 2
+    assert output_file.read_text(encoding="utf-8") == full
+    units = [json.loads(line) for line in (tmp_path / "repaired.txt.journal").read_text(encoding="utf-8").splitlines()]
+    assert all(unit.get("ok", True) for unit in units[1:])
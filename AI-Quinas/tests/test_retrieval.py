@@ -0,0 +1,18 @@
+import os
+
+from conftest import HERE
+from retrieval import BM25Index, build_index
+
+
+def test_search_finds_the_article_a_question_names(tmp_path):
+    index_file = str(tmp_path / "summa.bm25")
+    count = build_index([os.path.join(HERE, "Summa1.txt")], index_file)
+    with BM25Index(index_file) as index:
+        assert index.num_docs == count
+        hits = index.search("Whether God is the same as his essence or nature?", k=5)
+        assert (hits[0].part, hits[0].question, hits[0].article) == ("I", 3, 3)
+        assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+        assert index.search("essence", k=5, parts=["III"]) == []
+        # More queries than one score matrix holds, each scored as it would be alone
+        queries = [f"Whether God is {word}?" for word in ("simple", "good", "infinite", "eternal", "one")] * 4
+        assert index.search_batch(queries, k=3) == [index.search(query, k=3) for query in queries]
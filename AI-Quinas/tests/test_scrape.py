@@ -0,0 +1,23 @@
+import pytest
+
+from bench import FixtureSource, fixture_questions, load_fixtures
+from conftest import placeholders
+from standin import StandinServer
+
+
+@pytest.mark.parametrize("workers, parse_workers", [(4, 0), (8, 2)])
+def test_output_is_the_same_for_any_worker_count(server, tmp_path, workers, parse_workers, scrape):
+    serial = scrape(server, tmp_path / "serial.txt")
+    parallel = scrape(server, tmp_path / "parallel.txt", workers=workers, parse_workers=parse_workers)
+    assert parallel == serial
+    assert not placeholders(serial)
+
+
+@pytest.mark.parametrize("part", sorted(load_fixtures()))
+def test_fixture_pages_scrape_the_same_for_any_worker_count(tmp_path, part, scrape):
+    with StandinServer(page_source=FixtureSource(load_fixtures())) as server:
+        for q_num in fixture_questions(part):
+            serial = scrape(server, tmp_path / f"serial{q_num}.txt", part, q_num, q_num)
+            parallel = scrape(server, tmp_path / f"parallel{q_num}.txt", part, q_num, q_num, workers=8)
+            assert parallel == serial
+            assert not placeholders(serial)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from offsets import SummaReader
+from retrieval import BM25Index, build_index
+from service import QueryService, ServiceClient, serve
+
+QUERIES = ["Whether God exists?", "objection answer reply", "first cause", "contrary"]
+
+
+async def serving(index_file, session):
+    """Runs session(service, client) against a service listening on a free port"""
+    with QueryService(index_file, batch_window=0.05) as service:
+        server = await serve(service, port=0)
+        async with server:
+            async with await ServiceClient.connect(port=server.sockets[0].getsockname()[1]) as client:
+                return await session(service, client)
+
+
+def test_concurrent_queries_are_batched_and_answers_cached(server, tmp_path, scrape):
+    text_file = tmp_path / "Summa1.txt"
+    scrape(server, text_file)
+    index_file = str(tmp_path / "summa.bm25")
+    build_index([str(text_file)], index_file)
+
+    async def session(service, client):
+        found = await asyncio.gather(*(client.search(query, 5) for query in QUERIES * 3))
+        first = await client.stats()
+        again = await client.search("whether GOD exists", 5, text=True)
+        return found, first, again, await client.stats()
+
+    found, first, again, second = asyncio.run(serving(index_file, session))
+    with BM25Index(index_file) as index:
+        assert found == [[hit._asdict() for hit in index.search(query, 5)] for query in QUERIES * 3]
+    # Twelve queries, four of them distinct, scored together; the repeats joined the ones in flight
+    assert first["queries"] == 12 and first["coalesced"] == 8
+    assert first["batches"] == 1 and first["mean_batch"] == 4
+    # The same question worded differently is answered from the cache, without another batch
+    assert second["answers"]["hits"] == 1 and second["batches"] == 1
+    assert [dict(hit, text=None) for hit in again] == [dict(hit, text=None) for hit in found[0]]
+    with SummaReader(str(text_file)) as reader:
+        assert [hit["text"] for hit in again] == [reader.get(hit["question"], hit["article"], hit["kind"], hit["index"])
+                                                  for hit in again]
+
+
+def test_a_rebuilt_index_is_reloaded(server, tmp_path, scrape):
+    text_file = tmp_path / "Summa1.txt"
+    text = scrape(server, text_file)
+    index_file = str(tmp_path / "summa.bm25")
+    build_index([str(text_file)], index_file)
+
+    async def session(service, client):
+        before = await client.search("photosynthesis", 5)
+        text_file.write_text(text.replace("point 1.", "point 1, as photosynthesis shows.", 1), encoding="utf-8")
+        build_index([str(text_file)], index_file)
+        after = await client.search("photosynthesis", 5, text=True)
+        return before, after, await client.stats()
+
+    before, after, stats = asyncio.run(serving(index_file, session))
+    assert before == []
+    assert len(after) == 1 and "as photosynthesis shows" in after[0]["text"]
+    assert stats["reloads"] == 1 and stats["batches"] == 2
+
+
+def test_passage_requests_are_checked_and_cached_under_one_key(server, tmp_path, scrape):
+    text_file = tmp_path / "Summa1.txt"
+    scrape(server, text_file)
+    index_file = str(tmp_path / "summa.bm25")
+    build_index([str(text_file)], index_file)
+
+    async def session(service, client):
+        texts = [(await client.request(op="passage", part="I", question="2", article="1", kind="reply",
+                                       index=index))["text"] for index in (1, "1")]
+        with pytest.raises(RuntimeError, match="ValueError: Unknown section kind: rebuttal"):
+            await client.passage("I", 2, 1, "rebuttal", 1)
+        return texts, await client.stats()
+
+    texts, stats = asyncio.run(serving(index_file, session))
+    with SummaReader(str(text_file)) as reader:
+        assert texts == [reader.get(2, 1, "reply", 1)] * 2 and texts[0]
+    assert stats["passages"] == {"entries": 1, "hits": 1, "misses": 1}
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from conftest import HERE
+from similarity import TfidfMatrix, build_matrix
+from standin import synthetic_page
+
+
+@pytest.fixture(scope="module")
+def matrix(tmp_path_factory):
+    matrix_file = str(tmp_path_factory.mktemp("matrix") / "summa.tfidf")
+    build_matrix([os.path.join(HERE, "Summa1.txt")], matrix_file)
+    with TfidfMatrix(matrix_file) as matrix:
+        yield matrix
+
+
+def test_related_articles_are_other_articles_best_first(matrix):
+    related = matrix.related_articles("I", 3, 3, k=5)
+    assert len(related) == 5
+    assert ("I", 3, 4) in [key[1:] for key in related]  # Whether essence and existence are the same in God?
+    assert all(key[1:] != ("I", 3, 3) and key[3] > 0 for key in related)
+    scores = [key[0] for key in related]
+    assert scores == sorted(scores, reverse=True) and 0 < scores[-1] <= scores[0] <= 1
+    assert matrix.related_articles_batch([("I", 2, 3), ("I", 3, 3)], k=5)[1] == related
+
+
+def test_batched_search_matches_single_queries(matrix):
+    queries = ["Whether God is the same as his essence or nature?", "Whether angels have bodies?",
+               "the reply to the third objection", "sacred doctrine is a science"]
+    batch = matrix.search_batch(queries, k=5)
+    assert batch == [matrix.search(query, k=5) for query in queries]
+    best = batch[0][0]
+    assert (best.part, best.question, best.article) == ("I", 3, 3)
+    assert all(hit.part == "I" for hit in matrix.search(queries[1], k=5, parts=["I"]))
+    assert matrix.search(queries[1], k=5, parts=["III"]) == []
+
+
+def test_an_article_without_rows_has_no_related_articles(server, pages, tmp_path, scrape):
+    # Question 2, article 3 is served as a copy of question 1, article 3, so all of its sections are near-duplicates
+    pages.source = lambda url_part, q_num=None, article_num=None: synthetic_page(
+        url_part, 1 if (q_num, article_num) == (2, 3) else q_num, article_num)
+    scrape(server, tmp_path / "Summa1.txt")
+    matrix_file = str(tmp_path / "summa.tfidf")
+    build_matrix([str(tmp_path / "Summa1.txt")], matrix_file)
+    with TfidfMatrix(matrix_file) as matrix:
+        assert ("I", 2, 3) not in matrix.article_ids and ("I", 1, 3) in matrix.article_ids
+        assert matrix.related_articles("I", 2, 3) == []
+        batch = matrix.related_articles_batch([("I", 2, 3), ("I", 1, 3), ("I", 99, 1)], k=3)
+        assert batch == [[], matrix.related_articles("I", 1, 3, k=3), []] and batch[1]